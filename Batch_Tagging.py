@@ -0,0 +1,251 @@
+'''
+Batched preprocessing of transcripts with spaCy's nlp.pipe
+    => Gives the same lemma_POS token lists as lats.Normalize(speech, myparameters).toks,
+       but streams all the transcripts through nlp.pipe in batches and switches off the pipeline components
+       none of the measures use (the dependency parser and the named entity recognizer).
+    => Long transcripts can be split into chunks of at most CHUNK_CHARS characters (see chunk_text), tagged one after the other
+       (or in parallel, by the directory runner), so that spaCy never holds the docs of a whole hour-long transcript at once.
+       The chunks end at paragraph boundaries, and lats tags each paragraph on its own anyway, so the tokens stay the same,
+       as long as every paragraph fits in a chunk: a longer paragraph is split at sentence ends (see split_paragraph), and spaCy
+       then tags each piece without the context of the other, so a few tags (and lemmas) near the cuts may differ.
+'''
+
+import re
+from Transcript_Reader import iter_chunks
+
+
+# Pipeline components of en_core_web_lg that do not affect the lemmas or the Penn POS tags
+UNUSED_COMPONENTS = ["parser", "ner"]
+
+# Maximum number of characters of a chunk of a long transcript (spaCy refuses texts over nlp.max_length, 1,000,000 by default)
+CHUNK_CHARS = 100000
+
+# Where a paragraph longer than a chunk can be split: the spaces after a sentence-ending punctuation
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Used only for its normalize() method, which turns pylats token objects into "lemma_TAG" strings
+# (created on the first use, like the import of pylats, so that importing this module does not load spaCy)
+_normalizer = None
+
+
+def _load_lats():
+    global _normalizer
+    from pylats import lats
+    if _normalizer is None:
+        _normalizer = lats.Normalize()
+    return lats
+
+
+
+def load_model(model, exclude=UNUSED_COMPONENTS):
+    '''
+        Input:
+            * model: the name of the spaCy model, e.g., "en_core_web_lg"
+            * exclude: the pipeline components not to load
+        Output:
+            nlp: the model without the components none of the measures use (their weights are never read into memory).
+                 The word vectors are kept: the tagger of the large model is computed from them.
+    '''
+    import spacy
+    return spacy.load(model, exclude=exclude)
+
+
+def normalize_docs(docs, myparameters):
+    '''
+        Input:
+            * docs: the spaCy docs of the paragraphs of one transcript
+            * myparameters: the lats parameters used for preprocessing
+        Output:
+            tokens: the tokenized and lemmatized tokens with Penn POS tags, e.g., ["about_IN", "the_DT", "topic_NN", ...]
+    '''
+    lats = _load_lats()
+    paras = []
+    for doc in docs:
+        # Without the parser there are no sentence boundaries, so the whole paragraph is one sentence (the tokens are flattened anyway)
+        sents = doc.sents if doc.has_annotation("SENT_START") else [doc]
+        paras.append([[lats.TokObject(token, counter, myparameters) for counter, token in enumerate(sent)] for sent in sents])
+    normalized = _normalizer.normalize(paras, myparameters)[0]
+    return [tok for para in normalized for sent in para for tok in sent]
+
+
+def tag_texts(texts, myparameters, batch_size=64, disable=UNUSED_COMPONENTS, cache=None):
+    '''
+        Input:
+            * texts: an iterable of transcripts (strings), read lazily
+            * myparameters: the lats parameters used for preprocessing (myparameters.nlp is the loaded spaCy model)
+            * batch_size: number of paragraphs sent to spaCy in each batch
+            * disable: names of the pipeline components to switch off while tagging
+            * cache: a TokenCache (see Token_Cache.py); transcripts found in it are not tagged again, and new ones are added to it
+        Output:
+            a generator of token lists (one per transcript, in the input order), e.g., ["about_IN", "the_DT", "topic_NN", ...]
+    '''
+    lats = _load_lats()
+    # Fall back to lats itself when spaCy is not used, so that the output stays the same
+    if not myparameters.sp or myparameters.nlp is None:
+        for text in texts:
+            key = cache.key(text, myparameters) if cache is not None else None
+            tokens = cache.get(key) if cache is not None else None
+            if tokens is None:
+                tokens = lats.Normalize(text, myparameters).toks
+                if cache is not None:
+                    cache.put(key, tokens)
+            yield tokens
+        return
+
+    nlp = myparameters.nlp
+    disable = [name for name in disable if name in nlp.pipe_names]
+    # Number of paragraphs of each transcript, filled in while nlp.pipe reads the input
+    nb_paras = []
+    # Tokens of the transcripts found in the cache, and cache keys of the ones to tag, by transcript number
+    cached = dict()
+    keys = dict()
+
+    def paragraphs():
+        for text_no, text in enumerate(texts):
+            if cache is not None:
+                key = cache.key(text, myparameters)
+                tokens = cache.get(key)
+                if tokens is not None:
+                    cached[text_no] = tokens
+                    nb_paras.append(0)
+                    continue
+                keys[text_no] = key
+            paras = _normalizer.text2para(text, myparameters)
+            nb_paras.append(len(paras))
+            for para in paras:
+                yield para, text_no
+
+    def finish(text_no, docs):
+        if text_no in cached:
+            return cached.pop(text_no)
+        tokens = normalize_docs(docs, myparameters)
+        if text_no in keys:
+            cache.put(keys.pop(text_no), tokens)
+        return tokens
+
+    # The docs come back in the input order, so a transcript is complete once a doc of a later transcript shows up
+    current_no = 0
+    current_docs = []
+    for doc, text_no in nlp.pipe(paragraphs(), as_tuples=True, batch_size=batch_size, disable=disable):
+        while current_no < text_no:
+            yield finish(current_no, current_docs)
+            current_docs = []
+            current_no += 1
+        current_docs.append(doc)
+    while current_no < len(nb_paras):
+        yield finish(current_no, current_docs)
+        current_docs = []
+        current_no += 1
+
+
+def split_paragraph(para, max_chars=CHUNK_CHARS):
+    '''
+        Output:
+            pieces: the paragraph split at sentence ends into pieces of at most max_chars characters
+                    (a sentence longer than that is split at the last space before the limit, or at the limit;
+                    the pieces are tagged separately, so the tags near the cuts may differ from the ones of the whole paragraph)
+    '''
+    pieces = []
+    current = ""
+    for sentence in SENTENCE_END.split(para):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip(" ")
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = ""
+        current = current + " " + sentence if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text, max_chars=CHUNK_CHARS, splitter="\n"):
+    '''
+        Input:
+            * text: one transcript
+            * max_chars: maximum number of characters of a chunk
+            * splitter: the paragraph separator of the lats parameters (myparameters.splitter)
+        Output:
+            chunks: the transcript itself if it is short enough, otherwise its paragraphs grouped into chunks of at most
+                    max_chars characters (a paragraph longer than that is split at sentence ends, see split_paragraph)
+    '''
+    if not max_chars or len(text) <= max_chars:
+        return [text]
+    pieces = []
+    for para in text.split(splitter):
+        if len(para) == 0:
+            continue
+        if len(para) <= max_chars:
+            pieces.append(para)
+        else:
+            pieces.extend(split_paragraph(para, max_chars))
+    chunks = []
+    current = []
+    size = 0
+    for piece in pieces:
+        if current and size + len(splitter) + len(piece) > max_chars:
+            chunks.append(splitter.join(current))
+            current = []
+            size = 0
+        size += len(piece) + (len(splitter) if current else 0)
+        current.append(piece)
+    if current:
+        chunks.append(splitter.join(current))
+    return chunks
+
+
+def tag_text_chunks(texts, myparameters, max_chars=CHUNK_CHARS, batch_size=64, cache=None):
+    '''
+        Input:
+            * texts, myparameters, batch_size, cache: as for tag_texts()
+            * max_chars: maximum number of characters of a chunk (see chunk_text)
+        Output:
+            a generator of lists of token lists (the tokens of each chunk of a transcript, one list per transcript, in the input order)
+    '''
+    splitter = getattr(myparameters, "splitter", "\n")
+    # Number of chunks of each transcript, filled in while tag_texts reads the input
+    nb_chunks = []
+
+    def chunks():
+        for text in texts:
+            text_chunks = chunk_text(text, max_chars, splitter)
+            nb_chunks.append(len(text_chunks))
+            for chunk in text_chunks:
+                yield chunk
+
+    tagged = tag_texts(chunks(), myparameters, batch_size=batch_size, cache=cache)
+    text_no = 0
+    # (the number of chunks of a transcript is known once the tokens of its first chunk come out)
+    for tokens in tagged:
+        token_chunks = [tokens]
+        for i in range(nb_chunks[text_no] - 1):
+            token_chunks.append(next(tagged))
+        yield token_chunks
+        text_no += 1
+
+
+def tag_records(records, myparameters, batch_size=64, chunk_size=1000, cache=None, max_chars=None):
+    '''
+        Input:
+            * records: an iterable of (id, speech) records, e.g., from Transcript_Reader.read_transcripts(), read lazily
+            * myparameters, batch_size, cache: as for tag_texts()
+            * chunk_size: number of records held in memory at a time
+            * max_chars: if given, the speeches longer than that are tagged in chunks (see chunk_text), and their tokens joined
+        Output:
+            a generator of (id, tokens) pairs, in the input order
+    '''
+    for chunk in iter_chunks(records, chunk_size):
+        ids = [id for id, speech in chunk]
+        speeches = [speech for id, speech in chunk]
+        if max_chars:
+            tagged = ([token for tokens in token_chunks for token in tokens] for token_chunks in tag_text_chunks(speeches, myparameters, max_chars, batch_size, cache))
+        else:
+            tagged = tag_texts(speeches, myparameters, batch_size=batch_size, cache=cache)
+        for id, tokens in zip(ids, tagged):
+            yield id, tokens
@@ -0,0 +1,77 @@
+'''
+Import-time benchmark of the modules of the pipeline
+    => Imports each module in a fresh Python process, and reports how long the import took and which heavy
+       dependencies (spaCy, pylats, pandas, taaled) it pulled in.
+    => The measure modules must stay light (no heavy dependency at import): the script exits with status 1 if one of them
+       imports one, so that it can be run before each commit. Each run is appended as one JSON line to benchmark_results.jsonl.
+'''
+# Example on how to run the benchmark
+#   python Benchmark_Imports.py
+#   python Benchmark_Imports.py --repeat=10
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from Benchmark_Pipeline import git_commit
+
+
+# Modules that must import without any heavy dependency
+LIGHT_MODULES = ["Lexical_Measures", "Switch_Tagging", "Lexical_FreqBand", "Lexical_PropSophisTypes", "Lexical_Density", "Lexical_Diversity", "Diversity_Engine", "Metrics_Kernel",
+                 "Frequency_Index", "Frequency_Cache", "Frequency_Lists", "Measure_Sweep", "Verify_Measures", "Batch_Tagging", "Token_Cache", "Token_Vocabulary", "Token_Filter", "Watch_Folder", "Transcript_Reader", "Results_Writer", "Group_Statistics", "Lexical_Complexity_directory", "Scoring_Service"]
+
+# Heavy dependencies, only needed for the NLP stage (or to read the Excel file)
+HEAVY_MODULES = ["spacy", "pylats", "pandas", "taaled"]
+
+# Run in the fresh process: import the module, then print the time and the heavy modules loaded
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+
+def import_time(module, repeat=5):
+    '''
+        Output:
+            * seconds: the median import time of the module over repeat fresh processes
+            * heavy: the heavy dependencies loaded by the import
+    '''
+    times = []
+    heavy = []
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL)
+        probe = json.loads(output.decode().strip().splitlines()[-1])
+        times.append(probe["seconds"])
+        heavy = probe["heavy"]
+    return statistics.median(times), heavy
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Measure the import time of the modules and check the measure modules stay light')
+    parser.add_argument('--repeat', action="store", dest='repeat', type=int, default=5, help='number of fresh processes per module (the median is kept)')
+    parser.add_argument('--output', action="store", dest='output', default='benchmark_results.jsonl', help='file the results are appended to (one JSON line per run)')
+    args = parser.parse_args()
+
+    results = dict()
+    # pylats itself, for comparison
+    for module in LIGHT_MODULES + ["pylats.lats"]:
+        seconds, heavy = import_time(module, args.repeat)
+        results[module] = {"seconds": round(seconds, 4), "heavy": heavy}
+        print("{:<30}{:>10.4f}s  {}".format(module, seconds, ", ".join(heavy)))
+
+    with open(args.output, "a") as fout:
+        fout.write(json.dumps({"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(), "python": platform.python_version(), "imports": results}) + "\n")
+
+    offenders = [module for module in LIGHT_MODULES if results[module]["heavy"]]
+    if offenders:
+        print("Heavy dependencies imported by: {}".format(", ".join(offenders)))
+        sys.exit(1)
@@ -0,0 +1,291 @@
+'''
+Benchmark of the lexical complexity pipeline
+    => Builds a synthetic corpus of the requested size from the sentences of the files in test_files/,
+       then times each stage on its own (tagging, Penn => COCA switch, frequency bands, sophisticated types, density, the fused metrics kernel, diversity)
+       and the whole pipeline end to end, as Lexical_Complexity_directory.py runs it.
+    => For each stage: number of documents and tokens, total time, tokens/sec, latency percentiles per document (ms),
+       the peak RSS of the process so far (cumulative_peak_rss_mb, the high-water mark of all the stages up to this one)
+       and how much the stage raised it (peak_rss_delta_mb: 0 when the stage stayed under the peak of an earlier stage).
+       Each run is appended as one JSON line (with the git commit) to benchmark_results.jsonl, so that the runs of different commits can be compared.
+'''
+# Example on how to run the benchmark
+#   python Benchmark_Pipeline.py
+#   python Benchmark_Pipeline.py --nb-docs=500 --doc-tokens=2000 --stages=switchtagging,diversity
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+from Batch_Tagging import tag_texts
+from Switch_Tagging import switchtagging_Penn2COCA_list as switchtagging_list
+from Token_Filter import load_token_filter
+from Lexical_FreqBand import calculate_prop_freqband
+from Lexical_PropSophisTypes import calculate_sophis_type
+from Lexical_Density import calculate_density
+from Metrics_Kernel import calculate_metrics
+from Diversity_Engine import calculate_diversity
+from Frequency_Cache import load_lemmas_pos_ranked
+from Frequency_Index import FrequencyIndex
+import Lexical_Complexity_directory
+import Switch_Tagging
+
+
+# The stages, in the order they are run
+STAGES = ["normalize", "batch_tagging", "switchtagging", "freqband", "sophis", "density", "metrics", "diversity", "end_to_end"]
+
+
+
+def make_corpus(source_dir="test_files", nb_docs=100, doc_tokens=1000, seed=0):
+    '''
+        Input:
+            * source_dir: folder of text files whose sentences are sampled
+            * nb_docs: number of documents to generate
+            * doc_tokens: approximate number of (whitespace-separated) words per document
+            * seed: seed of the random generator, so that the same settings give the same corpus
+        Output:
+            docs: a list of nb_docs texts, each made of sentences drawn at random from the source files
+    '''
+    sentences = []
+    for filename in sorted(glob.glob(os.path.join(source_dir, "**", "*.txt"), recursive=True)):
+        text = open(filename, "r").read()
+        sentences += [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+", text) if sentence.strip()]
+    if not sentences:
+        raise ValueError("No sentences found in the text files of {}".format(source_dir))
+    rng = random.Random(seed)
+    docs = []
+    for i in range(nb_docs):
+        doc = []
+        nb_words = 0
+        while nb_words < doc_tokens:
+            sentence = rng.choice(sentences)
+            doc.append(sentence)
+            nb_words += len(sentence.split())
+        docs.append(" ".join(doc))
+    return docs
+
+
+def peak_rss_mb():
+    '''
+        Output:
+            peak_rss: the peak resident set size of the process so far, in MB
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak/1024**2 if sys.platform == "darwin" else peak/1024, 1)
+
+
+def rss_stats(peak_before):
+    '''
+        Input:
+            * peak_before: the peak RSS of the process before the stage (see peak_rss_mb)
+        Output:
+            stats: the peak RSS of the process after the stage, and how much the stage raised it (MB)
+    '''
+    peak = peak_rss_mb()
+    return {"cumulative_peak_rss_mb": peak, "peak_rss_delta_mb": round(peak - peak_before, 1)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(latencies, nb_tokens, seconds, peak_before):
+    '''
+        Input:
+            * latencies: the time spent on each document (seconds)
+            * nb_tokens: number of tokens processed by the stage
+            * seconds: total time of the stage
+            * peak_before: the peak RSS of the process before the stage
+        Output:
+            stats: a dictionary with the counts, throughput, latency percentiles (ms) and peak RSS (MB, see rss_stats)
+    '''
+    latencies_ms = np.array(latencies)*1000
+    return {
+        "docs": len(latencies),
+        "tokens": nb_tokens,
+        "seconds": round(seconds, 4),
+        "tokens_per_sec": round(nb_tokens/seconds, 1) if seconds > 0 else None,
+        "latency_ms": {
+            "mean": round(float(latencies_ms.mean()), 4),
+            "p50": round(float(np.percentile(latencies_ms, 50)), 4),
+            "p90": round(float(np.percentile(latencies_ms, 90)), 4),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 4),
+            "max": round(float(latencies_ms.max()), 4),
+        } if len(latencies) else None,
+        **rss_stats(peak_before),
+    }
+
+
+def time_per_doc(function, inputs, count_tokens):
+    '''
+        Run function on each input, timing each call
+        Output:
+            * outputs: the outputs of the function, in the input order
+            * stats: see summarize()
+    '''
+    outputs = []
+    latencies = []
+    nb_tokens = 0
+    peak_before = peak_rss_mb()
+    start = time.perf_counter()
+    for item in inputs:
+        t0 = time.perf_counter()
+        outputs.append(function(item))
+        latencies.append(time.perf_counter() - t0)
+        nb_tokens += count_tokens(item, outputs[-1])
+    return outputs, summarize(latencies, nb_tokens, time.perf_counter() - start, peak_before)
+
+
+def time_generator(generator):
+    '''
+        Consume a generator with one output per document (e.g., tag_texts), timing the wait for each output
+        Output:
+            * outputs: the outputs of the generator
+            * stats: see summarize() (tokens are the lengths of the outputs)
+    '''
+    outputs = []
+    latencies = []
+    peak_before = peak_rss_mb()
+    start = time.perf_counter()
+    t0 = start
+    for output in generator:
+        outputs.append(output)
+        t1 = time.perf_counter()
+        latencies.append(t1 - t0)
+        t0 = t1
+    return outputs, summarize(latencies, sum(len(output) for output in outputs), time.perf_counter() - start, peak_before)
+
+
+# The same tokens as the runners keep (the default filter rules: URLs and "___" removed)
+token_filter = load_token_filter()
+
+def clean_tokens(tokens):
+    return token_filter.filter(tokens)
+
+
+def run_benchmark(docs, myparameters, coca_index, stages=STAGES, batch_size=64, indices_band=[0, 500, 3000, 5000], cutoff=2000):
+    '''
+        Input:
+            * docs: the texts of the corpus (see make_corpus)
+            * myparameters: the lats parameters used for preprocessing (with the loaded spaCy model)
+            * coca_index: the FrequencyIndex of the COCA list
+            * stages: names of the stages to time (see STAGES)
+        Output:
+            results: a dictionary mapping each stage to its stats (see summarize)
+    '''
+    results = dict()
+    # The stages after tagging count the tokens of their input
+    def by_tokens(item, output):
+        return len(item)
+
+    if "normalize" in stages:
+        # One lats.Normalize call per document, as the scripts did before batching
+        from pylats import lats
+        tokens_docs, results["normalize"] = time_per_doc(lambda text: lats.Normalize(text, myparameters).toks, docs, lambda item, output: len(output))
+    if "batch_tagging" in stages:
+        tokens_docs, results["batch_tagging"] = time_generator(tag_texts(docs, myparameters, batch_size=batch_size))
+    if "normalize" not in stages and "batch_tagging" not in stages:
+        # The other stages still need the tokens (not timed)
+        tokens_docs = list(tag_texts(docs, myparameters, batch_size=batch_size))
+
+    tokens_clean_docs = [clean_tokens(tokens) for tokens in tokens_docs]
+
+    if "switchtagging" in stages:
+        # Timed from an empty memo of the switch (see Switch_Tagging.py), as in a new run, not on the hits of an earlier pass
+        Switch_Tagging._switchtagging.cache_clear()
+        tokens_coca_docs, results["switchtagging"] = time_per_doc(switchtagging_list, tokens_clean_docs, by_tokens)
+    else:
+        # The measures below still need the switched tokens (not timed)
+        tokens_coca_docs = [switchtagging_list(tokens) for tokens in tokens_clean_docs]
+    if "freqband" in stages:
+        results["freqband"] = time_per_doc(lambda tokens: calculate_prop_freqband(tokens, coca_index, indices_band), tokens_coca_docs, by_tokens)[1]
+    if "sophis" in stages:
+        results["sophis"] = time_per_doc(lambda tokens: calculate_sophis_type(tokens, coca_index, cutoff=cutoff), tokens_coca_docs, by_tokens)[1]
+    if "density" in stages:
+        results["density"] = time_per_doc(calculate_density, tokens_coca_docs, by_tokens)[1]
+    if "metrics" in stages:
+        # The three measures above in one pass (as the runners compute them)
+        results["metrics"] = time_per_doc(lambda tokens: calculate_metrics(tokens, coca_index, indices_band, cutoff=cutoff), tokens_coca_docs, by_tokens)[1]
+    if "diversity" in stages:
+        results["diversity"] = time_per_doc(lambda tokens: calculate_diversity(tokens, window_lengths=(50, 11)), tokens_clean_docs, by_tokens)[1]
+    if "end_to_end" in stages:
+        # Tagging in batches, then all the measures of one row of the results file
+        Lexical_Complexity_directory.myparameters = myparameters
+        Lexical_Complexity_directory.coca_index = coca_index
+        def end_to_end():
+            for no, tokens in enumerate(tag_texts(docs, myparameters, batch_size=batch_size)):
+                Lexical_Complexity_directory.calculate_measures("doc{}".format(no), tokens)
+                yield tokens
+        results["end_to_end"] = time_generator(end_to_end())[1]
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark each stage of the lexical complexity pipeline on a synthetic corpus')
+    parser.add_argument('--source', action="store", dest='source', default='test_files', help='folder of text files the synthetic documents are sampled from')
+    parser.add_argument('--nb-docs', action="store", dest='nb_docs', type=int, default=100, help='number of synthetic documents')
+    parser.add_argument('--doc-tokens', action="store", dest='doc_tokens', type=int, default=1000, help='approximate number of words per document')
+    parser.add_argument('--seed', action="store", dest='seed', type=int, default=0)
+    parser.add_argument('--stages', action="store", dest='stages', default=",".join(STAGES), help='comma-separated stages to time, among: ' + ", ".join(STAGES))
+    parser.add_argument('--batch-size', action="store", dest='batch_size', type=int, default=64, help='number of paragraphs sent to spaCy in each batch of nlp.pipe')
+    parser.add_argument('--model', action="store", dest='model', default='en_core_web_lg', help='spaCy model used for tagging')
+    parser.add_argument('--coca', action="store", dest='coca', default='COCA word frequency.xlsx', help='the COCA word frequency list')
+    parser.add_argument('--output', action="store", dest='output', default='benchmark_results.jsonl', help='file the results are appended to (one JSON line per run)')
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error("unknown stages: {}".format(", ".join(unknown)))
+
+    results = dict()
+    ## Set up new parameters for lats, as the scripts do (the loading time, with the import of pylats, is recorded as a stage of its own)
+    peak_before = peak_rss_mb()
+    start = time.perf_counter()
+    from pylats import lats
+    myparameters = lats.parameters()
+    myparameters.model = args.model
+    myparameters.nlp = lats.load_model(myparameters.model)
+    myparameters.pos = "pos"
+    myparameters.lemma = True
+    results["load_model"] = dict(seconds=round(time.perf_counter() - start, 4), **rss_stats(peak_before))
+
+    peak_before = peak_rss_mb()
+    start = time.perf_counter()
+    coca_index = FrequencyIndex(load_lemmas_pos_ranked(args.coca, sheet_name=1, nb_ranked=5000))
+    results["load_coca"] = dict(seconds=round(time.perf_counter() - start, 4), **rss_stats(peak_before))
+
+    docs = make_corpus(args.source, args.nb_docs, args.doc_tokens, args.seed)
+    results.update(run_benchmark(docs, myparameters, coca_index, stages, args.batch_size))
+
+    run = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"source": args.source, "nb_docs": args.nb_docs, "doc_tokens": args.doc_tokens, "seed": args.seed, "batch_size": args.batch_size, "model": args.model},
+        "stages": results,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    with open(args.output, "a") as fout:
+        fout.write(json.dumps(run) + "\n")
+
+    # Summary on the screen
+    # (the peak RSS is the high-water mark of the process up to the stage, and +RSS how much the stage raised it)
+    print("{:<15}{:>10}{:>12}{:>14}{:>12}{:>12}{:>12}{:>12}{:>10}".format("stage", "docs", "seconds", "tokens/sec", "p50 (ms)", "p90 (ms)", "p99 (ms)", "peak (MB)", "+RSS (MB)"))
+    for stage, stats in results.items():
+        latency = stats.get("latency_ms") or {}
+        print("{:<15}{:>10}{:>12}{:>14}{:>12}{:>12}{:>12}{:>12}{:>10}".format(stage, stats.get("docs", ""), stats["seconds"], stats.get("tokens_per_sec") or "", latency.get("p50", ""), latency.get("p90", ""), latency.get("p99", ""), stats["cumulative_peak_rss_mb"], stats["peak_rss_delta_mb"]))
+    print("Results appended to {}".format(args.output))
@@ -0,0 +1,310 @@
+'''
+Lexical diversity engine: MTLD and MATTR (any number of window lengths) from one encoding of the tokens
+    => Gives the same values as taaled's ld.lexdiv().MTLD(tokens) and ld.lexdiv().MATTR(tokens, window_length)
+       (to 4 decimals), without walking the token list once per measure and building a set for every window.
+    => The tokens are encoded once into integer ids. For each token, the position of the previous occurrence of the same type
+       tells in which windows it is a new type, so the sum of the type counts of all the windows of one length comes out of
+       a few NumPy operations over the whole text. MTLD keeps running type counts per factor, forward and backward.
+'''
+# Example on how to run the benchmark against taaled
+#   python Diversity_Engine.py
+#   python Diversity_Engine.py --nb-tokens=5000 --repeat=1
+
+import itertools
+from array import array
+import numpy as np
+
+
+
+def encode_tokens(tokens, vocabulary=None):
+    '''
+        Input:
+            * tokens: a list of tokens, e.g., ["about_IN", "the_DT", "topic_NN", ...]
+            * vocabulary: a dictionary filled with the id of each token (its keys are then the types in the order of their ids)
+        Output:
+            * codes: a NumPy array of integer ids, one per token (the same id for the same token)
+            * nb_types: number of different tokens
+    '''
+    if vocabulary is None:
+        vocabulary = dict()
+    codes = np.fromiter((vocabulary.setdefault(token, len(vocabulary)) for token in tokens), dtype=np.int64, count=len(tokens))
+    return codes, len(vocabulary)
+
+
+def previous_occurrences(codes):
+    '''
+        Output:
+            prev: for each position, the position of the previous occurrence of the same id (-1 for the first occurrence)
+    '''
+    # Sort the positions by id (a stable sort keeps the positions of each id in order), then each position follows its previous occurrence
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    same = sorted_codes[1:] == sorted_codes[:-1]
+    del sorted_codes
+    prev_sorted = np.full(len(codes), -1, dtype=np.int64)
+    prev_sorted[1:][same] = order[:-1][same]
+    prev = np.empty(len(codes), dtype=np.int64)
+    prev[order] = prev_sorted
+    return prev
+
+
+def count_window_types(prev, positions, window_length, nb_windows):
+    '''
+        Output:
+            total_types: the number of windows each token is a new type in, summed over the tokens at the positions (see mattr())
+    '''
+    # The same as max(last - first + 1, 0).sum() for first = max(prev+1, position-window_length+1) and last = min(position, nb_windows-1),
+    # computed in place, with two temporary arrays
+    first = positions - (window_length - 1)
+    np.maximum(first, prev + 1, out=first)
+    last = np.minimum(positions, nb_windows - 1)
+    last -= first
+    last += 1
+    np.maximum(last, 0, out=last)
+    return int(last.sum())
+
+
+def mattr(codes, window_lengths=(50,), prev=None):
+    '''
+        Input:
+            * codes: the integer-encoded tokens (see encode_tokens)
+            * window_lengths: the window lengths to calculate MATTR for
+            * prev: the previous occurrences of the codes, if already computed (see previous_occurrences)
+        Output:
+            mattrs: a dictionary mapping each window length to its MATTR value, e.g., {50: 0.7432, 11: 0.9313}
+    '''
+    nb_tokens = len(codes)
+    if prev is None:
+        prev = previous_occurrences(codes)
+    positions = np.arange(nb_tokens, dtype=np.int64)
+    mattrs = dict()
+    for window_length in window_lengths:
+        if nb_tokens < window_length + 1:
+            # Texts not longer than one window: taaled falls back to the plain TTR
+            mattrs[window_length] = len(np.unique(codes))/nb_tokens if nb_tokens else 0
+            continue
+        nb_windows = nb_tokens - window_length + 1
+        # The token at position i is a new type in the windows starting at x, for max(prev[i]+1, i-window_length+1) <= x <= i
+        # (and 0 <= x <= nb_tokens-window_length), so summing the number of such windows gives the sum of the type counts of all the windows
+        total_types = count_window_types(prev, positions, window_length, nb_windows)
+        mattrs[window_length] = total_types/(nb_windows*window_length)
+    return mattrs
+
+
+def mtld_factors(codes, nb_types, mn=10, ttrval=.720, nb_tokens=None):
+    '''
+        One pass of MTLD over the codes (in the given order), as taaled's MTLDER
+        (codes can be any iterable, e.g., the codes of several chunks chained, if nb_tokens gives their total number)
+        Output:
+            * factor_lengths: the length of each factor (the last one may be partial)
+            * factor_props: the proportion of each factor (1 for full factors)
+    '''
+    factor_lengths = []
+    factor_props = []
+    # Number of the factor each type was last seen in, so that nothing needs to be cleared when a new factor starts
+    seen = [-1]*nb_types
+    factor_no = 0
+    length = 0
+    types = 0
+    last = (len(codes) if nb_tokens is None else nb_tokens) - 1
+    for x, code in enumerate(codes):
+        length += 1
+        if seen[code] != factor_no:
+            seen[code] = factor_no
+            types += 1
+        if x == last:
+            # Partial factor at the end of the text
+            factor_lengths.append(length)
+            factor_props.append((1 - types/length)/(1 - ttrval) if ttrval != 1 else 0)
+        elif types/length < ttrval and length >= mn:
+            factor_lengths.append(length)
+            factor_props.append(1)
+            factor_no += 1
+            length = 0
+            types = 0
+    return factor_lengths, factor_props
+
+
+def as_array(codes):
+    '''
+        Output:
+            codes: the codes as an array of 64-bit integers, read as fast as a list by the MTLD loop with 8 bytes per token
+                   (instead of one Python int object per token)
+    '''
+    if isinstance(codes, np.ndarray):
+        codes_array = array("q")
+        codes_array.frombytes(np.ascontiguousarray(codes, dtype=np.int64).tobytes())
+        return codes_array
+    return array("q", codes)
+
+
+def mtld(codes, nb_types, mn=10, ttrval=.720):
+    '''
+        Input:
+            * codes, nb_types: the integer-encoded tokens (see encode_tokens)
+            * mn: minimum factor length
+            * ttrval: the TTR threshold that closes a factor
+        Output:
+            mtld: the mean factor length over the forward and backward factors (taaled's default MTLD value)
+    '''
+    codes = as_array(codes)
+    fw_factors = mtld_factors(codes, nb_types, mn, ttrval)
+    bw_factors = mtld_factors(codes[::-1], nb_types, mn, ttrval)
+    return mean_factor_length(fw_factors, bw_factors)
+
+
+def mean_factor_length(fw_factors, bw_factors):
+    '''
+        Output:
+            mtld: the mean factor length over the forward and backward factors (see mtld_factors)
+    '''
+    fw_lengths, fw_props = fw_factors
+    bw_lengths, bw_props = bw_factors
+    # Factors that were not long enough to be counted (proportion 0) are skipped
+    factor_lengths = [length/prop for length, prop in zip(fw_lengths + bw_lengths, fw_props + bw_props) if prop != 0]
+    if not factor_lengths:
+        return 0
+    return sum(factor_lengths)/len(factor_lengths)
+
+
+def mattr_chunks(code_chunks, nb_types, window_lengths=(50,)):
+    '''
+        Same as mattr() over the concatenation of the chunks, one chunk at a time
+        Input:
+            * code_chunks: the integer-encoded tokens of the consecutive chunks of one text (encoded with the same vocabulary)
+            * nb_types: number of different tokens over all the chunks
+            * window_lengths: the window lengths to calculate MATTR for
+        Output:
+            mattrs: a dictionary mapping each window length to its MATTR value
+    '''
+    nb_tokens = sum(len(codes) for codes in code_chunks)
+    total_types = {window_length: 0 for window_length in window_lengths}
+    # Each chunk is preceded by the last tokens of the text before it, enough to find the previous occurrences that fall
+    # within one window (the ones further back give the same window counts as no previous occurrence at all)
+    tail_length = max(window_lengths) - 1 if window_lengths else 0
+    tail = np.zeros(0, dtype=np.int64)
+    offset = 0
+    for codes in code_chunks:
+        extended = np.concatenate([tail, np.asarray(codes, dtype=np.int64)])
+        start = offset - len(tail)
+        prev = previous_occurrences(extended)[len(tail):]
+        prev = np.where(prev >= 0, prev + start, -1)
+        positions = np.arange(offset, offset + len(codes), dtype=np.int64)
+        for window_length in window_lengths:
+            nb_windows = nb_tokens - window_length + 1
+            if nb_windows < 2:
+                continue
+            total_types[window_length] += count_window_types(prev, positions, window_length, nb_windows)
+        tail = extended[max(len(extended) - tail_length, 0):]
+        offset += len(codes)
+
+    mattrs = dict()
+    for window_length in window_lengths:
+        if nb_tokens < window_length + 1:
+            # Texts not longer than one window: taaled falls back to the plain TTR
+            mattrs[window_length] = nb_types/nb_tokens if nb_tokens else 0
+        else:
+            mattrs[window_length] = total_types[window_length]/((nb_tokens - window_length + 1)*window_length)
+    return mattrs
+
+
+def calculate_diversity(tokens, window_lengths=(50, 11), mn=10, ttrval=.720):
+    '''
+        Input:
+            * tokens: a list of tokens, e.g., ["about_IN", "the_DT", "topic_NN", ...]
+            * window_lengths: the MATTR window lengths
+            * mn, ttrval: the MTLD settings (taaled's defaults)
+        Output:
+            diversity: a dictionary of the (unrounded) measures, e.g., {"MTLD": 58.2101, "MATTR50": 0.7432, "MATTR11": 0.9313}
+    '''
+    codes, nb_types = encode_tokens(tokens)
+    diversity = {"MTLD": mtld(codes, nb_types, mn, ttrval)}
+    for window_length, value in mattr(codes, window_lengths).items():
+        diversity["MATTR{}".format(window_length)] = value
+    return diversity
+
+
+def calculate_diversity_codes(codes, window_lengths=(50, 11), mn=10, ttrval=.720):
+    '''
+        Same as calculate_diversity() for tokens already encoded as integer ids (e.g., by Token_Vocabulary.TokenVocabulary.encode)
+        Input:
+            * codes: the ids of the tokens (any ids, the same for the same token)
+        Output:
+            diversity: a dictionary of the (unrounded) measures, e.g., {"MTLD": 58.2101, "MATTR50": 0.7432, "MATTR11": 0.9313}
+    '''
+    # Renumber the ids from 0 (the measures only depend on which tokens are the same), through a table as long as the largest id
+    codes = np.asarray(codes, dtype=np.int64)
+    present = np.zeros(int(codes.max()) + 1 if len(codes) else 0, dtype=bool)
+    present[codes] = True
+    new_ids = np.cumsum(present) - 1
+    codes = new_ids[codes]
+    diversity = {"MTLD": mtld(codes, int(present.sum()), mn, ttrval)}
+    for window_length, value in mattr(codes, window_lengths).items():
+        diversity["MATTR{}".format(window_length)] = value
+    return diversity
+
+
+def calculate_diversity_chunks(token_chunks, window_lengths=(50, 11), mn=10, ttrval=.720):
+    '''
+        Same as calculate_diversity() over the concatenation of the chunks, without concatenating the tokens
+        (MATTR windows and MTLD factors run across the chunk boundaries, so the values are exactly the same)
+        Input:
+            * token_chunks: the token lists of the consecutive chunks of one text
+        Output:
+            diversity: a dictionary of the (unrounded) measures, e.g., {"MTLD": 58.2101, "MATTR50": 0.7432, "MATTR11": 0.9313}
+    '''
+    vocabulary = dict()
+    code_chunks = [as_array(encode_tokens(tokens, vocabulary)[0]) for tokens in token_chunks]
+    nb_types = len(vocabulary)
+    nb_tokens = sum(len(codes) for codes in code_chunks)
+    forward = itertools.chain.from_iterable(code_chunks)
+    backward = itertools.chain.from_iterable(codes[::-1] for codes in code_chunks[::-1])
+    diversity = {"MTLD": mean_factor_length(mtld_factors(forward, nb_types, mn, ttrval, nb_tokens), mtld_factors(backward, nb_types, mn, ttrval, nb_tokens))}
+    for window_length, value in mattr_chunks(code_chunks, nb_types, window_lengths).items():
+        diversity["MATTR{}".format(window_length)] = value
+    return diversity
+
+
+if __name__ == "__main__":
+    # Benchmark against taaled, on the test files and on a random corpus (Zipf-like word frequencies)
+    import argparse
+    import glob
+    import time
+    from taaled import ld
+
+    parser = argparse.ArgumentParser(description='Compare the diversity engine with taaled (values and running time)')
+    parser.add_argument('--nb-tokens', action="store", dest='nb_tokens', type=int, default=2000, help='number of tokens of the random text (taaled slows down quadratically on long texts)')
+    parser.add_argument('--repeat', action="store", dest='repeat', type=int, default=3, help='number of timed runs (the best one is kept)')
+    args = parser.parse_args()
+
+    texts = dict()
+    for filename in sorted(glob.glob("test_files/*.txt")):
+        texts[filename] = open(filename, "r").read().lower().split()
+    rng = np.random.default_rng(0)
+    texts["random ({} tokens)".format(args.nb_tokens)] = ["w{}".format(i) for i in rng.zipf(1.3, args.nb_tokens) % 20000]
+
+    def best_time(function):
+        times = []
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            value = function()
+            times.append(time.perf_counter() - start)
+        return value, min(times)
+
+    def taaled_diversity(tokens):
+        Lexdiv = ld.lexdiv()
+        values = {"MTLD": Lexdiv.MTLD(tokens)}
+        for window_length in (50, 11):
+            value = Lexdiv.MATTR(tokens, window_length=window_length)
+            # taaled returns (TTR, [TTR], [tokens]) for texts not longer than one window
+            values["MATTR{}".format(window_length)] = value[0] if isinstance(value, tuple) else value
+        return values
+
+    for name, tokens in texts.items():
+        reference, reference_time = best_time(lambda: taaled_diversity(tokens))
+        values, engine_time = best_time(lambda: calculate_diversity(tokens))
+        print(name)
+        for measure in reference:
+            match = round(reference[measure], 4) == round(values[measure], 4)
+            print("    {}\ttaaled={}\tengine={}\t{}".format(measure, round(reference[measure], 4), round(values[measure], 4), "ok" if match else "MISMATCH"))
+        print("    taaled: {:.4f}s\tengine: {:.4f}s\tspeedup: x{:.1f}".format(reference_time, engine_time, reference_time/engine_time))
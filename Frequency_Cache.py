@@ -0,0 +1,178 @@
+'''
+On-disk cache of the ranked lemma_pos pairs parsed from "COCA word frequency.xlsx" (or from any other frequency list, see Frequency_Lists.py)
+    => Parsing the workbook with openpyxl takes seconds, so the pairs are compiled once into a compact binary file
+       next to the workbook, and later runs load that file in milliseconds.
+    => The cache is rebuilt automatically when the workbook changes (checked by mtime and size, then by SHA-256),
+       or when it was compiled with other reading options (recorded in its header).
+
+Layout of the cache file:
+    * MAGIC (8 bytes) + header length (uint32, little-endian) + JSON header (padded to 4 bytes)
+    * string offsets: (nb_pairs + 1) uint32, little-endian
+    * string table: the UTF-8 encoded lemma_pos pairs, concatenated in rank order
+'''
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import warnings
+from array import array
+
+
+MAGIC = b"LPRANK01"
+VERSION = 1
+
+
+
+def read_lemmas_pos_ranked_xlsx(xlsx_path="COCA word frequency.xlsx", sheet_name=1, nb_ranked=5000):
+    '''
+        Input:
+            * xlsx_path: path to the COCA word frequency workbook
+            * sheet_name: the sheet holding the lemma frequency list
+            * nb_ranked: number of top-ranked lemmas to keep
+        Output:
+            lemmas_pos_ranked: the ranked lemma_pos pairs (e.g., ['the_a', 'be_v', 'and_c', 'a_a', 'of_i'])
+    '''
+    import pandas as pd  # only needed when the cache has to be (re)built
+
+    lemma_freq_coca = pd.read_excel(xlsx_path, sheet_name=sheet_name)
+    lemmas_ranked = list(lemma_freq_coca["lemma"][:nb_ranked])
+    pos_ranked = list(lemma_freq_coca["PoS"][:nb_ranked])
+    lemmas_pos_ranked = [str(lemmas_ranked[i]).lower()+"_"+pos_ranked[i] for i in range(len(lemmas_ranked))]
+    return lemmas_pos_ranked
+
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as fin:
+        for block in iter(lambda: fin.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def default_cache_path(xlsx_path):
+    return xlsx_path + ".cache"
+
+
+def write_cache(cache_path, lemmas_pos_ranked, header):
+    '''
+        Write the lemma_pos pairs and the header (a dictionary describing the source) into the cache file.
+        The file is written to a temporary file first and then moved into place, so readers never see a partial cache.
+    '''
+    header = dict(header, version=VERSION, nb_pairs=len(lemmas_pos_ranked))
+    header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+    header_bytes += b" " * (-(len(MAGIC) + 4 + len(header_bytes)) % 4)
+
+    encoded = [pair.encode("utf-8") for pair in lemmas_pos_ranked]
+    offsets = array("I", [0])
+    for pair in encoded:
+        offsets.append(offsets[-1] + len(pair))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+
+    cache_dir = os.path.dirname(os.path.abspath(cache_path))
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".lprank-")
+    try:
+        with os.fdopen(fd, "wb") as fout:
+            fout.write(MAGIC)
+            fout.write(struct.pack("<I", len(header_bytes)))
+            fout.write(header_bytes)
+            fout.write(offsets.tobytes())
+            fout.write(b"".join(encoded))
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def try_write_cache(cache_path, lemmas_pos_ranked, header):
+    '''
+        Same as write_cache(), with a warning instead of an error if the cache cannot be written (e.g., a read-only folder):
+        the pairs are then parsed again on the next run
+    '''
+    try:
+        write_cache(cache_path, lemmas_pos_ranked, header)
+    except OSError as error:
+        warnings.warn("Could not write the frequency list cache {} ({}), the list is used without it".format(cache_path, error))
+
+
+def read_cache(cache_path):
+    '''
+        Output:
+            (header, lemmas_pos_ranked): the header dictionary and the (interned) lemma_pos pairs, or (None, None) if the file is missing or unreadable
+    '''
+    try:
+        with open(cache_path, "rb") as fin, mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(MAGIC)] != MAGIC:
+                return None, None
+            pos = len(MAGIC)
+            header_len = struct.unpack("<I", mm[pos:pos+4])[0]
+            pos += 4
+            header = json.loads(mm[pos:pos+header_len].decode("utf-8"))
+            pos += header_len
+            nb_pairs = header["nb_pairs"]
+            offsets = array("I")
+            offsets.frombytes(mm[pos:pos+4*(nb_pairs+1)])
+            if sys.byteorder != "little":
+                offsets.byteswap()
+            pos += 4*(nb_pairs+1)
+            strings = mm[pos:pos+offsets[-1]]
+    except (OSError, ValueError, KeyError, struct.error):
+        return None, None
+    if header.get("version") != VERSION or len(strings) != offsets[-1]:
+        return None, None
+    lemmas_pos_ranked = [sys.intern(strings[offsets[i]:offsets[i+1]].decode("utf-8")) for i in range(nb_pairs)]
+    return header, lemmas_pos_ranked
+
+
+def load_ranked_list(path, read, source, cache_path=None):
+    '''
+        Input:
+            * path: the source file of the list (its mtime, size and SHA-256 tell when the cache is outdated)
+            * read: a function parsing the source file into the list of ranked keys, called only when the cache has to be (re)built
+            * source: a dictionary of the reading options (e.g., the sheet and the number of ranks), stored in the cache header
+            * cache_path: where to keep the compiled cache. By default, next to the source file ("<path>.cache")
+        Output:
+            ranked: the ranked keys, same as read() gives
+    '''
+    if cache_path is None:
+        cache_path = default_cache_path(path)
+    stat = os.stat(path)
+
+    header, ranked = read_cache(cache_path)
+    if header is not None and all(header.get(k) == v for k, v in source.items()):
+        # Unchanged source: same mtime and size
+        if header.get("mtime_ns") == stat.st_mtime_ns and header.get("size") == stat.st_size:
+            return ranked
+        # Touched but identical source: same content hash, so only refresh the recorded mtime
+        sha256 = file_sha256(path)
+        if header.get("sha256") == sha256:
+            header.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            try_write_cache(cache_path, ranked, header)
+            return ranked
+    else:
+        sha256 = file_sha256(path)
+
+    # Missing, outdated, or corrupted cache: parse the source and rebuild it
+    ranked = [sys.intern(key) for key in read()]
+    header = dict(source, mtime_ns=stat.st_mtime_ns, size=stat.st_size, sha256=sha256)
+    try_write_cache(cache_path, ranked, header)
+    return ranked
+
+
+def load_lemmas_pos_ranked(xlsx_path="COCA word frequency.xlsx", sheet_name=1, nb_ranked=5000, cache_path=None):
+    '''
+        Input:
+            * xlsx_path: path to the COCA word frequency workbook
+            * sheet_name: the sheet holding the lemma frequency list
+            * nb_ranked: number of top-ranked lemmas to keep
+            * cache_path: where to keep the compiled cache. By default, next to the workbook ("<xlsx_path>.cache")
+        Output:
+            lemmas_pos_ranked: the ranked lemma_pos pairs (e.g., ['the_a', 'be_v', 'and_c', 'a_a', 'of_i']), same as parsing the workbook directly
+    '''
+    source = {"sheet_name": sheet_name, "nb_ranked": nb_ranked}
+    return load_ranked_list(xlsx_path, lambda: read_lemmas_pos_ranked_xlsx(xlsx_path, sheet_name, nb_ranked), source, cache_path)
@@ -0,0 +1,93 @@
+'''
+Rank index of the ranked lemma_pos pairs from a reference frequency list (e.g., COCA)
+    => Built once, then every token is looked up with a single hash lookup instead of scanning the list
+'''
+
+from bisect import bisect_right
+
+
+
+class FrequencyIndex:
+    '''
+        Input:
+            * lemmas_pos_ranked: the ranked lemma_pos pairs, a list of "lemma_pos" pairs (e.g., 'be_v') sorted by their frequency in the reference corpus
+        Attributes:
+            * ranks: a dictionary mapping each lemma_pos pair to the ranks (0-based positions) it takes in the list, e.g., {'the_a': (0,), 'be_v': (1,), ...}
+    '''
+
+    def __init__(self, lemmas_pos_ranked):
+        self.lemmas_pos_ranked = list(lemmas_pos_ranked)
+        ranks = dict()
+        for rank, pair in enumerate(self.lemmas_pos_ranked):
+            ranks.setdefault(pair, []).append(rank)
+        # A pair may (rarely) appear more than once in the list, so keep every rank to match list membership
+        self.ranks = {pair: tuple(rk) for pair, rk in ranks.items()}
+        # Band tables and sophisticated sets already computed, keyed by their band layout or cutoff
+        self._band_tables = dict()
+        self._sophis_sets = dict()
+
+    def __len__(self):
+        return len(self.lemmas_pos_ranked)
+
+    def __contains__(self, pair):
+        return pair in self.ranks
+
+    def rank(self, pair):
+        '''
+            Output:
+                rank: the (first) 0-based rank of the lemma_pos pair, or None if it is out of the list
+        '''
+        rk = self.ranks.get(pair)
+        if rk is None:
+            return None
+        return rk[0]
+
+    def band_table(self, indices_band):
+        '''
+            Input:
+                * indices_band: ascending indices for each frequency band of the frequency list, e.g., [0, 500, 3000, 5000]
+            Output:
+                band_table: a dictionary mapping each lemma_pos pair within the bands to the (0-based) numbers of the bands it falls in, e.g., {'the_a': (0,), ...}
+        '''
+        key = tuple(int(i) for i in indices_band)
+        if key not in self._band_tables:
+            # Bounds of each band, clipped the same way as slicing lemmas_pos_ranked[indices_band[i]:indices_band[i+1]]
+            bounds = [slice(key[i], key[i+1]).indices(len(self))[:2] for i in range(len(key)-1)]
+            starts = [start for start, stop in bounds]
+            table = dict()
+            for pair, rk in self.ranks.items():
+                bands = []
+                for r in rk:
+                    # Binary search over the band starts, then check the rank falls before the band stop
+                    i = bisect_right(starts, r) - 1
+                    if i >= 0 and r < bounds[i][1] and i not in bands:
+                        bands.append(i)
+                if bands:
+                    table[pair] = tuple(bands)
+            self._band_tables[key] = table
+        return self._band_tables[key]
+
+    def sophisticated(self, cutoff):
+        '''
+            Input:
+                * cutoff: the frequency rank cutoff for sophisticated word types
+            Output:
+                sophis_set: a set of the lemma_pos pairs ranked at or after the cutoff, i.e., the ones in lemmas_pos_ranked[cutoff:]
+        '''
+        if cutoff not in self._sophis_sets:
+            start = slice(cutoff, None).indices(len(self))[0]
+            self._sophis_sets[cutoff] = frozenset(pair for pair, rk in self.ranks.items() if rk[-1] >= start)
+        return self._sophis_sets[cutoff]
+
+
+
+def as_frequency_index(lemmas_pos_ranked):
+    '''
+        Input:
+            * lemmas_pos_ranked: either a FrequencyIndex or a plain list of ranked "lemma_pos" pairs
+        Output:
+            frequency_index: a FrequencyIndex (built from the list if needed)
+    '''
+    if isinstance(lemmas_pos_ranked, FrequencyIndex):
+        return lemmas_pos_ranked
+    return FrequencyIndex(lemmas_pos_ranked)
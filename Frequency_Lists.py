@@ -0,0 +1,180 @@
+'''
+Frequency lists besides COCA (e.g., SUBTLEX, BNC, in-house lists), scored in the same pass as the COCA list
+    => A list is read from an Excel, CSV or TSV file (a word column, an optional POS column, and an optional frequency
+       column to rank the words by if the file is not already in rank order), then compiled once into the binary cache
+       of Frequency_Cache.py (next to the file), so later runs load a 60k-word list in milliseconds.
+    => The ranked keys go into a FrequencyIndex (one hash lookup per type), and the frequency bands and the proportion of
+       sophisticated types are computed with the metrics kernel from the tokens already tagged for the COCA measures.
+    => Lists with a POS column are looked up by "lemma_pos" (the POS in the COCA tags, as given by Switch_Tagging.py);
+       lists without one (pos_column: null) are looked up by the lemma alone.
+
+Configuration (a JSON file given with --frequency-lists=lists.json), e.g.:
+    [
+        {"name": "SUBTLEX", "path": "SUBTLEX-US.csv", "word_column": "Word", "pos_column": null, "freq_column": "FREQcount"},
+        {"name": "BNC", "path": "bnc_lemmas.tsv", "word_column": "lemma", "pos_column": "pos", "nb_ranked": 20000,
+         "indices_band": [0, 1000, 3000, 9000], "cutoff": 3000}
+    ]
+'''
+
+import csv
+import json
+import os
+from Frequency_Cache import load_ranked_list
+from Frequency_Index import FrequencyIndex
+from Metrics_Kernel import metrics_counts, metrics_counts_codes, merge_metrics_counts, metrics_from_counts
+
+
+# Delimiters of the text formats, by file extension
+DELIMITERS = {".csv": ",", ".tsv": "\t", ".txt": "\t"}
+
+
+
+def read_ranked_list(path, word_column="lemma", pos_column="PoS", freq_column=None, sheet_name=0, nb_ranked=None, lowercase=True):
+    '''
+        Input:
+            * path: an Excel (.xlsx), CSV (.csv) or TSV (.tsv, .txt) file with a header row
+            * word_column: the column of the words (or lemmas)
+            * pos_column: the column of the POS tags, or None to key the list by the words alone
+            * freq_column: the column of the frequencies to rank the words by (descending), or None if the rows are already ranked
+            * sheet_name: the sheet of an Excel file
+            * nb_ranked: number of top-ranked words to keep (None: all)
+            * lowercase: lowercase the words, as the lemmas of the tokens are
+        Output:
+            ranked: the ranked keys, e.g., ['the_a', 'be_v', ...] (or ['the', 'be', ...] without a POS column)
+    '''
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xls"):
+        import pandas as pd  # only needed when the cache has to be (re)built
+        rows = pd.read_excel(path, sheet_name=sheet_name, keep_default_na=False).to_dict("records")
+    elif extension in DELIMITERS:
+        with open(path, "r", newline="", encoding="utf-8-sig") as fin:
+            rows = list(csv.DictReader(fin, delimiter=DELIMITERS[extension]))
+    else:
+        raise ValueError("Unknown frequency list format: {} (expected .xlsx, .csv, .tsv or .txt)".format(path))
+
+    missing = [column for column in (word_column, pos_column, freq_column) if column is not None and rows and column not in rows[0]]
+    if missing:
+        raise ValueError("Column(s) {} not found in {}".format(", ".join(missing), path))
+
+    # Rows without a word are skipped
+    rows = [row for row in rows if str(row[word_column]).strip() != ""]
+    if freq_column is not None:
+        # (a stable sort keeps the order of the file for equal frequencies)
+        rows.sort(key=lambda row: -float(row[freq_column] or 0))
+    if nb_ranked is not None:
+        rows = rows[:nb_ranked]
+
+    ranked = []
+    for row in rows:
+        word = str(row[word_column]).strip()
+        if lowercase:
+            word = word.lower()
+        ranked.append(word + "_" + str(row[pos_column]).strip() if pos_column is not None else word)
+    return ranked
+
+
+def lemma_key(pair):
+    # The lemma of a lemma_pos pair, the key of the lists without POS tags
+    return pair.rsplit("_", 1)[0]
+
+
+class FrequencyList:
+    '''
+        Input:
+            * name: the name of the list, the prefix of its columns in the results (e.g., "SUBTLEX" => SUBTLEX_Freq_Band1, ...)
+            * path, word_column, pos_column, freq_column, sheet_name, nb_ranked, lowercase: how to read the list (see read_ranked_list)
+            * indices_band: indices for each frequency band of the list
+            * cutoff: the frequency rank cutoff for sophisticated word types
+    '''
+
+    def __init__(self, name, path, word_column="lemma", pos_column="PoS", freq_column=None, sheet_name=0, nb_ranked=None, lowercase=True,
+                 indices_band=[0, 500, 3000, 5000], cutoff=2000):
+        if not name or "\t" in name:
+            raise ValueError("Invalid frequency list name: {!r}".format(name))
+        self.name = name
+        self.path = path
+        self.options = {"word_column": word_column, "pos_column": pos_column, "freq_column": freq_column,
+                        "sheet_name": sheet_name, "nb_ranked": nb_ranked, "lowercase": lowercase}
+        self.indices_band = list(indices_band)
+        self.cutoff = cutoff
+        # The FrequencyIndex of the list, built by load()
+        self.index = None
+
+    def columns(self):
+        '''
+            Output:
+                columns: the columns of the list in the results, e.g., ["SUBTLEX_Freq_Band1", ..., "SUBTLEX_Prop_Sophis_type"]
+        '''
+        return ["{}_Freq_Band{}".format(self.name, i+1) for i in range(len(self.indices_band))] + ["{}_Prop_Sophis_type".format(self.name)]
+
+    def load(self, cache_path=None):
+        '''
+            Read the list (from its compiled cache if it is up to date) and build its index
+        '''
+        ranked = load_ranked_list(self.path, lambda: read_ranked_list(self.path, **self.options), dict(self.options, format="ranked_list"), cache_path)
+        self.index = FrequencyIndex(ranked)
+        return self
+
+    def keys(self, tokens_coca):
+        # The lemma alone for a list without POS tags (the COCA tag follows the last "_")
+        if self.options["pos_column"] is None:
+            return [lemma_key(pair) for pair in tokens_coca]
+        return tokens_coca
+
+    def counts(self, tokens_coca):
+        '''
+            Output:
+                counts: the counts of the frequency bands and types of the list for the tokens (see Metrics_Kernel.metrics_counts),
+                        which can be merged over the chunks of a long text with merge_counts()
+        '''
+        return metrics_counts(self.keys(tokens_coca), self.index, self.indices_band, self.cutoff, content=None)
+
+    def counts_codes(self, codes, strings):
+        '''
+            Same as counts() for tokens interned as integer ids (see Token_Vocabulary.py; strings: the pair of each id)
+        '''
+        key = lemma_key if self.options["pos_column"] is None else None
+        return metrics_counts_codes(codes, strings, self.index, self.indices_band, self.cutoff, content=None, key=key)
+
+    def merge_counts(self, partials):
+        return merge_metrics_counts(partials)
+
+    def values(self, counts):
+        '''
+            Output:
+                values: the proportions of tokens in each band, then the proportion of sophisticated types, in the order of columns()
+        '''
+        metrics = metrics_from_counts(counts)
+        return list(metrics["prop_freqband"].values()) + [metrics["proportion_sophis"]]
+
+    def calculate(self, tokens_coca):
+        return self.values(self.counts(tokens_coca))
+
+
+def read_frequency_lists(config_path):
+    '''
+        Input:
+            * config_path: a JSON file with a list of frequency lists (see the example above); relative paths are relative to it
+        Output:
+            frequency_lists: the FrequencyList of each entry (not loaded yet, see FrequencyList.load)
+    '''
+    with open(config_path, "r") as fin:
+        entries = json.load(fin)
+    base = os.path.dirname(os.path.abspath(config_path))
+    frequency_lists = []
+    for entry in entries:
+        entry = dict(entry)
+        entry["path"] = os.path.join(base, entry["path"])
+        frequency_lists.append(FrequencyList(**entry))
+    names = [frequency_list.name for frequency_list in frequency_lists]
+    if len(set(names)) < len(names):
+        raise ValueError("Duplicated frequency list names in {}".format(config_path))
+    return frequency_lists
+
+
+def list_columns(frequency_lists):
+    '''
+        Output:
+            columns: the columns of all the lists, in order
+    '''
+    return [column for frequency_list in frequency_lists for column in frequency_list.columns()]
@@ -0,0 +1,229 @@
+'''
+Corpus-level statistics of the measures, per group of files
+    => The groups come from fields of the IDs: e.g., with --group-by=L1:3 the file 108_AB_1_CHN_2_F_10540_UA.txt
+       (fields separated by "_", counted from 0, without the extension) belongs to the group L1=CHN.
+       Several --group-by give several groupings, and "L1:3,level:4" groups by both fields at once.
+    => The results file is read one row at a time and each group keeps, for every measure, running statistics
+       (count, mean and variance with Welford's method, min, max).
+    => The quantiles are exact (interpolated as numpy.quantile does, p=0 and p=1 being the min and the max), whatever the order of the rows:
+       the values of each measure are kept once in a compact array (8 bytes per row and measure, plus 4 bytes per row and grouping
+       for the group of the row), and the quantiles of each group are computed from them at the end.
+    => The summaries are written as a text file with one line per group and measure, the values separated by "\t".
+'''
+# Example on how to run the aggregation on an existing results file
+#   python Group_Statistics.py --group-by=L1:3 --group-by=L1:3,level:4
+#   python Group_Statistics.py --results=Lexical_Complexity_results.txt --group-by=site:7 --quantiles=0.25,0.5,0.75
+
+import argparse
+import math
+import os
+from array import array
+import numpy as np
+from Results_Writer import COLUMNS, parse_row
+
+
+# Quantiles computed by default
+QUANTILES = (0.1, 0.5, 0.9)
+
+# Name of the grouping (and of the group) of all the files together
+ALL = "all"
+
+# Group value of the IDs that have too few fields
+MISSING = "NA"
+
+
+
+class RunningStats:
+    '''
+        Running statistics of one measure in one group (the quantiles are computed by GroupAggregator)
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        # Sum of the squared differences from the mean (Welford)
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def variance(self):
+        # Sample variance (ddof=1, as pandas), undefined for a single value
+        return self.m2/(self.count - 1) if self.count > 1 else math.nan
+
+    def summary(self):
+        '''
+            Output:
+                summary: a dictionary of the statistics, e.g., {"n": 120, "mean": 0.61, "variance": 0.004, "sd": 0.063, "min": 0.45, "max": 0.78}
+        '''
+        variance = self.variance()
+        return {"n": self.count, "mean": self.mean, "variance": variance, "sd": math.sqrt(variance), "min": self.min, "max": self.max}
+
+
+def quantile_name(p):
+    # e.g., 0.5 => "p50", 0.025 => "p2.5"
+    return "p{:g}".format(p*100)
+
+
+def parse_grouping(spec):
+    '''
+        Input:
+            * spec: a grouping as "name:position[,name:position...]", e.g., "L1:3,level:4"
+        Output:
+            fields: a list of (name, position) pairs, e.g., [("L1", 3), ("level", 4)]
+    '''
+    fields = []
+    for field in spec.split(","):
+        name, sep, position = field.strip().rpartition(":")
+        if not sep or not name or not position.isdigit():
+            raise ValueError("Invalid grouping: {!r} (expected name:position, e.g., L1:3)".format(field))
+        fields.append((name, int(position)))
+    return fields
+
+
+def id_fields(id, separator="_"):
+    '''
+        Output:
+            fields: the fields of the ID, without the folder and the extension, e.g., "108_AB_1_CHN_2_F_10540_UA.txt" => ["108", "AB", "1", "CHN", ...]
+    '''
+    return os.path.splitext(os.path.basename(id))[0].split(separator)
+
+
+class GroupAggregator:
+    '''
+        Input:
+            * groupings: a list of groupings (see parse_grouping); the files are also summarized all together
+            * columns: the columns of the results rows (ID first, then the measures)
+            * quantiles: the quantiles to compute (exact, see quantiles())
+            * separator: the separator of the fields of the IDs
+    '''
+
+    def __init__(self, groupings=(), columns=COLUMNS, quantiles=QUANTILES, separator="_"):
+        self.groupings = [list(fields) for fields in groupings]
+        self.measures = list(columns[1:])
+        self.quantiles = list(quantiles)
+        self.separator = separator
+        # {(grouping name, group name): [RunningStats of each measure]}, in the order the groups are met
+        self.groups = dict()
+        # The values of each measure, one per row, and for each grouping the number of the group of each row
+        # (the groups of a grouping numbered in the order they are met, in group_nos)
+        self.values = [array("d") for measure in self.measures]
+        self.row_groups = [array("i") for grouping in self.groupings]
+        self.group_nos = [dict() for grouping in self.groupings]
+
+    def _stats(self, key):
+        stats = self.groups.get(key)
+        if stats is None:
+            stats = self.groups[key] = [RunningStats() for measure in self.measures]
+        return stats
+
+    def add(self, values):
+        '''
+            Add one row of results (the ID, then the value of each measure)
+        '''
+        fields = id_fields(values[0], self.separator)
+        keys = [(ALL, ALL)]
+        for grouping, row_groups, group_nos in zip(self.groupings, self.row_groups, self.group_nos):
+            names = "+".join(name for name, position in grouping)
+            group = "+".join(fields[position] if position < len(fields) else MISSING for name, position in grouping)
+            keys.append((names, group))
+            row_groups.append(group_nos.setdefault(group, len(group_nos)))
+        for column, value in zip(self.values, values[1:]):
+            column.append(value)
+        for key in keys:
+            for stats, value in zip(self._stats(key), values[1:]):
+                stats.add(value)
+
+    def add_row(self, row):
+        '''
+            Add one line of the TSV results file
+        '''
+        self.add(parse_row(row))
+
+    def quantiles_of_groups(self):
+        '''
+            Output:
+                quantiles: {(grouping name, group name): the exact quantiles of each measure}
+        '''
+        quantiles = dict()
+        columns = [np.frombuffer(column, dtype=np.float64) for column in self.values]
+        if not self.quantiles or not len(columns) or not len(columns[0]):
+            return quantiles
+        quantiles[(ALL, ALL)] = [np.quantile(column, self.quantiles) for column in columns]
+        for grouping, row_groups, group_nos in zip(self.groupings, self.row_groups, self.group_nos):
+            names = "+".join(name for name, position in grouping)
+            # The rows sorted by group, so that the values of each group are one slice
+            row_groups = np.frombuffer(row_groups, dtype=np.int32)
+            order = np.argsort(row_groups, kind="stable")
+            bounds = np.searchsorted(row_groups[order], np.arange(len(group_nos) + 1))
+            sorted_columns = [column[order] for column in columns]
+            for group, group_no in group_nos.items():
+                start, end = bounds[group_no], bounds[group_no + 1]
+                quantiles[(names, group)] = [np.quantile(column[start:end], self.quantiles) for column in sorted_columns]
+        return quantiles
+
+    def summaries(self):
+        '''
+            Output:
+                summaries: one dictionary per group and measure, e.g., {"grouping": "L1", "group": "CHN", "measure": "MTLD", "n": 120, "mean": 58.2, "p50": 57.9, ...}
+        '''
+        quantiles = self.quantiles_of_groups()
+        for (grouping, group) in sorted(self.groups, key=lambda key: (key[0] != ALL, key)):
+            for measure_no, (measure, stats) in enumerate(zip(self.measures, self.groups[(grouping, group)])):
+                summary = {"grouping": grouping, "group": group, "measure": measure}
+                summary.update(stats.summary())
+                for quantile_no, p in enumerate(self.quantiles):
+                    summary[quantile_name(p)] = float(quantiles[(grouping, group)][measure_no][quantile_no])
+                yield summary
+
+    def write(self, path):
+        '''
+            Write the summaries into a text file (one line per group and measure, separated by "\t")
+        '''
+        header = ["grouping", "group", "measure", "n", "mean", "variance", "sd", "min"] + [quantile_name(p) for p in self.quantiles] + ["max"]
+        with open(path, "w") as fout:
+            fout.write("\t".join(header) + "\n")
+            for summary in self.summaries():
+                fout.write("\t".join(str(round(summary[key], 4)) if isinstance(summary[key], float) else str(summary[key]) for key in header) + "\n")
+
+
+def aggregate_results(results_path, groupings=(), output="Lexical_Complexity_groups.txt", quantiles=QUANTILES, separator="_"):
+    '''
+        Input:
+            * results_path: the TSV results file (with its header), read one row at a time
+            * groupings, quantiles, separator: see GroupAggregator
+            * output: the file the summaries are written to
+        Output:
+            aggregator: the GroupAggregator of all the rows
+    '''
+    with open(results_path, "r") as fin:
+        columns = fin.readline().rstrip("\n").split("\t")
+        aggregator = GroupAggregator(groupings, columns, quantiles, separator)
+        for row in fin:
+            if row.strip():
+                aggregator.add_row(row)
+    aggregator.write(output)
+    return aggregator
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Summarize the measures of a results file per group of files (groups taken from fields of the IDs)')
+    parser.add_argument('--results', action="store", dest='results', default='Lexical_Complexity_results.txt', help='the results file')
+    parser.add_argument('--group-by', action="append", dest='group_by', default=[], help='a grouping as name:position[,name:position...], the fields of the IDs being separated by "_" and counted from 0 (can be repeated)')
+    parser.add_argument('--quantiles', action="store", dest='quantiles', default=",".join(str(p) for p in QUANTILES), help='comma-separated quantiles to compute (exact)')
+    parser.add_argument('--output', action="store", dest='output', default='Lexical_Complexity_groups.txt', help='file the summaries are written to')
+    args = parser.parse_args()
+
+    groupings = [parse_grouping(spec) for spec in args.group_by]
+    quantiles = [float(p) for p in args.quantiles.split(",")]
+    aggregator = aggregate_results(args.results, groupings, args.output, quantiles)
+    print("{} groups written to {}".format(len(aggregator.groups), args.output))
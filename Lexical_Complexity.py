@@ -12,83 +12,199 @@ Calculate lexical complexity measures, including:
     * Proportion of sophisticated word types (ranked after 2000 in the COCA word frequency list)
     * Lexical density: Proportion of content word tokens
 '''
+# Example on how to run the script
+#   python Lexical_Complexity.py
+#   python Lexical_Complexity.py --sweep=sweep_grid.json --sweep-format=long
 
-import pandas as pd
+import argparse
 import numpy as np
 from pylats import lats
-from taaled import ld
+from Diversity_Engine import calculate_diversity_codes
 from Switch_Tagging import switchtagging_Penn2COCA as switchtagging
-from Lexical_FreqBand import calculate_prop_freqband
-from Lexical_PropSophisTypes import calculate_sophis_type
-from Lexical_Density import calculate_density
-
+from Metrics_Kernel import metrics_counts_codes, metrics_from_counts
+from Frequency_Cache import load_lemmas_pos_ranked
+from Frequency_Index import FrequencyIndex
+from Batch_Tagging import CHUNK_CHARS, load_model, tag_records
+from Transcript_Reader import read_transcripts
+from Token_Cache import TokenCache
+from Token_Vocabulary import MAX_SIZE as VOCABULARY_SIZE, TokenVocabulary
+from Token_Filter import load_token_filter
+from Results_Writer import COLUMNS, FORMATS as OUTPUT_FORMATS, ResultsWriter, results_path
+from Frequency_Lists import read_frequency_lists, list_columns
+from Measure_Sweep import SWEEP_FORMATS, MeasureSweep, read_sweep_grid
+from Verify_Measures import SampleVerifier
+from Pipeline_Profiler import Profiler, FORMATS, set_profiler, stage, profile_iter
+
+
+
+# Optional profile of the run (see Pipeline_Profiler.py), e.g., python Lexical_Complexity.py --profile --profile-format=prometheus
+parser = argparse.ArgumentParser(description='Calculate lexical complexity measures for each transcript of all_txt_transcript.txt')
+parser.add_argument('--quoted-transcripts', action='store_true', dest='quoted_transcripts', help='the speeches of all_txt_transcript.txt may be quoted ("...") to hold tabs or line breaks, see Transcript_Reader.py')
+parser.add_argument('--output-format', action="store", dest='output_format', choices=list(OUTPUT_FORMATS), default='tsv', help='tsv (Lexical_Complexity_results.txt), csv, or parquet / arrow (typed columns, needs pyarrow)')
+parser.add_argument('--token-cache', action="store", dest='token_cache', default='token_cache.sqlite', help='SQLite file caching the preprocessed tokens (empty to disable)')
+parser.add_argument('--token-cache-size', action="store", dest='token_cache_size', type=int, default=1024, help='maximum size of the token cache in MB')
+parser.add_argument('--filter-rules', action="store", dest='filter_rules', default='', help='JSON file of the rules of the tokens left out of the measures (default: URLs and "___"), see Token_Filter.py')
+parser.add_argument('--filter-report', action="store", dest='filter_report', default='Lexical_Complexity_filter.txt', help='file the number of tokens removed by each filter rule is written to')
+parser.add_argument('--frequency-lists', action="store", dest='frequency_lists', default='', help='JSON file of other frequency lists (SUBTLEX, BNC, ...) to score in the same pass, see Frequency_Lists.py')
+parser.add_argument('--verify-sample', action="store", dest='verify_sample', type=float, default=0.0, help='fraction of the transcripts (e.g., 0.01) whose measures are computed again by the reference implementations and compared, see Verify_Measures.py')
+parser.add_argument('--verify-report', action="store", dest='verify_report', default='Lexical_Complexity_verify.txt', help='file the differences found by --verify-sample are written to')
+parser.add_argument('--sweep', action="store", dest='sweep', default='', help='JSON grid of measure parameters (cutoff, indices_band, window_lengths): every configuration is scored from one tagging of each transcript, see Measure_Sweep.py')
+parser.add_argument('--sweep-format', action="store", dest='sweep_format', choices=SWEEP_FORMATS, default='wide', help='wide: one row per transcript with the columns of every configuration; long: one row per transcript, configuration and measure')
+parser.add_argument('--profile', action='store_true', help='record the wall and CPU time, tokens and memory of each stage for each transcript')
+parser.add_argument('--profile-output', action="store", dest='profile_output', default=None, help='file the profile is written to (default: Lexical_Complexity_profile.jsonl, or .prom for the prometheus format)')
+parser.add_argument('--profile-format', action="store", dest='profile_format', choices=FORMATS, default='jsonl', help='jsonl: one line per stage and transcript; prometheus: totals per stage')
+args = parser.parse_args()
+if not 0 <= args.verify_sample <= 1:
+    parser.error("--verify-sample must be between 0 and 1")
+if args.sweep and args.frequency_lists:
+    parser.error("--frequency-lists cannot be combined with --sweep (only the COCA measures are swept)")
+# Read the grid before loading the model, so that a mistake in it shows up right away
+configurations = read_sweep_grid(args.sweep) if args.sweep else None
+
+profiler = None
+if args.profile:
+    profile_output = args.profile_output or ("Lexical_Complexity_profile.prom" if args.profile_format == "prometheus" else "Lexical_Complexity_profile.jsonl")
+    profiler = Profiler(profile_output, args.profile_format)
+    set_profiler(profiler)
 
 
 ## Set up new parameters for lats, using the large dataset in SpaCy for preprocessing
 myparameters = lats.parameters()
 myparameters.model = "en_core_web_lg"
-myparameters.nlp = lats.load_model(myparameters.model)
+with stage("load_model"):
+    myparameters.nlp = load_model(myparameters.model)
 myparameters.pos = "pos"
 myparameters.lemma = True
 
 
-# Load the COCA word frequency list (Sheet 1) for measures regarding frequency bands and sophistication types
-lemma_freq_coca = pd.read_excel("COCA word frequency.xlsx", sheet_name=1)
+# Load the COCA word frequency list (Sheet 1) for measures regarding frequency bands and sophistication types, compiled into a binary cache on the first run (see Frequency_Cache.py)
 # Set up the ranked lemma_pos pairs (e.g., ['the_a', 'be_v', 'and_c', 'a_a', 'of_i'])
-lemmas_ranked = list(lemma_freq_coca["lemma"][:5000])
-pos_ranked = list(lemma_freq_coca["PoS"][:5000])
-lemmas_pos_ranked = [str(lemmas_ranked[i]).lower()+"_"+pos_ranked[i] for i in range(len(lemmas_ranked))]
+with stage("load_coca"):
+    lemmas_pos_ranked = load_lemmas_pos_ranked("COCA word frequency.xlsx", sheet_name=1, nb_ranked=5000)
+    # Build the rank index once, so that each token is looked up with one hash lookup
+    coca_index = FrequencyIndex(lemmas_pos_ranked)
+
+# Other frequency lists (optional), scored from the same tokens, with their columns after the COCA ones
+frequency_lists = []
+if args.frequency_lists:
+    with stage("load_lists"):
+        frequency_lists = [frequency_list.load() for frequency_list in read_frequency_lists(args.frequency_lists)]
 
 # Indices for each frequency band of the COCA frequency list
 indices_band=np.array([0, 500, 3000, 5000])
 
-
-# Read in the text file (each line represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
-txts = open("all_txt_transcript.txt", "r").readlines()
-
-# Write lexical complexity measures for each file into a text file
-with open("Lexical_Complexity_results.txt", "w") as fout:
-
-    # Write the headings
-    fout.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format("ID", "MTLD", "MATTR50", "MATTR11", "Freq_Band1", "Freq_Band2", "Freq_Band3", "Freq_Band4", "Prop_Sophis_type", "Density"))
-
-    ## Iterate by file
-    for txt in txts:
-
-        id = txt.split("\t")[0]
-        speech = txt.split("\t")[1]
-
-        # Preprocess the speech, tokenized and lemmatized tokens with Penn POS tags
-        tokens = lats.Normalize(speech, myparameters).toks
-
-        # Switch POS tagging for each token pairs (from Penn to COCA POS tags)
-        #tokens_coca = [switchtagging(token) for token in tokens]
-        tokens_clean = []
-        tokens_coca = []
-        for token in tokens:
-            # Remove the URL token that contains "https:"
-            if "https:" in token:
+# In sweep mode, every configuration of the grid instead of the measures above (written to Lexical_Complexity_sweep.txt, or .csv, ...)
+sweep = MeasureSweep(configurations, coca_index) if configurations is not None else None
+
+# Number of paragraphs sent to spaCy in each batch of nlp.pipe
+batch_size = 64
+
+# Cache of the preprocessed tokens (size in MB), so that re-running the measures on the same transcripts skips the tagging
+# (closed at the end of the run, see below)
+token_cache = TokenCache(args.token_cache, max_bytes=args.token_cache_size*1024**2) if args.token_cache else None
+
+# The tokens interned as integer ids (see Token_Vocabulary.py): the tokens with Penn POS tags, and their pairs of token and COCA POS tag,
+# so that the filter and the POS switch are done once per different token
+# (cleared together between two transcripts once they hold more than VOCABULARY_SIZE tokens: the ids are only used within one transcript)
+vocabulary = TokenVocabulary()
+coca_vocabulary = TokenVocabulary()
+
+# The tokens left out of the measures, the same rules as the other scripts (see Token_Filter.py)
+token_filter = load_token_filter(args.filter_rules)
+
+# A random sample of the transcripts checked against the reference implementations (see Verify_Measures.py)
+verifier = SampleVerifier(args.verify_sample, indices_band, cutoff=2000)
+
+# (-1 for the tokens the filter removes: they are never switched, and may not even have a POS tag, e.g., "___")
+def coca_id(token):
+    if token_filter.rule_of(token) >= 0:
+        return -1
+    return coca_vocabulary.intern(switchtagging(token))
+
+
+# Read in the text file lazily, one record at a time (each line represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
+records = read_transcripts("all_txt_transcript.txt", quoted=args.quoted_transcripts)
+
+# Write lexical complexity measures for each file into the results file (with the headings),
+# the rows being buffered and written in bulk (see Results_Writer.py)
+if sweep is None:
+    writer = ResultsWriter(results_path(format=args.output_format), args.output_format, COLUMNS + list_columns(frequency_lists))
+else:
+    writer = ResultsWriter(results_path("Lexical_Complexity_sweep", args.output_format), args.output_format, sweep.columns(args.sweep_format),
+                           nb_key_columns=3 if args.sweep_format == "long" else 1)
+try:
+    with writer:
+
+        ## Iterate by file
+        # Preprocess the speeches in batches, tokenized and lemmatized tokens with Penn POS tags
+        # (the speeches longer than CHUNK_CHARS characters are tagged in chunks cut at paragraph boundaries, which gives the same tokens)
+        for id, tokens in profile_iter("tagging", tag_records(records, myparameters, batch_size=batch_size, cache=token_cache, max_chars=CHUNK_CHARS), label=lambda record: record[0], count=lambda record: len(record[1])):
+
+            if len(vocabulary) + len(coca_vocabulary) > VOCABULARY_SIZE:
+                vocabulary.clear()
+                coca_vocabulary.clear()
+
+            # Switch POS tagging for each token pairs (from Penn to COCA POS tags)
+            #tokens_coca = [switchtagging(token) for token in tokens]
+            with stage("filter", id, len(tokens)):
+                codes = vocabulary.encode(tokens)
+                codes_clean = token_filter.filter_codes(codes, vocabulary)
+            with stage("switchtagging", id, len(codes_clean)):
+                codes_coca = vocabulary.table(coca_id)[codes_clean]
+
+            ## In sweep mode, calculate the measures of every configuration from the same token ids
+            if sweep is not None:
+                with stage("sweep", id, len(codes_clean)):
+                    values = sweep.calculate_codes(codes_clean, codes_coca, coca_vocabulary.strings)
+                with stage("write", id):
+                    for row in sweep.rows(id, values, args.sweep_format):
+                        writer.write(row)
                 continue
-            else:
-                tokens_clean.append(token)
-                tokens_coca.append(switchtagging(token))
-
-        ## Calculate lexical diversity using different measures
-        Lexdiv = ld.lexdiv()
-        mtld = round(Lexdiv.MTLD(tokens_clean),4)
-        mattr50 = round(Lexdiv.MATTR(tokens_clean),4)
-        mattr11 = round(Lexdiv.MATTR(tokens_clean, window_length=11),4)  # you can customize window length
-
-        ## Calculate frequency-band measures
-        prop_freqband = calculate_prop_freqband(tokens_coca, lemmas_pos_ranked, indices_band)
-        props_fb_string = ""
-        for band,prop in prop_freqband.items():
-            props_fb_string += str(prop)+"\t"
-        
-        ## Calculate proportion of sophisticated word types
-        proportion_sophis = calculate_sophis_type(tokens_coca, lemmas_pos_ranked, cutoff=2000)
-
-        ## Calculate lexical density
-        density = calculate_density(tokens_coca)
-
-        fout.write("{}\t{}\t{}\t{}\t{}{}\t{}\n".format(id, mtld, mattr50, mattr11, props_fb_string, proportion_sophis, density))
+
+            ## Calculate lexical diversity using different measures
+            # (MTLD and MATTR for every window length from the token ids, the same values as taaled)
+            with stage("diversity", id, len(codes_clean)):
+                diversity = calculate_diversity_codes(codes_clean, window_lengths=(50, 11))  # you can customize window lengths
+            mtld = round(diversity["MTLD"],4)
+            mattr50 = round(diversity["MATTR50"],4)
+            mattr11 = round(diversity["MATTR11"],4)
+
+            ## Calculate frequency-band measures, proportion of sophisticated word types and lexical density
+            # (in one pass over the token ids, the same values as calculate_prop_freqband, calculate_sophis_type and calculate_density)
+            with stage("metrics", id, len(codes_coca)):
+                metrics = metrics_from_counts(metrics_counts_codes(codes_coca, coca_vocabulary.strings, coca_index, indices_band, cutoff=2000))
+            prop_freqband = metrics["prop_freqband"]
+            proportion_sophis = metrics["proportion_sophis"]
+            density = metrics["density"]
+
+            ## Calculate the frequency-band measures and the proportion of sophisticated word types of the other frequency lists
+            with stage("frequency_lists", id, len(codes_coca)):
+                list_values = [value for frequency_list in frequency_lists for value in frequency_list.values(frequency_list.counts_codes(codes_coca, coca_vocabulary.strings))]
+
+            values = [id, mtld, mattr50, mattr11] + list(prop_freqband.values()) + [proportion_sophis, density] + list_values
+            if verifier.sampled():
+                with stage("verify", id, len(tokens)):
+                    verifier.check(id, tokens, values, coca_index, token_filter)
+
+            with stage("write", id):
+                writer.write(values)
+finally:
+    # write out the evictions of the token cache and close it, even if the run stops on an error
+    if token_cache is not None:
+        token_cache.close()
+
+print("Results written to {}".format(writer.path))
+
+# The number of tokens removed by each filter rule
+token_filter.write_report(args.filter_report)
+print("Filter report written to {}".format(args.filter_report))
+
+# The transcripts checked against the reference implementations
+if args.verify_sample > 0:
+    verifier.write_report(args.verify_report)
+    print(verifier.summary())
+    print("Verification report written to {}".format(args.verify_report))
+
+if profiler is not None:
+    profiler.close()
+    print("Profile written to {}".format(profiler.output))
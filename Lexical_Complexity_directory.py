@@ -14,146 +14,610 @@ Calculate lexical complexity measures, including:
 '''
 # Example on how to run the script
 #   python Lexical_Complexity_directory.py --directory=test_files
+#   python Lexical_Complexity_directory.py --directory=test_files --workers=8
+#   python Lexical_Complexity_directory.py --directory=test_files --profile --profile-output=profile.jsonl
 
 import argparse
+import gc
+import math
+import multiprocessing
 import os
 import re
+import signal
 import sys
-import pandas as pd
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import numpy as np
-from pylats import lats
-from taaled import ld
+from Diversity_Engine import calculate_diversity_codes, calculate_diversity_chunks
 from Switch_Tagging import switchtagging_Penn2COCA as switchtagging
-from Lexical_FreqBand import calculate_prop_freqband
-from Lexical_PropSophisTypes import calculate_sophis_type
-from Lexical_Density import calculate_density
+from Metrics_Kernel import metrics_counts_codes, merge_metrics_counts, metrics_from_counts
+from Frequency_Cache import load_lemmas_pos_ranked
+from Frequency_Index import FrequencyIndex
+from Frequency_Lists import read_frequency_lists, list_columns
+from Batch_Tagging import CHUNK_CHARS, chunk_text, load_model, tag_texts, tag_text_chunks
+from Token_Cache import TokenCache
+from Token_Vocabulary import MAX_SIZE as VOCABULARY_SIZE, TokenVocabulary
+from Token_Filter import load_token_filter
+from Verify_Measures import SampleVerifier
+from Watch_Folder import BACKENDS, Debouncer, open_watcher, scan_files
+from Results_Manifest import ResultsManifest
+from Results_Writer import COLUMNS, FORMATS as OUTPUT_FORMATS, ResultsWriter, format_row, results_path
+from Group_Statistics import QUANTILES, parse_grouping, aggregate_results
+from Pipeline_Profiler import Profiler, FORMATS, set_profiler, get_profiler, stage, profile_iter
 
 
 
-## Set up new parameters for lats, using the large dataset in SpaCy for preprocessing
-myparameters = lats.parameters()
-myparameters.model = "en_core_web_lg"
-myparameters.nlp = lats.load_model(myparameters.model)
-myparameters.pos = "pos"
-myparameters.lemma = True
+# Indices for each frequency band of the COCA frequency list
+indices_band=np.array([0, 500, 3000, 5000])
 
+# The headings of the results file
+HEADER = "\t".join(COLUMNS) + "\n"
 
-# Load the COCA word frequency list (Sheet 1) for measures regarding frequency bands and sophistication types
-lemma_freq_coca = pd.read_excel("COCA word frequency.xlsx", sheet_name=1)
-# Set up the ranked lemma_pos pairs (e.g., ['the_a', 'be_v', 'and_c', 'a_a', 'of_i'])
-lemmas_ranked = list(lemma_freq_coca["lemma"][:5000])
-pos_ranked = list(lemma_freq_coca["PoS"][:5000])
-lemmas_pos_ranked = [str(lemmas_ranked[i]).lower()+"_"+pos_ranked[i] for i in range(len(lemmas_ranked))]
+# The lats parameters (with the loaded spaCy model), the COCA rank index, the other frequency lists, the token cache,
+# the token filter (the default rules until load_resources() reads a rules file, see Token_Filter.py)
+# and the verifier of a sample of the files (none checked until load_resources() gets a fraction, see Verify_Measures.py),
+# loaded once per process by load_resources() (the main process, or each worker of the pool where workers cannot be forked, see start_workers())
+myparameters = None
+coca_index = None
+frequency_lists = []
+token_cache = None
+token_filter = load_token_filter()
+verifier = SampleVerifier()
 
-# Indices for each frequency band of the COCA frequency list
-indices_band=np.array([0, 500, 3000, 5000])
+# The tokens of this process, interned as integer ids (see Token_Vocabulary.py):
+# the tokens with Penn POS tags, and the pairs of token and COCA POS tag they are switched to
+# (cleared together between two files once they hold more than VOCABULARY_SIZE tokens, see preprocess_tokens())
+vocabulary = TokenVocabulary()
+coca_vocabulary = TokenVocabulary()
+
+
+def load_resources(token_cache_path="token_cache.sqlite", token_cache_size=1024, profile=False, frequency_lists_path=None, filter_rules_path=None, verify_sample=0.0):
+    global myparameters, coca_index, frequency_lists, token_filter, verifier
+    # pylats (and spaCy) is only imported here, so that importing calculate_measures() stays light
+    from pylats import lats
+
+    # In a worker process, keep the profile records in memory, they are sent back with the rows (see process_batch)
+    if profile:
+        set_profiler(Profiler())
+
+    ## Set up new parameters for lats, using the large dataset in SpaCy for preprocessing
+    myparameters = lats.parameters()
+    myparameters.model = "en_core_web_lg"
+    with stage("load_model"):
+        myparameters.nlp = load_model(myparameters.model)
+    myparameters.pos = "pos"
+    myparameters.lemma = True
+
+    # Load the COCA word frequency list (Sheet 1) for measures regarding frequency bands and sophistication types, compiled into a binary cache on the first run (see Frequency_Cache.py)
+    # Set up the ranked lemma_pos pairs (e.g., ['the_a', 'be_v', 'and_c', 'a_a', 'of_i'])
+    with stage("load_coca"):
+        lemmas_pos_ranked = load_lemmas_pos_ranked("COCA word frequency.xlsx", sheet_name=1, nb_ranked=5000)
+        # Build the rank index once, so that each token is looked up with one hash lookup
+        coca_index = FrequencyIndex(lemmas_pos_ranked)
+
+    # Other frequency lists scored on the same tokens (see Frequency_Lists.py), compiled into binary caches on the first run too
+    if frequency_lists_path:
+        with stage("load_lists"):
+            frequency_lists = [frequency_list.load() for frequency_list in read_frequency_lists(frequency_lists_path)]
+
+    # The tokens left out of the measures (the default rules without a rules file)
+    token_filter = load_token_filter(filter_rules_path)
+
+    # The fraction of the files whose measures are computed again by the reference implementations
+    verifier = SampleVerifier(verify_sample, indices_band, cutoff=2000)
 
-# Define the way we retrieve arguments sent to the script.
-parser = argparse.ArgumentParser(description='Process Textfiles in a Directory')
-parser.add_argument('--overwrite', action='store_true')
-parser.add_argument('--directory', action="store", dest='dir', default='')
-args = parser.parse_args()
+    # Cache of the preprocessed tokens (size in MB), so that re-running the measures on the same files skips the tagging
+    if token_cache_path:
+        open_token_cache(token_cache_path, token_cache_size)
+
+# open the token cache (size in MB) in the thread that uses it (its SQLite connection can only be used by the thread that opened it)
+def open_token_cache(token_cache_path="token_cache.sqlite", token_cache_size=1024):
+    global token_cache
+    token_cache = TokenCache(token_cache_path, max_bytes=token_cache_size*1024**2) if token_cache_path else None
+
+# The arguments of load_resources(), in order (resources_args may give only the first ones)
+RESOURCES_ARGS = ["token_cache_path", "token_cache_size", "profile", "frequency_lists_path", "filter_rules_path", "verify_sample"]
+
+# initializer of the workers forked from a process that already loaded the resources (see start_workers()):
+# only what cannot be shared is opened again, the token cache (its SQLite connection) and the profiler
+# (in watch mode, Ctrl-C (or kill) stops the main process, which lets the workers finish)
+def init_forked_worker(watch=False, token_cache_path="token_cache.sqlite", token_cache_size=1024, profile=False):
+    if watch:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    set_profiler(Profiler() if profile else None)
+    open_token_cache(token_cache_path, token_cache_size)
+
+# start the pool of worker processes (resources_args are the arguments of load_resources())
+# where processes are forked (Linux), the spaCy model, the COCA rank index and the frequency lists are loaded once here,
+# before the workers start, so that the workers share their memory pages (copy-on-write) instead of each loading their own:
+# N workers take about the memory of one model, and start without loading anything
+# (elsewhere, each worker loads its own resources, as a new process does not inherit them)
+def start_workers(workers, resources_args=(), watch=False):
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return(ProcessPoolExecutor(max_workers=workers, initializer=init_watch_worker if watch else load_resources, initargs=resources_args))
+    # no token cache here: an SQLite connection must not be shared by several processes
+    kwargs = dict(zip(RESOURCES_ARGS, resources_args))
+    load_resources(**dict(kwargs, token_cache_path="", profile=False))
+    # the objects loaded so far are left out of the garbage collections, which would otherwise write to all their pages
+    # (and make every worker copy them)
+    gc.freeze()
+    return(ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+                               initializer=init_forked_worker, initargs=(watch,) + tuple(resources_args[:3])))
 
 
 # Read in the text file (each line represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
 #txts = open("all_txt_transcript.txt", "r").readlines()
 
 
-    # individual text processing function that is called by the recursive function
-def process_file(filename):
-    # only process text files
-    found_text_files = False
-    if '.txt' in filename:
-        found_text_files = True
-    ## Iterate by file
-    #for txt in txts:
-
-        clean_filename = os.path.split(filename)[1]
-        #clean_filename = re.sub(r'\.\.[\\\/]', r'', filename)
-        print(clean_filename)
-
-        file = clean_filename
-        original_textfile = open(filename, 'r')
-        file_contents = original_textfile.read()
-        speech = file_contents
-
-        # Preprocess the speech, tokenized and lemmatized tokens with Penn POS tags
-        tokens = lats.Normalize(speech, myparameters).toks
-
-        # Switch POS tagging for each token pairs (from Penn to COCA POS tags)
-        #tokens_coca = [switchtagging(token) for token in tokens]
-        tokens_clean = []
-        tokens_coca = []
-        for token in tokens:
-            # Remove the URL token that contains "https:"
-            if "https:" in token:
-                continue
-            elif "http:" in token:
-                continue
-            elif "___" in token:
-                continue
-            else:
-                tokens_clean.append(token)
-                tokens_coca.append(switchtagging(token))
+# read the whole contents of one text file
+def read_file(filename):
+    original_textfile = open(filename, 'r')
+    file_contents = original_textfile.read()
+    original_textfile.close()
+    return(file_contents)
+
+# the id of the pair of token and COCA POS tag a token with a Penn POS tag is switched to
+# (-1 for the tokens the filter removes: they are never switched, and may not even have a POS tag, e.g., "___")
+def coca_id(token):
+    if token_filter.rule_of(token) >= 0:
+        return(-1)
+    return(coca_vocabulary.intern(switchtagging(token)))
+
+# remove the tokens matched by the filter rules (by default, the URL tokens and the "___" ones) from the preprocessed tokens
+# of one file (or one chunk of a file), then switch POS tagging for each token pairs (from Penn to COCA POS tags)
+# (the tokens are interned once, and both steps are looked up once per different token, see Token_Vocabulary.py)
+def preprocess_tokens(file, tokens):
 
-        ## Calculate lexical diversity using different measures
-        Lexdiv = ld.lexdiv()
-        mtld = round(Lexdiv.MTLD(tokens_clean),4)
-        mattr50 = round(Lexdiv.MATTR(tokens_clean),4)
-        mattr11 = round(Lexdiv.MATTR(tokens_clean, window_length=11),4)  # you can customize window length
+    # (the ids are only used within one file or chunk, so that a long-running process (watch mode, the service)
+    # does not keep every token it ever saw; both are cleared, as the switch table of vocabulary holds ids of coca_vocabulary)
+    if len(vocabulary) + len(coca_vocabulary) > VOCABULARY_SIZE:
+        vocabulary.clear()
+        coca_vocabulary.clear()
 
-        ## Calculate frequency-band measures
-        prop_freqband = calculate_prop_freqband(tokens_coca, lemmas_pos_ranked, indices_band)
-        props_fb_string = ""
-        for band,prop in prop_freqband.items():
-            props_fb_string += str(prop)+"\t"
-        
-        ## Calculate proportion of sophisticated word types
-        proportion_sophis = calculate_sophis_type(tokens_coca, lemmas_pos_ranked, cutoff=2000)
+    #tokens_coca = [switchtagging(token) for token in tokens]
+    with stage("filter", file, len(tokens)):
+        codes = vocabulary.encode(tokens)
+        codes_clean = token_filter.filter_codes(codes, vocabulary)
+    with stage("switchtagging", file, len(codes_clean)):
+        codes_coca = vocabulary.table(coca_id)[codes_clean]
+    return(codes_clean, codes_coca)
 
-        ## Calculate lexical density
-        density = calculate_density(tokens_coca)
+# round the measures and return them as a list of values in the order of the columns (ID first),
+# followed by the values of the other frequency lists (if any)
+def row_values(file, diversity, metrics, list_values=()):
+    mtld = round(diversity["MTLD"],4)
+    mattr50 = round(diversity["MATTR50"],4)
+    mattr11 = round(diversity["MATTR11"],4)
+    prop_freqband = metrics["prop_freqband"]
+    proportion_sophis = metrics["proportion_sophis"]
+    density = metrics["density"]
+    return([file, mtld, mattr50, mattr11] + list(prop_freqband.values()) + [proportion_sophis, density] + [value for values in list_values for value in values])
 
-        with open("Lexical_Complexity_results.txt", "a") as fout:
+# calculate all the measures for the preprocessed tokens of one file,
+# and return them as a list of values in the order of the columns (ID first)
+def calculate_values(file, tokens):
 
-            fout.write("{}\t{}\t{}\t{}\t{}{}\t{}\n".format(file, mtld, mattr50, mattr11, props_fb_string, proportion_sophis, density))
+    codes_clean, codes_coca = preprocess_tokens(file, tokens)
 
-        original_textfile.close()
+    ## Calculate lexical diversity using different measures
+    # (MTLD and MATTR for every window length from the token ids, the same values as taaled)
+    with stage("diversity", file, len(codes_clean)):
+        diversity = calculate_diversity_codes(codes_clean, window_lengths=(50, 11))  # you can customize window lengths
 
-        
+    ## Calculate frequency-band measures, proportion of sophisticated word types and lexical density
+    # (in one pass over the token ids, the same values as calculate_prop_freqband, calculate_sophis_type and calculate_density)
+    with stage("metrics", file, len(codes_coca)):
+        metrics = metrics_from_counts(metrics_counts_codes(codes_coca, coca_vocabulary.strings, coca_index, indices_band, cutoff=2000))
 
-    return(found_text_files)
+    ## Calculate frequency-band measures and proportion of sophisticated word types for the other frequency lists
+    with stage("frequency_lists", file, len(codes_coca)):
+        list_values = [frequency_list.values(frequency_list.counts_codes(codes_coca, coca_vocabulary.strings)) for frequency_list in frequency_lists]
+
+    values = row_values(file, diversity, metrics, list_values)
+
+    # re-check a random sample of the files against the reference implementations (see Verify_Measures.py)
+    if verifier.sampled():
+        with stage("verify", file, len(tokens)):
+            verifier.check(file, tokens, values, coca_index, token_filter)
+    return(values)
+
+# calculate all the measures for the preprocessed tokens of one file,
+# and return them as one line of the results file
+def calculate_measures(file, tokens):
+    return(format_row(calculate_values(file, tokens)))
+
+# preprocess the tokens of one chunk of a long file, and return what the measures of the whole file are merged from:
+# the clean tokens (for the diversity) and the counts of the frequency bands, types and content words (for COCA and the other lists)
+def calculate_partial(file, tokens):
+    codes_clean, codes_coca = preprocess_tokens(file, tokens)
+    with stage("metrics", file, len(codes_coca)):
+        counts = metrics_counts_codes(codes_coca, coca_vocabulary.strings, coca_index, indices_band, cutoff=2000)
+    with stage("frequency_lists", file, len(codes_coca)):
+        list_counts = [frequency_list.counts_codes(codes_coca, coca_vocabulary.strings) for frequency_list in frequency_lists]
+    # (the ids are those of this process, so the clean tokens go back as strings)
+    return(vocabulary.decode(codes_clean), counts, list_counts)
+
+# merge the partial results of the chunks of one file (in their order) into its line of the results file,
+# with exactly the values of the whole file processed at once
+def merge_partials(file, partials):
+    nb_tokens = sum(len(tokens_clean) for tokens_clean, counts, list_counts in partials)
+    # (MATTR windows and MTLD factors run across the chunk boundaries)
+    with stage("diversity", file, nb_tokens):
+        diversity = calculate_diversity_chunks([tokens_clean for tokens_clean, counts, list_counts in partials], window_lengths=(50, 11))
+    with stage("metrics", file, nb_tokens):
+        metrics = metrics_from_counts(merge_metrics_counts([counts for tokens_clean, counts, list_counts in partials]))
+    with stage("frequency_lists", file, nb_tokens):
+        list_values = [frequency_list.values(frequency_list.merge_counts([list_counts[i] for tokens_clean, counts, list_counts in partials]))
+                       for i, frequency_list in enumerate(frequency_lists)]
+    values = row_values(file, diversity, metrics, list_values)
+    # (the clean tokens of the chunks are checked, the filter removes nothing more from them;
+    #  only where the COCA list is loaded, i.e., not in the main process of a pool whose workers load their own)
+    if coca_index is not None and verifier.sampled():
+        with stage("verify", file, nb_tokens):
+            verifier.check(file, [token for tokens_clean, counts, list_counts in partials for token in tokens_clean], values, coca_index, token_filter)
+    return(format_row(values))
+
+# calculate all the measures for the preprocessed tokens of the chunks of one file (see Batch_Tagging.chunk_text)
+def calculate_chunked_measures(file, token_chunks):
+    if len(token_chunks) == 1:
+        return(calculate_measures(file, token_chunks[0]))
+    return(merge_partials(file, [calculate_partial(file, tokens) for tokens in token_chunks]))
+
+# worker function of the process pool: preprocess a batch of text files and
+# return their lines of the results file (the rows are written by the main process),
+# with the profile records of the batch (if profiling) and the counts of the token filter
+# (the files longer than chunk_chars characters are tagged in chunks, one after the other, see Batch_Tagging.chunk_text)
+def process_batch(filenames, batch_size=64, chunk_chars=0):
+    files = [os.path.split(filename)[1] for filename in filenames]
+    speeches = (read_file(filename) for filename in filenames)
+    rows = []
+    tagged = tag_text_chunks(speeches, myparameters, chunk_chars, batch_size=batch_size, cache=token_cache)
+    for file, token_chunks in zip(files, profile_iter("tagging", tagged, files, count=lambda token_chunks: sum(len(tokens) for tokens in token_chunks))):
+        rows.append(calculate_chunked_measures(file, token_chunks))
+    profiler = get_profiler()
+    return(rows, profiler.drain() if profiler is not None else [], token_filter.drain_hits(), verifier.drain())
+
+# worker function of the process pool: preprocess one chunk of a long text file (see Batch_Tagging.chunk_text, the text of the chunk
+# is sent by the main process) and return its partial results (merged by the main process, see merge_partials),
+# with the profile records of the chunk (if profiling) and the counts of the token filter
+def process_chunk(filename, chunk, batch_size=64):
+    file = os.path.split(filename)[1]
+    tokens = next(profile_iter("tagging", tag_texts([chunk], myparameters, batch_size=batch_size, cache=token_cache), [file]))
+    partial = calculate_partial(file, tokens)
+    profiler = get_profiler()
+    return(partial, profiler.drain() if profiler is not None else [], token_filter.drain_hits(), verifier.drain())
+
+# the chunks a text file is processed in, cut once (None if it is not longer than chunk_chars characters, without reading it)
+def file_chunks(filename, chunk_chars=CHUNK_CHARS):
+    # (a file is at least as long in bytes as in characters)
+    if not chunk_chars or os.path.getsize(filename) <= chunk_chars:
+        return(None)
+    chunks = chunk_text(read_file(filename), chunk_chars)
+    return(chunks if len(chunks) > 1 else None)
+
+# the tasks of the workers, generated lazily in the order of the paths: batches of nb_files text files,
+# and one task per chunk of a long file (a long file is only read and cut when its turn comes)
+def file_tasks(text_files, nb_files, chunk_chars=CHUNK_CHARS):
+    batch = []
+    for filename in text_files:
+        chunks = file_chunks(filename, chunk_chars)
+        if chunks is None:
+            batch.append(filename)
+            if len(batch) == nb_files:
+                yield ("batch", batch)
+                batch = []
+            continue
+        # (the batch before the long file goes first, so that the rows stay in the order of the paths)
+        if batch:
+            yield ("batch", batch)
+            batch = []
+        for chunk_no in range(len(chunks)):
+            # (each task gets the text of its chunk, released here once it is sent)
+            chunk, chunks[chunk_no] = chunks[chunk_no], None
+            yield ("chunk", filename, chunk, chunk_no, len(chunks))
+    if batch:
+        yield ("batch", batch)
+
+# send what a worker recorded besides its results to the main process:
+# its profile records to the profiler, its counts to the token filter and its checks to the verifier
+def gather_worker_counts(records, hits, checks):
+    profiler = get_profiler()
+    if profiler is not None:
+        for record in records:
+            profiler.emit(record)
+    token_filter.add_hits(hits)
+    verifier.add(checks)
+
+# write one row of results: record it in the manifest (if any), which writes it into the results file,
+# so that the file is skipped on the next run; without a manifest, append it to fout
+# (flush: write it out right away, e.g., in watch mode)
+def write_row(fout, filename, row, manifest=None, signature=None, flush=False):
+    file = os.path.split(filename)[1]
+    print(file)
+    with stage("write", file):
+        # (buffered: the manifest is what makes the row last if the run stops)
+        if manifest is not None:
+            manifest.record(filename, signature, row)
+            if flush:
+                manifest.flush()
+        else:
+            fout.write(row)
+            if flush:
+                fout.flush()
 
 # recursive function that calls in the individual process file function for
 # every file in the directory passed as a argument
-def process_recursive(directory):
+# (with a manifest, only the files that are new or changed since the last run are processed)
+# (resources_args are the arguments of load_resources() in each worker)
+# (the files longer than chunk_chars characters are processed in chunks, in parallel with several workers)
+def process_recursive(directory, workers=1, batch_size=64, resources_args=(), manifest=None, chunk_chars=CHUNK_CHARS):
     # create control for text files, to check if there are any text files
     # in the give directory
     found_text_files = False
+    text_files = []
     # walk the subfolders in the given directory
     for dirpath, dirnames, files in os.walk(directory):
-        # for every file in all the subfolders
+        # for every file in all the subfolders, only keep the text files
         for name in files:
-            # call individual text processing function that returns a boolean
-            is_this_a_text_file = process_file(os.path.join(dirpath, name))
-            # if is_this_a_text_file is True that means a text file was found
-            # and processed
-            if is_this_a_text_file:
+            filename = os.path.join(dirpath, name)
+            if '.txt' in filename:
+                text_files.append(filename)
                 found_text_files = True
+    # process the files sorted by path, so that the rows come out in the same order on every run
+    text_files.sort()
+
+    # skip the files already processed (same size and mtime, or same content)
+    signatures = dict()
+    if manifest is not None:
+        for filename in text_files:
+            signature = manifest.signature_if_changed(filename)
+            if signature is not None:
+                signatures[filename] = signature
+        if len(signatures) < len(text_files):
+            print('{} files already processed, skipped.'.format(len(text_files)-len(signatures)))
+        # only keep the rows of the files skipped: the rows of the files no longer in the directory (or from another directory) are dropped,
+        # and so are the previous rows of the changed files (their new rows are written as they come)
+        nb_dropped = manifest.prune([filename for filename in text_files if filename not in signatures])
+        if nb_dropped:
+            print('{} files no longer in the directory or changed, their previous results dropped.'.format(nb_dropped))
+        text_files = [filename for filename in text_files if filename in signatures]
+
+    # one writer for the whole run (the manifest writes the rows, if any)
+    with open("Lexical_Complexity_results.txt", "a") if manifest is None else nullcontext() as fout:
+        if workers > 1 and text_files:
+            # split the files into batches (several per worker, to balance the load),
+            # and the long files into chunks, each chunk being a task of its own so that one long file does not hold up a worker
+            nb_files = max(1, min(64, math.ceil(len(text_files)/(workers*4))))
+            tasks = file_tasks(text_files, nb_files, chunk_chars)
+            # the workers share the spaCy model and the COCA rank index loaded once (see start_workers())
+            with start_workers(workers, resources_args) as executor:
+                # the tasks are submitted as they are generated, with at most 2 per worker in flight;
+                # the results are taken in the order of the tasks, whatever the order they are completed in,
+                # the ones completed ahead of their turn waiting in pending (at most 4 per worker)
+                pending = deque()
+                partials = []
+                while True:
+                    while sum(not future.done() for task, future in pending) < workers*2 and len(pending) < workers*4:
+                        task = next(tasks, None)
+                        if task is None:
+                            break
+                        if task[0] == "batch":
+                            pending.append((task, executor.submit(process_batch, task[1], batch_size)))
+                        else:
+                            # (the text of the chunk is only kept by its future)
+                            pending.append((task[:2] + (None,) + task[3:], executor.submit(process_chunk, task[1], task[2], batch_size)))
+                    if not pending:
+                        break
+                    if not pending[0][1].done():
+                        wait([future for task, future in pending if not future.done()], return_when=FIRST_COMPLETED)
+                        continue
+                    task, future = pending.popleft()
+                    results, records, hits, checks = future.result()
+                    gather_worker_counts(records, hits, checks)
+                    if task[0] == "batch":
+                        for filename, row in zip(task[1], results):
+                            write_row(fout, filename, row, manifest, signatures.get(filename))
+                    else:
+                        # a long file is written once the partial results of its last chunk are in
+                        filename, chunk, chunk_no, nb_chunks = task[1:]
+                        partials.append(results)
+                        if chunk_no == nb_chunks - 1:
+                            row = merge_partials(os.path.split(filename)[1], partials)
+                            write_row(fout, filename, row, manifest, signatures.get(filename))
+                            partials = []
+        else:
+            # preprocess the text files in batches through nlp.pipe (files are read lazily)
+            # (with --profile, the tagging time of each file includes reading it)
+            # (the long files are tagged in chunks, one after the other)
+            speeches = (read_file(filename) for filename in text_files)
+            files = [os.path.split(filename)[1] for filename in text_files]
+            tagged = tag_text_chunks(speeches, myparameters, chunk_chars, batch_size=batch_size, cache=token_cache)
+            for filename, token_chunks in zip(text_files, profile_iter("tagging", tagged, files, count=lambda token_chunks: sum(len(tokens) for tokens in token_chunks))):
+                row = calculate_chunked_measures(os.path.split(filename)[1], token_chunks)
+                write_row(fout, filename, row, manifest, signatures.get(filename))
     # notify the user that no text files were found in the given directory
     if not found_text_files:
         print('No text files found in the directory.')
 
-# check if a directory as entered as an argument when calling the script
-# Write lexical complexity measures for each file into a text file
-with open("Lexical_Complexity_results.txt", "a") as fout:
+# initializer of the workers of the watch mode, where they cannot be forked (see start_workers()):
+# Ctrl-C (or kill) stops the main process, which lets the workers finish
+def init_watch_worker(*resources_args):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    load_resources(*resources_args)
 
-    # Write the headings
-    fout.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format("ID", "MTLD", "MATTR50", "MATTR11", "Freq_Band1", "Freq_Band2", "Freq_Band3", "Freq_Band4", "Prop_Sophis_type", "Density"))
+# watch the directory (until Ctrl-C or kill) and process the text files as soon as they are written:
+# new or changed files are seen by the watcher (see Watch_Folder.py), wait until they are no longer written to (debounce seconds),
+# then go to the warm workers one file at a time, at most max_queue files at once (the others wait their turn),
+# and each row is appended to the results file as soon as it is in
+# (a file longer than chunk_chars characters is tagged in chunks, as by process_recursive, but by one worker, one chunk after the other)
+# (the files already processed, according to the manifest, are skipped, also when the watch starts)
+def watch_directory(directory, workers=1, batch_size=64, resources_args=(), manifest=None, backend="auto", interval=2.0, debounce=2.0, max_queue=64, chunk_chars=CHUNK_CHARS):
+    watcher = open_watcher(directory, backend, interval)
+    print('Watching {} ({}), Ctrl-C to stop.'.format(directory, type(watcher).__name__))
+    # stop the same way on kill (e.g., from a service manager) as on Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    debouncer = Debouncer(debounce)
+    # the files ready to be processed, in the order they were ready (each file once), and the files being processed
+    waiting = deque()
+    queued = set()
+    in_flight = dict()
+    last_report = 0
+    # the rows of the files no longer in the directory (or from another directory) are dropped
+    # (the rows of the files changed while the watch is off are replaced as they are processed again)
+    if manifest is not None:
+        nb_dropped = manifest.prune(scan_files(directory))
+        if nb_dropped:
+            print('{} files no longer in the directory, their results dropped.'.format(nb_dropped))
+    executor = start_workers(max(workers, 1), resources_args, watch=True)
+    fout = open("Lexical_Complexity_results.txt", "a") if manifest is None else None
+    try:
+        while True:
+            # wait for changes only when no file is being processed, otherwise check on the workers often
+            for filename in watcher.poll(0 if in_flight or waiting else min(interval, debounce, 1.0)):
+                debouncer.add(filename)
+            for filename in debouncer.ready():
+                if filename not in queued:
+                    waiting.append(filename)
+                    queued.add(filename)
+
+            # backpressure: the files ready wait here while max_queue files are being processed
+            while waiting and len(in_flight) < max_queue:
+                filename = waiting.popleft()
+                queued.discard(filename)
+                signature = manifest.signature_if_changed(filename) if manifest is not None else None
+                if manifest is not None and signature is None:
+                    continue
+                in_flight[executor.submit(process_batch, [filename], batch_size, chunk_chars)] = (filename, signature, time.monotonic())
+            if len(waiting) >= max_queue and time.monotonic() - last_report >= 10:
+                print('{} files waiting, {} being processed.'.format(len(waiting), len(in_flight)))
+                last_report = time.monotonic()
+
+            if in_flight:
+                done, _ = wait(list(in_flight), timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    filename, signature, start = in_flight.pop(future)
+                    try:
+                        rows, records, hits, checks = future.result()
+                    except Exception as error:
+                        # (the file is tried again once it changes, or on the next start)
+                        print('Failed to process {}: {}'.format(filename, error))
+                        continue
+                    gather_worker_counts(records, hits, checks)
+                    write_row(fout, filename, rows[0], manifest, signature, flush=True)
+                    print('    ({:.1f}s after it was ready)'.format(time.monotonic() - start))
+    except KeyboardInterrupt:
+        print('Stopping: finishing the {} files being processed.'.format(len(in_flight)))
+        for future in list(in_flight):
+            filename, signature, start = in_flight.pop(future)
+            try:
+                rows, records, hits, checks = future.result()
+            except Exception as error:
+                # (the file is tried again on the next start, the others are still written)
+                print('Failed to process {}: {}'.format(filename, error))
+                continue
+            gather_worker_counts(records, hits, checks)
+            write_row(fout, filename, rows[0], manifest, signature)
+    finally:
+        if fout is not None:
+            fout.close()
+        executor.shutdown(wait=True, cancel_futures=True)
+        watcher.close()
 
-if args.dir:
-    # if there's a directory provided, call recursive processing function
-    process_recursive(args.dir)
-else:
-    # if there's no argument for a directory, let the user know
-    print('You need to supply a directory with text files. Use --directory= after the script name')
\ No newline at end of file
+
+if __name__ == "__main__":
+
+    # Define the way we retrieve arguments sent to the script.
+    parser = argparse.ArgumentParser(description='Process Textfiles in a Directory')
+    parser.add_argument('--overwrite', action='store_true', help='forget the previous runs (results and manifest) and process every file again')
+    parser.add_argument('--directory', action="store", dest='dir', default='')
+    parser.add_argument('--batch-size', action="store", dest='batch_size', type=int, default=64, help='number of paragraphs sent to spaCy in each batch of nlp.pipe')
+    parser.add_argument('--token-cache', action="store", dest='token_cache', default='token_cache.sqlite', help='SQLite file caching the preprocessed tokens (empty to disable)')
+    parser.add_argument('--token-cache-size', action="store", dest='token_cache_size', type=int, default=1024, help='maximum size of the token cache in MB')
+    parser.add_argument('--workers', action="store", dest='workers', type=int, default=1, help='number of worker processes (they share one spaCy model where processes are forked, e.g., on Linux)')
+    parser.add_argument('--watch', action='store_true', help='keep watching the directory, and process new or changed text files as soon as they are written (Ctrl-C to stop)')
+    parser.add_argument('--watch-backend', action="store", dest='watch_backend', choices=BACKENDS, default='auto', help='inotify (Linux), polling, or auto (inotify if available)')
+    parser.add_argument('--poll-interval', action="store", dest='poll_interval', type=float, default=2.0, help='seconds between two scans of the directory with the polling backend')
+    parser.add_argument('--debounce', action="store", dest='debounce', type=float, default=2.0, help='seconds a file must not have been written to before it is processed')
+    parser.add_argument('--max-queue', action="store", dest='max_queue', type=int, default=64, help='maximum number of files processed at once in watch mode (the others wait their turn)')
+    parser.add_argument('--chunk-chars', action="store", dest='chunk_chars', type=int, default=CHUNK_CHARS, help='files longer than that (in characters) are tagged in chunks cut at paragraph boundaries (a longer paragraph at sentence ends), in parallel with several workers (0 to disable)')
+    parser.add_argument('--filter-rules', action="store", dest='filter_rules', default='', help='JSON file of the rules of the tokens left out of the measures (default: URLs and "___"), see Token_Filter.py')
+    parser.add_argument('--filter-report', action="store", dest='filter_report', default='Lexical_Complexity_filter.txt', help='file the number of tokens removed by each filter rule is written to')
+    parser.add_argument('--verify-sample', action="store", dest='verify_sample', type=float, default=0.0, help='fraction of the files (e.g., 0.01) whose measures are computed again by the reference implementations and compared, see Verify_Measures.py')
+    parser.add_argument('--verify-report', action="store", dest='verify_report', default='Lexical_Complexity_verify.txt', help='file the differences found by --verify-sample are written to')
+    parser.add_argument('--frequency-lists', action="store", dest='frequency_lists', default='', help='JSON file of other frequency lists (SUBTLEX, BNC, ...) to score in the same pass, see Frequency_Lists.py')
+    parser.add_argument('--output-format', action="store", dest='output_format', choices=list(OUTPUT_FORMATS), default='tsv', help='also write the results as csv, parquet or arrow (typed columns, needs pyarrow) next to the TSV file')
+    parser.add_argument('--group-by', action="append", dest='group_by', default=[], help='summarize the measures per group of files, a grouping being name:position[,name:position...] over the fields of the file names separated by "_" (e.g., L1:3; can be repeated)')
+    parser.add_argument('--quantiles', action="store", dest='quantiles', default=",".join(str(p) for p in QUANTILES), help='comma-separated quantiles estimated for each group')
+    parser.add_argument('--groups-output', action="store", dest='groups_output', default='Lexical_Complexity_groups.txt', help='file the group summaries are written to')
+    parser.add_argument('--profile', action='store_true', help='record the wall and CPU time, tokens and memory of each stage for each file')
+    parser.add_argument('--profile-output', action="store", dest='profile_output', default=None, help='file the profile is written to (default: Lexical_Complexity_profile.jsonl, or .prom for the prometheus format)')
+    parser.add_argument('--profile-format', action="store", dest='profile_format', choices=FORMATS, default='jsonl', help='jsonl: one line per stage and file; prometheus: totals per stage')
+    args = parser.parse_args()
+    groupings = [parse_grouping(spec) for spec in args.group_by]
+    # the other frequency lists, not loaded yet: their columns follow the COCA ones, and the main process merges their counts
+    # for the chunks of the long files (see merge_partials), also where only the workers load the lists (see start_workers())
+    frequency_lists = read_frequency_lists(args.frequency_lists) if args.frequency_lists else []
+    columns = COLUMNS + list_columns(frequency_lists)
+
+    # the filter of the main process (the workers load their own, and send their counts back)
+    token_filter = load_token_filter(args.filter_rules)
+    # the verifier of the main process (the workers check their own files, and send their checks back)
+    if not 0 <= args.verify_sample <= 1:
+        parser.error("--verify-sample must be between 0 and 1")
+    verifier = SampleVerifier(args.verify_sample, indices_band, cutoff=2000)
+
+    # check if a directory as entered as an argument when calling the script
+    if args.dir:
+        # Write lexical complexity measures for each file into a text file:
+        # the results are rebuilt from the manifest of the previous runs (unless --overwrite), with the headings on the first line
+        # (the rows computed with other filter rules are computed again; nothing is touched without a directory to process)
+        manifest = ResultsManifest("Lexical_Complexity_results.txt", "\t".join(columns) + "\n", overwrite=args.overwrite, settings=token_filter.fingerprint())
+        # Profile of the run (see Pipeline_Profiler.py)
+        profiler = None
+        if args.profile:
+            profile_output = args.profile_output or ("Lexical_Complexity_profile.prom" if args.profile_format == "prometheus" else "Lexical_Complexity_profile.jsonl")
+            profiler = Profiler(profile_output, args.profile_format)
+            set_profiler(profiler)
+        # with a single process, the model is loaded here; otherwise (and in watch mode) it is loaded when the workers start (see start_workers())
+        token_cache_args = (args.token_cache, args.token_cache_size)
+        resources_args = token_cache_args + (args.profile, args.frequency_lists, args.filter_rules, args.verify_sample)
+        if args.workers <= 1 and not args.watch:
+            load_resources(*token_cache_args, frequency_lists_path=args.frequency_lists, filter_rules_path=args.filter_rules, verify_sample=args.verify_sample)
+        # if there's a directory provided, call recursive processing function (or watch it)
+        try:
+            if args.watch:
+                watch_directory(args.dir, args.workers, args.batch_size, resources_args, manifest, args.watch_backend, args.poll_interval, args.debounce, args.max_queue, args.chunk_chars)
+            else:
+                process_recursive(args.dir, args.workers, args.batch_size, resources_args, manifest, args.chunk_chars)
+        finally:
+            manifest.close()
+            if token_cache is not None:
+                token_cache.close()
+            # export all the results (not only the ones of this run) in the requested format
+            if args.output_format != "tsv":
+                with ResultsWriter(results_path(format=args.output_format), args.output_format, columns) as writer:
+                    for row in manifest.rows():
+                        writer.write_row(row)
+                print("Results written to {}".format(writer.path))
+            # the number of tokens removed by each filter rule (in the files processed in this run)
+            token_filter.write_report(args.filter_report)
+            print("Filter report written to {}".format(args.filter_report))
+            # the files of this run checked against the reference implementations
+            if args.verify_sample > 0:
+                verifier.write_report(args.verify_report)
+                print(verifier.summary())
+                print("Verification report written to {}".format(args.verify_report))
+            # summarize the results file per group, reading it one row at a time (see Group_Statistics.py)
+            if groupings:
+                aggregate_results(manifest.results_path, groupings, args.groups_output, [float(p) for p in args.quantiles.split(",")])
+                print("Group summaries written to {}".format(args.groups_output))
+            if profiler is not None:
+                profiler.close()
+                print("Profile written to {}".format(profiler.output))
+    else:
+        # if there's no argument for a directory, let the user know
+        print('You need to supply a directory with text files. Use --directory= after the script name')
@@ -3,9 +3,12 @@ Lexical density
     = Number of content word tokens / Total number of tokens.
 '''
 
-from pylats import lats  # load the small dataset in spaCy and the corresponding trained parameters
-import pandas as pd
-from Switch_Tagging import switchtagging_Penn2COCA as switchtagging  # switch POS tagging mode (Penn => COCA_freql)
+import argparse
+from Switch_Tagging import switchtagging_Penn2COCA_list as switchtagging_list  # switch POS tagging mode (Penn => COCA_freql), for a whole token list
+from Batch_Tagging import tag_records  # batched preprocessing with nlp.pipe
+from Transcript_Reader import read_transcripts  # streaming reader for the transcript file
+from Token_Cache import TokenCache  # persistent cache of the preprocessed tokens
+from Token_Filter import load_token_filter  # the token filter shared by every script
 
 
 # Define a function to calculate lexical density (content tokens/tokens) for each file
@@ -33,6 +36,16 @@ def calculate_density(tokens_coca, content=["n", "v", "j", "r"]):
 
 if __name__ == "__main__":
 
+    # Optional token cache and rules of the tokens left out of the measures, e.g., python Lexical_Density.py --filter-rules=filter_rules.json
+    parser = argparse.ArgumentParser(description='Calculate the lexical density for each transcript of all_txt_transcript.txt (written to density.txt)')
+    parser.add_argument('--token-cache', action="store", dest='token_cache', default='token_cache.sqlite', help='SQLite file caching the preprocessed tokens (empty to disable)')
+    parser.add_argument('--token-cache-size', action="store", dest='token_cache_size', type=int, default=1024, help='maximum size of the token cache in MB')
+    parser.add_argument('--filter-rules', action="store", dest='filter_rules', default='', help='JSON file of the rules of the tokens left out of the measures (default: URLs and "___"), see Token_Filter.py')
+    args = parser.parse_args()
+
+    # pylats (and spaCy) is only imported to run the script, so that importing the measure function stays light
+    from pylats import lats  # load the small dataset in spaCy and the corresponding trained parameters
+
     ## Set up new parameters for lats, using the large dataset in SpaCy for preprocessing
     myparameters = lats.parameters()
     myparameters.model = "en_core_web_lg"
@@ -40,26 +53,30 @@ if __name__ == "__main__":
     myparameters.pos = "pos"
     myparameters.lemma = True
 
-    # Read in the text file (each line represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
-    txts = open("all_txt_transcript.txt", "r").readlines()
+    # Read in the text file lazily, one record at a time (each line represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
+    records = read_transcripts("all_txt_transcript.txt")
+
+    # Cache of the preprocessed tokens (size in MB), so that re-running on the same transcripts skips the tagging
+    token_cache = TokenCache(args.token_cache, max_bytes=args.token_cache_size*1024**2) if args.token_cache else None
+
+    # The tokens left out of the measures (see Token_Filter.py)
+    token_filter = load_token_filter(args.filter_rules)
 
-    # Write density in a txt file
-    with open("density.txt", "w") as fout:
-        fout.write("ID\tDensity\n")
-        for txt in txts:
-            id = txt.split("\t")[0]
-            speech = txt.split("\t")[1]
-            # Preprocess the speech, tokenized and lemmatized tokens with Penn POS tags
-            tokens = lats.Normalize(speech, myparameters).toks
-            # Switch POS tagging for each token pairs (from Penn to COCA POS tags)
-            #tokens_coca = [switchtagging(token) for token in tokens]
-            tokens_coca = []
-            for token in tokens:
-                # Remove the URL token that contains "https:"
-                if "https:" in token:
-                    continue
-                else:
-                    tokens_coca.append(switchtagging(token))
-            # Calculate density
-            density = calculate_density(tokens_coca)
-            fout.write("{}\t{}\n".format(id, density))
+    try:
+        # Write density in a txt file
+        with open("density.txt", "w") as fout:
+            fout.write("ID\tDensity\n")
+            # Preprocess the speeches in batches, tokenized and lemmatized tokens with Penn POS tags
+            for id, tokens in tag_records(records, myparameters, cache=token_cache):
+                # Switch POS tagging for each token pairs (from Penn to COCA POS tags)
+                #tokens_coca = [switchtagging(token) for token in tokens]
+                # Remove the tokens of the filter rules (by default the URL tokens and the "___" ones, as in every script)
+                tokens_clean = token_filter.filter(tokens)
+                tokens_coca = switchtagging_list(tokens_clean)
+                # Calculate density
+                density = calculate_density(tokens_coca)
+                fout.write("{}\t{}\n".format(id, density))
+    finally:
+        # write out the evictions of the token cache and close it, even if the run stops on an error
+        if token_cache is not None:
+            token_cache.close()
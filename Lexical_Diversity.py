@@ -2,31 +2,59 @@
 Lexical diversity: MTLD, MATTR
 '''
 
-from pylats import lats
-from taaled import ld  # if you see "plotnine has not been installed. To enable advanced data visualization features, please install plotnine.", just ignore it because this is just for visualization.
-
-## Set up new parameters for lats, using the large dataset in SpaCy for preprocessing
-myparameters = lats.parameters()
-myparameters.model = "en_core_web_lg"
-myparameters.nlp = lats.load_model(myparameters.model)
-myparameters.pos = "pos"
-myparameters.lemma = True
-
-# Read in the text file (each line represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
-txts = open("all_txt_transcript.txt", "r").readlines()
-
-# Write diversity measures into a text file for each file
-with open("diversity.txt", "w") as fout:
-    fout.write("ID\tMTLD\tMATTR50\tMATTR11\n")
-    for txt in txts:
-        id = txt.split("\t")[0]
-        speech = txt.split("\t")[1]
-        # Preprocess the speech, tokenized and lemmatized tokens with Penn POS tags
-        tokens = lats.Normalize(speech, myparameters).toks
-        # Calculate lexical diversity using different measures
-        Lexdiv = ld.lexdiv()
-        mtld = round(Lexdiv.MTLD(tokens),4)
-        mattr50 = round(Lexdiv.MATTR(tokens),4)
-        mattr11 = round(Lexdiv.MATTR(tokens, window_length=11),4)  # you can customize window length
-        # Write by file
-        fout.write("{}\t{}\t{}\t{}\n".format(id, mtld, mattr50, mattr11))
+import argparse
+from Diversity_Engine import calculate_diversity  # MTLD and MATTR in one pass (same values as taaled)
+from Batch_Tagging import tag_records  # batched preprocessing with nlp.pipe
+from Transcript_Reader import read_transcripts  # streaming reader for the transcript file
+from Token_Cache import TokenCache  # persistent cache of the preprocessed tokens
+from Token_Filter import load_token_filter  # the token filter shared by every script
+
+
+
+if __name__ == "__main__":
+
+    # Optional token cache and rules of the tokens left out of the measures, e.g., python Lexical_Diversity.py --filter-rules=filter_rules.json
+    parser = argparse.ArgumentParser(description='Calculate the lexical diversity (MTLD, MATTR) for each transcript of all_txt_transcript.txt (written to diversity.txt)')
+    parser.add_argument('--token-cache', action="store", dest='token_cache', default='token_cache.sqlite', help='SQLite file caching the preprocessed tokens (empty to disable)')
+    parser.add_argument('--token-cache-size', action="store", dest='token_cache_size', type=int, default=1024, help='maximum size of the token cache in MB')
+    parser.add_argument('--filter-rules', action="store", dest='filter_rules', default='', help='JSON file of the rules of the tokens left out of the measures (default: URLs and "___"), see Token_Filter.py')
+    args = parser.parse_args()
+
+    # pylats (and spaCy) is only imported to run the script, so that importing this module does not load the model
+    from pylats import lats
+
+    ## Set up new parameters for lats, using the large dataset in SpaCy for preprocessing
+    myparameters = lats.parameters()
+    myparameters.model = "en_core_web_lg"
+    myparameters.nlp = lats.load_model(myparameters.model)
+    myparameters.pos = "pos"
+    myparameters.lemma = True
+
+    # Read in the text file lazily, one record at a time (each line represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
+    records = read_transcripts("all_txt_transcript.txt")
+
+    # Cache of the preprocessed tokens (size in MB), so that re-running on the same transcripts skips the tagging
+    token_cache = TokenCache(args.token_cache, max_bytes=args.token_cache_size*1024**2) if args.token_cache else None
+
+    # The tokens left out of the measures (see Token_Filter.py)
+    token_filter = load_token_filter(args.filter_rules)
+
+    try:
+        # Write diversity measures into a text file for each file
+        with open("diversity.txt", "w") as fout:
+            fout.write("ID\tMTLD\tMATTR50\tMATTR11\n")
+            # Preprocess the speeches in batches, tokenized and lemmatized tokens with Penn POS tags
+            for id, tokens in tag_records(records, myparameters, cache=token_cache):
+                # Remove the tokens of the filter rules (by default the URL tokens and the "___" ones, as in every script)
+                tokens_clean = token_filter.filter(tokens)
+                # Calculate lexical diversity using different measures
+                diversity = calculate_diversity(tokens_clean, window_lengths=(50, 11))  # you can customize window lengths
+                mtld = round(diversity["MTLD"],4)
+                mattr50 = round(diversity["MATTR50"],4)
+                mattr11 = round(diversity["MATTR11"],4)
+                # Write by file
+                fout.write("{}\t{}\t{}\t{}\n".format(id, mtld, mattr50, mattr11))
+    finally:
+        # write out the evictions of the token cache and close it, even if the run stops on an error
+        if token_cache is not None:
+            token_cache.close()
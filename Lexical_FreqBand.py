@@ -3,9 +3,14 @@ Proportion of word tokens in each Frequency band
     = Number of word tokens in each frequency band / Total number of tokens.
 '''
 
-from pylats import lats  # load the small dataset in spaCy and the corresponding trained parameters
-import pandas as pd
-from Switch_Tagging import switchtagging_Penn2COCA as switchtagging  # switch POS tagging mode (Penn => COCA_freql)
+import argparse
+from Switch_Tagging import switchtagging_Penn2COCA_list as switchtagging_list  # switch POS tagging mode (Penn => COCA_freql), for a whole token list
+from Batch_Tagging import tag_records  # batched preprocessing with nlp.pipe
+from Transcript_Reader import read_transcripts  # streaming reader for the transcript file
+from Token_Cache import TokenCache  # persistent cache of the preprocessed tokens
+from Token_Filter import load_token_filter  # the token filter shared by every script
+from Frequency_Index import FrequencyIndex, as_frequency_index  # rank index of the ranked lemma_pos pairs
+from Frequency_Cache import load_lemmas_pos_ranked  # cached COCA word frequency list
 
 
 
@@ -14,7 +19,7 @@ def calculate_prop_freqband(tokens_coca, lemmas_pos_ranked, indices_band=[0, 500
     '''
         Input:
             * tokens_coca: a list of pairs of lemma token and COCA POS tag for one speech file, e.g., ["about_IN", "the_DT", "topic_NN", ...]
-            * lemmas_pos_ranked: the ranked lemma_pos pairs, a list of "lemma_pos" pairs (e.g., 'be_v') sorted by their frequency in the reference corpus 
+            * lemmas_pos_ranked: the ranked lemma_pos pairs, a list of "lemma_pos" pairs (e.g., 'be_v') sorted by their frequency in the reference corpus, or a FrequencyIndex built from it (faster when reused across files)
             * indices_band: indices for each frequency band of the COCA frequency list. By default, the frequency bands are 0-499, 500-2999, 3000-4999, 5000-
         Output:
             prop_freqband: proportion of word tokens in each frequency band, a dictionary of which structure is: {'band1':proportion, 'band2':proportion, ...}
@@ -27,26 +32,22 @@ def calculate_prop_freqband(tokens_coca, lemmas_pos_ranked, indices_band=[0, 500
     # Number of bands, including the frequency band out of the frequency list
     nb_bands = len(indices_band)
 
-    # A list containing lists of pairs of lemma and POS tag (each list is a frequency band within the frequency list)
-    lemma_pos_bands = list()
-    for i in range(nb_bands-1):
-        lemma_pos_bands.append(lemmas_pos_ranked[indices_band[i]:indices_band[i+1]])
+    # The (0-based) numbers of the bands each lemma_pos pair within the frequency list falls in, e.g., {'the_a': (0,), ...}
+    band_table = as_frequency_index(lemmas_pos_ranked).band_table(indices_band)
     
     # Set a list of band names, including the frequency band out of the frequency list
     band_nm = ["band{}".format(i+1) for i in range(nb_bands)]
     # Count tokens in the file for each band {'band1':0, 'band2':0, ...}
     count_band = {b: 0 for b in band_nm}
     for pair in tokens_coca:
-        temp = 0  # for marking the one out of the list
-        # for the ones within the frequency list
-        for i in range(nb_bands-1):
-            if pair in lemma_pos_bands[i]:
-                count_band["band{}".format(i+1)] += 1
-            else:
-                temp += 1
+        bands = band_table.get(pair)
         # for the ones out of the frequency list
-        if temp == nb_bands-1:
-            count_band["band{}".format(nb_bands)] += 1
+        if bands is None:
+            count_band[band_nm[nb_bands-1]] += 1
+        # for the ones within the frequency list
+        else:
+            for i in bands:
+                count_band[band_nm[i]] += 1
             
     # Proportion of tokens for each frequency band
     prop_freqband = dict()
@@ -59,6 +60,16 @@ def calculate_prop_freqband(tokens_coca, lemmas_pos_ranked, indices_band=[0, 500
 
 if __name__ == "__main__":
 
+    # Optional token cache and rules of the tokens left out of the measures, e.g., python Lexical_FreqBand.py --filter-rules=filter_rules.json
+    parser = argparse.ArgumentParser(description='Calculate the proportion of tokens in each COCA frequency band for each transcript of all_txt_transcript.txt (written to frequency_band.txt)')
+    parser.add_argument('--token-cache', action="store", dest='token_cache', default='token_cache.sqlite', help='SQLite file caching the preprocessed tokens (empty to disable)')
+    parser.add_argument('--token-cache-size', action="store", dest='token_cache_size', type=int, default=1024, help='maximum size of the token cache in MB')
+    parser.add_argument('--filter-rules', action="store", dest='filter_rules', default='', help='JSON file of the rules of the tokens left out of the measures (default: URLs and "___"), see Token_Filter.py')
+    args = parser.parse_args()
+
+    # pylats (and spaCy) is only imported to run the script, so that importing the measure function stays light
+    from pylats import lats  # load the small dataset in spaCy and the corresponding trained parameters
+
     ## Set up new parameters for lats, using the large dataset in SpaCy for preprocessing
     myparameters = lats.parameters()
     myparameters.model = "en_core_web_lg"
@@ -66,43 +77,46 @@ if __name__ == "__main__":
     myparameters.pos = "pos"
     myparameters.lemma = True
 
-    # Load the COCA word frequency list (Sheet 1)
-    lemma_freq_coca = pd.read_excel("COCA word frequency.xlsx", sheet_name=1)
+    # Load the COCA word frequency list (Sheet 1), compiled into a binary cache on the first run (see Frequency_Cache.py)
     # Set up the ranked lemma_pos pairs (e.g., ['the_a', 'be_v', 'and_c', 'a_a', 'of_i'])
-    lemmas_ranked = list(lemma_freq_coca["lemma"][:5000])
-    pos_ranked = list(lemma_freq_coca["PoS"][:5000])
-    lemmas_pos_ranked = [str(lemmas_ranked[i]).lower()+"_"+pos_ranked[i] for i in range(len(lemmas_ranked))]
+    lemmas_pos_ranked = load_lemmas_pos_ranked("COCA word frequency.xlsx", sheet_name=1, nb_ranked=5000)
+    # Build the rank index once for all the files
+    coca_index = FrequencyIndex(lemmas_pos_ranked)
 
     # Indices for each frequency band of the COCA frequency list
     indices_band = [0, 500, 3000, 5000]
 
-    # Read in the text file (each line represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
-    txts = open("all_txt_transcript.txt", "r").readlines()
-
-    # Write proportion of tokens for each frequency band in a txt file
-    with open("frequency_band.txt", "w") as fout:
-        # Write the headings
-        fout.write("ID\t")
-        for i in range(len(indices_band)):
-            fout.write("Freq_Band{}\t".format(i+1))
-        fout.write("\n")
-        for txt in txts:
-            id = txt.split("\t")[0]
-            speech = txt.split("\t")[1]
-            # Preprocess the speech, tokenized and lemmatized tokens with Penn POS tags
-            tokens = lats.Normalize(speech, myparameters).toks
-            # Switch POS tagging for each token pairs (from Penn to COCA POS tags)
-            #tokens_coca = [switchtagging(token) for token in tokens]
-            tokens_coca = []
-            for token in tokens:
-                # Remove the URL token that contains "https:"
-                if "https:" in token:
-                    continue
-                else:
-                    tokens_coca.append(switchtagging(token))
-            # Calculate proportion of tokens in each frequency band
-            prop_freqband = calculate_prop_freqband(tokens_coca, lemmas_pos_ranked, indices_band)
-            props_string = ""
-            for band,prop in prop_freqband.items():
-                props_string += str(prop)+"\t"
-            fout.write("{}\t{}\n".format(id, props_string))
+    # Read in the text file lazily, one record at a time (each line represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
+    records = read_transcripts("all_txt_transcript.txt")
+
+    # Cache of the preprocessed tokens (size in MB), so that re-running on the same transcripts skips the tagging
+    token_cache = TokenCache(args.token_cache, max_bytes=args.token_cache_size*1024**2) if args.token_cache else None
+
+    # The tokens left out of the measures (see Token_Filter.py)
+    token_filter = load_token_filter(args.filter_rules)
+
+    try:
+        # Write proportion of tokens for each frequency band in a txt file
+        with open("frequency_band.txt", "w") as fout:
+            # Write the headings
+            fout.write("ID\t")
+            for i in range(len(indices_band)):
+                fout.write("Freq_Band{}\t".format(i+1))
+            fout.write("\n")
+            # Preprocess the speeches in batches, tokenized and lemmatized tokens with Penn POS tags
+            for id, tokens in tag_records(records, myparameters, cache=token_cache):
+                # Switch POS tagging for each token pairs (from Penn to COCA POS tags)
+                #tokens_coca = [switchtagging(token) for token in tokens]
+                # Remove the tokens of the filter rules (by default the URL tokens and the "___" ones, as in every script)
+                tokens_clean = token_filter.filter(tokens)
+                tokens_coca = switchtagging_list(tokens_clean)
+                # Calculate proportion of tokens in each frequency band
+                prop_freqband = calculate_prop_freqband(tokens_coca, coca_index, indices_band)
+                props_string = ""
+                for band,prop in prop_freqband.items():
+                    props_string += str(prop)+"\t"
+                fout.write("{}\t{}\n".format(id, props_string))
+    finally:
+        # write out the evictions of the token cache and close it, even if the run stops on an error
+        if token_cache is not None:
+            token_cache.close()
@@ -0,0 +1,45 @@
+'''
+The lexical complexity measures as a library
+    => Every measure works on plain lists of "lemma_TAG" strings, so importing this module only loads NumPy:
+       pylats and spaCy are imported the first time texts are tagged (tag_texts / tag_records), and pandas only when
+       the COCA list has to be read from the Excel file (load_lemmas_pos_ranked, on the first run).
+
+Example:
+    from Lexical_Measures import *
+    coca_index = FrequencyIndex(load_lemmas_pos_ranked("COCA word frequency.xlsx"))
+    tokens_coca = switchtagging_Penn2COCA_list(tokens)        # tokens, e.g., ["about_IN", "the_DT", "topic_NN", ...]
+    calculate_prop_freqband(tokens_coca, coca_index, [0, 500, 3000, 5000])
+    calculate_sophis_type(tokens_coca, coca_index, cutoff=2000)
+    calculate_density(tokens_coca)
+    calculate_metrics(tokens_coca, coca_index, [0, 500, 3000, 5000], cutoff=2000)   # the three above in one pass
+    calculate_diversity(tokens, window_lengths=(50, 11))
+    vocabulary = TokenVocabulary()                            # the same from integer ids, with each different token stored once
+    calculate_diversity_codes(vocabulary.encode(tokens), window_lengths=(50, 11))
+'''
+
+from Switch_Tagging import switchtagging_Penn2COCA, switchtagging_Penn2COCA_list
+from Lexical_FreqBand import calculate_prop_freqband
+from Lexical_PropSophisTypes import calculate_sophis_type
+from Lexical_Density import calculate_density
+from Metrics_Kernel import calculate_metrics
+from Diversity_Engine import calculate_diversity, calculate_diversity_codes
+from Token_Vocabulary import TokenVocabulary
+from Frequency_Index import FrequencyIndex
+from Frequency_Cache import load_lemmas_pos_ranked
+from Batch_Tagging import tag_texts, tag_records
+
+__all__ = [
+    "switchtagging_Penn2COCA",
+    "switchtagging_Penn2COCA_list",
+    "calculate_prop_freqband",
+    "calculate_sophis_type",
+    "calculate_density",
+    "calculate_metrics",
+    "calculate_diversity",
+    "calculate_diversity_codes",
+    "TokenVocabulary",
+    "FrequencyIndex",
+    "load_lemmas_pos_ranked",
+    "tag_texts",
+    "tag_records",
+]
@@ -3,9 +3,14 @@ Proportion of sophisticated lexical items
     = Number of sophisticated word types (of which frequency rank > [cutoff]) / Total number of word types.
 '''
 
-from pylats import lats  # load the small dataset in spaCy and the corresponding trained parameters
-import pandas as pd
-from Switch_Tagging import switchtagging_Penn2COCA as switchtagging  # switch POS tagging mode (Penn => COCA_freql)
+import argparse
+from Switch_Tagging import switchtagging_Penn2COCA_list as switchtagging_list  # switch POS tagging mode (Penn => COCA_freql), for a whole token list
+from Batch_Tagging import tag_records  # batched preprocessing with nlp.pipe
+from Transcript_Reader import read_transcripts  # streaming reader for the transcript file
+from Token_Cache import TokenCache  # persistent cache of the preprocessed tokens
+from Token_Filter import load_token_filter  # the token filter shared by every script
+from Frequency_Index import FrequencyIndex, as_frequency_index  # rank index of the ranked lemma_pos pairs
+from Frequency_Cache import load_lemmas_pos_ranked  # cached COCA word frequency list
 
 
 
@@ -15,7 +20,7 @@ def calculate_sophis_type(tokens_coca, lemmas_pos_ranked, cutoff=2000):
         Input: 
             * tokens_coca: a list of pairs of lemma token and COCA POS tag for one speech file, e.g., ["about_i", "the_a", "topic_n", ...]
             * cutoff: the frequency rank cutoff for sophisticated word types
-            * lemmas_pos_ranked: the ranked lemma_pos pairs, a list of "lemma_pos" pairs (e.g., 'be_v') sorted by their frequency in the reference corpus 
+            * lemmas_pos_ranked: the ranked lemma_pos pairs, a list of "lemma_pos" pairs (e.g., 'be_v') sorted by their frequency in the reference corpus, or a FrequencyIndex built from it (faster when reused across files)
         Output: 
             proportion_sophis: Proportion of sophisticated types to total types: (types with frequency > [cutoff])/total types
     '''
@@ -23,7 +28,8 @@ def calculate_sophis_type(tokens_coca, lemmas_pos_ranked, cutoff=2000):
     # Number of total types in the speech file
     nb_types = len(set(tokens_coca))
     # Number of sophisticated types, if the frequency rank in COCA list greater than the cutoff
-    sophis_type_list = [pair for pair in tokens_coca if pair in lemmas_pos_ranked[cutoff:]]
+    sophis_set = as_frequency_index(lemmas_pos_ranked).sophisticated(cutoff)
+    sophis_type_list = [pair for pair in tokens_coca if pair in sophis_set]
     nb_sophis_types = len(set(sophis_type_list))
 
     # Proportion of sophisticated lemma types for the speech file
@@ -35,6 +41,16 @@ def calculate_sophis_type(tokens_coca, lemmas_pos_ranked, cutoff=2000):
 
 if __name__ == "__main__":
 
+    # Optional token cache and rules of the tokens left out of the measures, e.g., python Lexical_PropSophisTypes.py --filter-rules=filter_rules.json
+    parser = argparse.ArgumentParser(description='Calculate the proportion of sophisticated word types for each transcript of all_txt_transcript.txt (written to sophis_type.txt)')
+    parser.add_argument('--token-cache', action="store", dest='token_cache', default='token_cache.sqlite', help='SQLite file caching the preprocessed tokens (empty to disable)')
+    parser.add_argument('--token-cache-size', action="store", dest='token_cache_size', type=int, default=1024, help='maximum size of the token cache in MB')
+    parser.add_argument('--filter-rules', action="store", dest='filter_rules', default='', help='JSON file of the rules of the tokens left out of the measures (default: URLs and "___"), see Token_Filter.py')
+    args = parser.parse_args()
+
+    # pylats (and spaCy) is only imported to run the script, so that importing the measure function stays light
+    from pylats import lats  # load the small dataset in spaCy and the corresponding trained parameters
+
     ## Set up new parameters for lats, using the large dataset in SpaCy for preprocessing
     myparameters = lats.parameters()
     myparameters.model = "en_core_web_lg"
@@ -42,33 +58,36 @@ if __name__ == "__main__":
     myparameters.pos = "pos"
     myparameters.lemma = True
 
-    # Load the COCA word frequency list (Sheet 1)
-    lemma_freq_coca = pd.read_excel("COCA word frequency.xlsx", sheet_name=1)
+    # Load the COCA word frequency list (Sheet 1), compiled into a binary cache on the first run (see Frequency_Cache.py)
     # Set up the ranked lemma_pos pairs (e.g., ['the_a', 'be_v', 'and_c', 'a_a', 'of_i'])
-    lemmas_ranked = list(lemma_freq_coca["lemma"][:5000])
-    pos_ranked = list(lemma_freq_coca["PoS"][:5000])
-    lemmas_pos_ranked = [str(lemmas_ranked[i]).lower()+"_"+pos_ranked[i] for i in range(len(lemmas_ranked))]
-
-    # Read in the text file (each line represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
-    txts = open("all_txt_transcript.txt", "r").readlines()
-
-    # Write proporation of sophistication types in a txt file
-    with open("sophis_type.txt", "w") as fout:
-        fout.write("ID\tProp_Sophis_type)\n")
-        for txt in txts:
-            id = txt.split("\t")[0]
-            speech = txt.split("\t")[1]
-            # Preprocess the speech, tokenized and lemmatized tokens with Penn POS tags
-            tokens = lats.Normalize(speech, myparameters).toks
-            # Switch POS tagging for each token pairs (from Penn to COCA POS tags)
-            #tokens_coca = [switchtagging(token) for token in tokens]
-            tokens_coca = []
-            for token in tokens:
-                # Remove the URL token that contains "https:"
-                if "https:" in token:
-                    continue
-                else:
-                    tokens_coca.append(switchtagging(token))
-            # Calculate proportion of sophisticated types
-            proportion_sophis = calculate_sophis_type(tokens_coca, lemmas_pos_ranked, cutoff=2000)
-            fout.write("{}\t{}\n".format(id, proportion_sophis))
+    lemmas_pos_ranked = load_lemmas_pos_ranked("COCA word frequency.xlsx", sheet_name=1, nb_ranked=5000)
+    # Build the rank index once for all the files
+    coca_index = FrequencyIndex(lemmas_pos_ranked)
+
+    # Read in the text file lazily, one record at a time (each line represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
+    records = read_transcripts("all_txt_transcript.txt")
+
+    # Cache of the preprocessed tokens (size in MB), so that re-running on the same transcripts skips the tagging
+    token_cache = TokenCache(args.token_cache, max_bytes=args.token_cache_size*1024**2) if args.token_cache else None
+
+    # The tokens left out of the measures (see Token_Filter.py)
+    token_filter = load_token_filter(args.filter_rules)
+
+    try:
+        # Write proporation of sophistication types in a txt file
+        with open("sophis_type.txt", "w") as fout:
+            fout.write("ID\tProp_Sophis_type)\n")
+            # Preprocess the speeches in batches, tokenized and lemmatized tokens with Penn POS tags
+            for id, tokens in tag_records(records, myparameters, cache=token_cache):
+                # Switch POS tagging for each token pairs (from Penn to COCA POS tags)
+                #tokens_coca = [switchtagging(token) for token in tokens]
+                # Remove the tokens of the filter rules (by default the URL tokens and the "___" ones, as in every script)
+                tokens_clean = token_filter.filter(tokens)
+                tokens_coca = switchtagging_list(tokens_clean)
+                # Calculate proportion of sophisticated types
+                proportion_sophis = calculate_sophis_type(tokens_coca, coca_index, cutoff=2000)
+                fout.write("{}\t{}\n".format(id, proportion_sophis))
+    finally:
+        # write out the evictions of the token cache and close it, even if the run stops on an error
+        if token_cache is not None:
+            token_cache.close()
@@ -0,0 +1,187 @@
+'''
+Sweep of the measure parameters: several configurations (sophisticated-type cutoff, frequency-band layout, MATTR window lengths)
+scored from one tagging of each transcript (used by Lexical_Complexity.py --sweep)
+    => The tokens of a document are tagged, filtered and switched to COCA tags once, then every configuration is computed
+       from the same integer ids: MTLD and the density do not depend on the parameters and are computed once, MATTR once for
+       all the window lengths of the grid (one pass over the previous occurrences), the band counts once per band layout and
+       the sophisticated types once per cutoff, from one count of the types of the document.
+    => The values of a configuration are exactly the ones of a single run with its parameters.
+    => The results are written either as one wide table (one row per transcript, the columns of each configuration prefixed
+       with its name, e.g., "cutoff3000_bands0-500-3000-5000_mattr50-11_Prop_Sophis_type"), or as long-format rows
+       (ID, Configuration, Measure, Value).
+
+Grid (a JSON file given with --sweep=grid.json), either the values of each parameter (every combination is a configuration), e.g.:
+    {"cutoff": [1000, 2000, 3000], "indices_band": [[0, 500, 3000, 5000], [0, 1000, 3000, 5000]], "window_lengths": [[50, 11], [100]]}
+or a list of configurations (the parameters left out take their default values), e.g.:
+    [
+        {"name": "default"},
+        {"name": "wide_bands", "indices_band": [0, 1000, 5000], "cutoff": 3000, "window_lengths": [100]}
+    ]
+'''
+
+import itertools
+import json
+import numpy as np
+from Diversity_Engine import calculate_diversity_codes
+from Metrics_Kernel import band_matrix, content_flags, metrics_from_counts
+from Frequency_Index import as_frequency_index
+
+
+# The parameters of a configuration, and their default values (the ones of Lexical_Complexity.py)
+PARAMETERS = {"cutoff": 2000, "indices_band": [0, 500, 3000, 5000], "window_lengths": [50, 11]}
+
+# Output formats of the sweep: one row per transcript, or one row per transcript, configuration and measure
+SWEEP_FORMATS = ["wide", "long"]
+
+
+
+def configuration_name(configuration):
+    '''
+        Output:
+            name: a name describing the parameters, e.g., "cutoff2000_bands0-500-3000-5000_mattr50-11"
+    '''
+    return "cutoff{}_bands{}_mattr{}".format(configuration["cutoff"], "-".join(str(i) for i in configuration["indices_band"]),
+                                             "-".join(str(w) for w in configuration["window_lengths"]))
+
+
+def check_configuration(configuration):
+    '''
+        Input:
+            * configuration: a dictionary of parameters (see PARAMETERS), with an optional name
+        Output:
+            configuration: the configuration with every parameter (the default values for the ones left out) and a name
+    '''
+    unknown = set(configuration) - set(PARAMETERS) - {"name"}
+    if unknown:
+        raise ValueError("Unknown sweep parameters: {} (expected {})".format(", ".join(sorted(unknown)), ", ".join(PARAMETERS)))
+    checked = dict(PARAMETERS, **{key: value for key, value in configuration.items() if key != "name"})
+    if not isinstance(checked["cutoff"], int) or checked["cutoff"] < 0:
+        raise ValueError("Invalid cutoff: {!r}".format(checked["cutoff"]))
+    for key in ("indices_band", "window_lengths"):
+        values = checked[key]
+        if not isinstance(values, list) or not values or not all(isinstance(value, int) and value >= 0 for value in values):
+            raise ValueError("Invalid {}: {!r} (expected a list of integers)".format(key, values))
+    if list(checked["indices_band"]) != sorted(checked["indices_band"]):
+        raise ValueError("Invalid indices_band: {!r} (expected ascending indices)".format(checked["indices_band"]))
+    if 0 in checked["window_lengths"]:
+        raise ValueError("Invalid window_lengths: {!r}".format(checked["window_lengths"]))
+    checked["name"] = str(configuration.get("name") or configuration_name(checked))
+    if "\t" in checked["name"]:
+        raise ValueError("Invalid configuration name: {!r}".format(checked["name"]))
+    return checked
+
+
+def read_sweep_grid(path):
+    '''
+        Input:
+            * path: a JSON file with the values of each parameter, or a list of configurations (see the examples above)
+        Output:
+            configurations: the list of configurations, each one with a name and every parameter
+    '''
+    with open(path, "r") as fin:
+        grid = json.load(fin)
+    if isinstance(grid, dict):
+        unknown = set(grid) - set(PARAMETERS)
+        if unknown:
+            raise ValueError("Unknown sweep parameters in {}: {}".format(path, ", ".join(sorted(unknown))))
+        # The values of each parameter: a list of cutoffs, a list of band layouts and a list of lists of window lengths
+        values = []
+        for key, default in PARAMETERS.items():
+            options = grid.get(key, [default])
+            if not isinstance(options, list) or not options:
+                raise ValueError("The {} of the sweep grid in {} must be a non-empty list of values".format(key, path))
+            values.append(options)
+        configurations = [dict(zip(PARAMETERS, combination)) for combination in itertools.product(*values)]
+    elif isinstance(grid, list):
+        configurations = grid
+    else:
+        raise ValueError("The sweep grid in {} must be a dictionary of parameter values or a list of configurations".format(path))
+    configurations = [check_configuration(configuration) for configuration in configurations]
+    names = [configuration["name"] for configuration in configurations]
+    if not names or len(set(names)) < len(names):
+        raise ValueError("The configurations of the sweep grid in {} need names of their own".format(path))
+    return configurations
+
+
+class MeasureSweep:
+    '''
+        Input:
+            * configurations: the list of configurations (see read_sweep_grid)
+            * lemmas_pos_ranked: the ranked lemma_pos pairs of the COCA list, or a FrequencyIndex built from them
+            * content: a list of POS taggs that indicate content words (see calculate_density)
+    '''
+
+    def __init__(self, configurations, lemmas_pos_ranked, content=["n", "v", "j", "r"]):
+        self.configurations = [check_configuration(configuration) for configuration in configurations]
+        self.frequency_index = as_frequency_index(lemmas_pos_ranked)
+        self.content = content
+        # The different window lengths, band layouts and cutoffs of all the configurations, each computed once per document
+        self.window_lengths = list(dict.fromkeys(w for configuration in self.configurations for w in configuration["window_lengths"]))
+        self.layouts = list(dict.fromkeys(tuple(configuration["indices_band"]) for configuration in self.configurations))
+        self.cutoffs = list(dict.fromkeys(configuration["cutoff"] for configuration in self.configurations))
+
+    def measures(self, configuration):
+        '''
+            Output:
+                measures: the measures of a configuration, in the order of the columns of the results file, e.g.,
+                          ["MTLD", "MATTR50", "MATTR11", "Freq_Band1", ..., "Freq_Band4", "Prop_Sophis_type", "Density"]
+        '''
+        return (["MTLD"] + ["MATTR{}".format(w) for w in configuration["window_lengths"]]
+                + ["Freq_Band{}".format(i+1) for i in range(len(configuration["indices_band"]))] + ["Prop_Sophis_type", "Density"])
+
+    def columns(self, format="wide"):
+        '''
+            Output:
+                columns: the columns of the sweep results in the format (see SWEEP_FORMATS)
+        '''
+        if format == "long":
+            return ["ID", "Configuration", "Measure", "Value"]
+        return ["ID"] + ["{}_{}".format(configuration["name"], measure) for configuration in self.configurations for measure in self.measures(configuration)]
+
+    def calculate_codes(self, codes_clean, codes_coca, strings):
+        '''
+            Input:
+                * codes_clean: the ids of the tokens (with Penn POS tags) of one document, after the filter
+                * codes_coca: the ids of their pairs of lemma and COCA POS tag
+                * strings: the pair of each id of codes_coca (TokenVocabulary.strings)
+            Output:
+                values: for each configuration, the (rounded) values of its measures (see measures())
+        '''
+        diversity = calculate_diversity_codes(codes_clean, window_lengths=self.window_lengths)
+
+        # The types of the document and their number of tokens, the same for every configuration
+        type_ids, counts = np.unique(np.asarray(codes_coca, dtype=np.int64), return_counts=True)
+        types = [strings[type_id] for type_id in type_ids.tolist()]
+        nb_content_tokens = int(counts[content_flags(types, self.content)].sum())
+        count_bands = {layout: (counts @ band_matrix(types, self.frequency_index, layout)).tolist() for layout in self.layouts}
+        sophis_types = dict()
+        for cutoff in self.cutoffs:
+            sophis_set = self.frequency_index.sophisticated(cutoff)
+            sophis_types[cutoff] = [pair for pair in types if pair in sophis_set]
+
+        values = []
+        for configuration in self.configurations:
+            metrics = metrics_from_counts({
+                "nb_tokens": len(codes_coca),
+                "count_band": count_bands[tuple(configuration["indices_band"])],
+                "nb_content_tokens": nb_content_tokens,
+                "types": types,
+                "sophis_types": sophis_types[configuration["cutoff"]],
+            })
+            values.append([round(diversity["MTLD"], 4)] + [round(diversity["MATTR{}".format(w)], 4) for w in configuration["window_lengths"]]
+                          + list(metrics["prop_freqband"].values()) + [metrics["proportion_sophis"], metrics["density"]])
+        return values
+
+    def rows(self, id, values, format="wide"):
+        '''
+            Input:
+                * id: the ID of the document
+                * values: the values of each configuration (see calculate_codes)
+            Output:
+                rows: the rows of the sweep results of the document in the format (see columns())
+        '''
+        if format == "long":
+            return [[id, configuration["name"], measure, value]
+                    for configuration, config_values in zip(self.configurations, values)
+                    for measure, value in zip(self.measures(configuration), config_values)]
+        return [[id] + [value for config_values in values for value in config_values]]
@@ -0,0 +1,226 @@
+'''
+Fused metrics kernel: frequency bands, sophisticated types and density from one encoding of the COCA-tagged tokens
+    => Gives the same values as calculate_prop_freqband, calculate_sophis_type and calculate_density,
+       without walking the token list once per measure (and splitting every token on "_" again for the density).
+    => The tokens of a document are encoded once into integer type ids. The COCA bands, the sophisticated flag and the
+       content-word flag are looked up once per type (not per token), then the counts of all the measures come out of
+       one np.bincount over the ids and a few NumPy reductions.
+    => Tokens already interned as integer ids (see Token_Vocabulary.py) are counted directly, without going back to strings
+       (metrics_counts_codes).
+    => The counts (tokens per band, content tokens, types and sophisticated types) can also be computed for the chunks of a long
+       text separately and merged into exactly the counts of the whole text (see Batch_Tagging.chunk_text).
+'''
+# Example on how to run the benchmark against the separate measure functions
+#   python Metrics_Kernel.py
+#   python Metrics_Kernel.py --nb-tokens=200000
+
+import numpy as np
+from Diversity_Engine import encode_tokens
+from Frequency_Index import as_frequency_index
+
+
+
+def type_features(types, frequency_index, indices_band=[0, 500, 3000, 5000], cutoff=2000, content=["n", "v", "j", "r"]):
+    '''
+        Input:
+            * types: the different lemma_pos pairs of a document, in the order of their ids, e.g., ["about_i", "the_a", ...]
+            * frequency_index: the FrequencyIndex of the reference list
+            * indices_band, cutoff, content: the settings of the three measures (content=None for keys without POS tags)
+        Output:
+            * in_bands: an integer array (types x bands), 1 where the type falls in the band (the last band for the types out of the list)
+            * sophis: a boolean array, True for the sophisticated types (ranked at or after the cutoff)
+            * content_words: a boolean array, True for the content-word types
+    '''
+    sophis_set = frequency_index.sophisticated(cutoff)
+    sophis = np.fromiter((pair in sophis_set for pair in types), dtype=bool, count=len(types))
+    return band_matrix(types, frequency_index, indices_band), sophis, content_flags(types, content)
+
+
+def band_matrix(types, frequency_index, indices_band=[0, 500, 3000, 5000]):
+    '''
+        Output:
+            in_bands: an integer array (types x bands), 1 where the type falls in the band (the last band for the types out of the list)
+    '''
+    nb_bands = len(indices_band)
+    band_table = frequency_index.band_table(indices_band)
+    # (type id, band number) of each band a type falls in (a pair listed more than once may fall in several bands)
+    rows = []
+    columns = []
+    for type_id, pair in enumerate(types):
+        bands = band_table.get(pair, (nb_bands-1,))
+        rows.extend([type_id]*len(bands))
+        columns.extend(bands)
+    in_bands = np.zeros((len(types), nb_bands), dtype=np.int64)
+    in_bands[rows, columns] = 1
+    return in_bands
+
+
+def content_flags(types, content=["n", "v", "j", "r"]):
+    '''
+        Output:
+            content_words: a boolean array, True for the content-word types
+    '''
+    # The POS tag is taken the same way as calculate_density does (no density for keys without POS tags, content=None)
+    if content is None:
+        return np.zeros(len(types), dtype=bool)
+    return np.fromiter((pair.split("_")[1] in content for pair in types), dtype=bool, count=len(types))
+
+
+def type_counts(types, counts, nb_tokens, frequency_index, indices_band, cutoff, content):
+    '''
+        Input:
+            * types: the different lemma_pos pairs of a document, and counts: the number of tokens of each (a NumPy array)
+            * nb_tokens: the number of tokens of the document
+        Output:
+            counts: the counts the measures are computed from (see metrics_counts)
+    '''
+    in_bands, sophis, content_words = type_features(types, frequency_index, indices_band, cutoff, content)
+    # Number of tokens of each band and of the content words
+    return {
+        "nb_tokens": nb_tokens,
+        "count_band": (counts @ in_bands).tolist(),
+        "nb_content_tokens": int(counts[content_words].sum()),
+        "types": types,
+        "sophis_types": [pair for pair, is_sophis in zip(types, sophis.tolist()) if is_sophis],
+    }
+
+
+def metrics_counts(tokens_coca, lemmas_pos_ranked, indices_band=[0, 500, 3000, 5000], cutoff=2000, content=["n", "v", "j", "r"]):
+    '''
+        Input: as calculate_metrics()
+        Output:
+            counts: the counts the measures are computed from, which can be merged over the chunks of one text (see merge_metrics_counts),
+                    e.g., {"nb_tokens": 250, "count_band": [180, 40, 10, 20], "nb_content_tokens": 120, "types": [...], "sophis_types": [...]}
+    '''
+    frequency_index = as_frequency_index(lemmas_pos_ranked)
+    vocabulary = dict()
+    codes, nb_types = encode_tokens(tokens_coca, vocabulary)
+    # Number of tokens of each type
+    counts = np.bincount(codes, minlength=nb_types)
+    return type_counts(list(vocabulary), counts, len(tokens_coca), frequency_index, indices_band, cutoff, content)
+
+
+def metrics_counts_codes(codes, strings, lemmas_pos_ranked, indices_band=[0, 500, 3000, 5000], cutoff=2000, content=["n", "v", "j", "r"], key=None):
+    '''
+        Same as metrics_counts() for tokens already encoded as integer ids (see Token_Vocabulary.py)
+        Input:
+            * codes: the ids of the lemma_pos pairs of a document
+            * strings: the lemma_pos pair of each id (TokenVocabulary.strings)
+            * key: a function turning a pair into the key of the frequency list (e.g., the lemma alone), or None for the pair itself
+            * lemmas_pos_ranked, indices_band, cutoff, content: as calculate_metrics()
+        Output:
+            counts: the counts the measures are computed from (see metrics_counts)
+    '''
+    frequency_index = as_frequency_index(lemmas_pos_ranked)
+    type_ids, counts = np.unique(np.asarray(codes, dtype=np.int64), return_counts=True)
+    types = [strings[type_id] for type_id in type_ids.tolist()]
+    if key is not None:
+        # Several pairs can have the same key: their tokens are added up
+        keys = [key(pair) for pair in types]
+        key_ids = dict()
+        key_codes = [key_ids.setdefault(k, len(key_ids)) for k in keys]
+        counts = np.bincount(key_codes, weights=counts, minlength=len(key_ids)).astype(np.int64)
+        types = list(key_ids)
+    return type_counts(types, counts, len(codes), frequency_index, indices_band, cutoff, content)
+
+
+def merge_metrics_counts(partials):
+    '''
+        Input:
+            * partials: the counts of the consecutive chunks of one text (see metrics_counts)
+        Output:
+            counts: the counts of the whole text
+    '''
+    partials = list(partials)
+    if len(partials) == 1:
+        return partials[0]
+    count_band = [0]*len(partials[0]["count_band"])
+    types = set()
+    sophis_types = set()
+    for partial in partials:
+        count_band = [total + count for total, count in zip(count_band, partial["count_band"])]
+        types.update(partial["types"])
+        sophis_types.update(partial["sophis_types"])
+    return {
+        "nb_tokens": sum(partial["nb_tokens"] for partial in partials),
+        "count_band": count_band,
+        "nb_content_tokens": sum(partial["nb_content_tokens"] for partial in partials),
+        "types": types,
+        "sophis_types": sophis_types,
+    }
+
+
+def metrics_from_counts(counts):
+    '''
+        Output:
+            metrics: the (rounded) measures of the counts (see calculate_metrics)
+    '''
+    # Python ints, so that the proportions are exactly the ones of the separate functions
+    nb_pairs = counts["nb_tokens"]
+    prop_freqband = dict()
+    for i, ct in enumerate(counts["count_band"]):
+        prop_freqband["band{}".format(i+1)] = round(ct/nb_pairs, 4)
+
+    return {
+        "prop_freqband": prop_freqband,
+        "proportion_sophis": round(len(counts["sophis_types"])/len(counts["types"]), 4),
+        "density": round(counts["nb_content_tokens"]/nb_pairs, 4),
+    }
+
+
+def calculate_metrics(tokens_coca, lemmas_pos_ranked, indices_band=[0, 500, 3000, 5000], cutoff=2000, content=["n", "v", "j", "r"]):
+    '''
+        Input:
+            * tokens_coca: a list of pairs of lemma token and COCA POS tag for one speech file, e.g., ["about_i", "the_a", "topic_n", ...]
+            * lemmas_pos_ranked: the ranked lemma_pos pairs, or a FrequencyIndex built from them (faster when reused across files)
+            * indices_band: indices for each frequency band of the COCA frequency list (see calculate_prop_freqband)
+            * cutoff: the frequency rank cutoff for sophisticated word types (see calculate_sophis_type)
+            * content: a list of POS taggs that indicate content words (see calculate_density)
+        Output:
+            metrics: a dictionary of the (rounded) measures, e.g., {"prop_freqband": {'band1': 0.7312, ...}, "proportion_sophis": 0.1024, "density": 0.4816}
+    '''
+    return metrics_from_counts(metrics_counts(tokens_coca, lemmas_pos_ranked, indices_band, cutoff, content))
+
+
+
+if __name__ == "__main__":
+    # Benchmark against the separate measure functions, on a random corpus (Zipf-like word frequencies)
+    import argparse
+    import time
+    from Lexical_FreqBand import calculate_prop_freqband
+    from Lexical_PropSophisTypes import calculate_sophis_type
+    from Lexical_Density import calculate_density
+    from Frequency_Index import FrequencyIndex
+
+    parser = argparse.ArgumentParser(description='Compare the fused metrics kernel with the separate measure functions (values and running time)')
+    parser.add_argument('--nb-tokens', action="store", dest='nb_tokens', type=int, default=20000, help='number of tokens of the random text')
+    parser.add_argument('--repeat', action="store", dest='repeat', type=int, default=5, help='number of timed runs (the best one is kept)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pos = np.array(list("nvjraicdpx"))
+    # A random 5000-pair reference list, and a text whose pairs are partly out of it
+    coca_index = FrequencyIndex(["w{}_{}".format(i, pos[i % len(pos)]) for i in range(5000)])
+    words = rng.zipf(1.3, args.nb_tokens) % 20000
+    tokens_coca = ["w{}_{}".format(word, pos[word % len(pos)]) for word in words]
+
+    def best_time(function):
+        times = []
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            value = function()
+            times.append(time.perf_counter() - start)
+        return value, min(times)
+
+    def separate_metrics(tokens):
+        return {
+            "prop_freqband": calculate_prop_freqband(tokens, coca_index),
+            "proportion_sophis": calculate_sophis_type(tokens, coca_index),
+            "density": calculate_density(tokens),
+        }
+
+    reference, reference_time = best_time(lambda: separate_metrics(tokens_coca))
+    values, kernel_time = best_time(lambda: calculate_metrics(tokens_coca, coca_index))
+    for measure in reference:
+        print("{}\tseparate={}\tkernel={}\t{}".format(measure, reference[measure], values[measure], "ok" if reference[measure] == values[measure] else "MISMATCH"))
+    print("separate: {:.4f}s\tkernel: {:.4f}s\tspeedup: x{:.1f}".format(reference_time, kernel_time, reference_time/kernel_time))
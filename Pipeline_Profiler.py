@@ -0,0 +1,207 @@
+'''
+Opt-in instrumentation of the lexical complexity pipeline (--profile in Lexical_Complexity.py and Lexical_Complexity_directory.py)
+    => Each stage (loading the spaCy model, tagging, token filtering, POS switch, diversity, COCA lookups and density, writing)
+       is timed per file: wall time, CPU time, number of tokens and change of the resident memory.
+    => The records are written as JSON lines (one per stage and file) as they come, or summed per stage into a
+       Prometheus-style text file when the run ends. Hooks (any callable taking a record) see every record, e.g., to spot
+       pathological transcripts while the run goes on.
+    => Without an active profiler, stage() and profile_iter() cost next to nothing and record nothing.
+
+Usage from code:
+    profiler = Profiler("profile.jsonl")
+    profiler.add_hook(lambda record: print(record) if record["wall_s"] > 1 else None)
+    set_profiler(profiler)
+    with stage("tagging", file="testfile1.txt") as info:
+        tokens = ...
+        info["tokens"] = len(tokens)
+    profiler.close()
+'''
+
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+
+# Output formats of the profiler
+FORMATS = ["jsonl", "prometheus"]
+
+# Prefix of the Prometheus metrics
+METRIC_PREFIX = "lexical_complexity_stage"
+
+# The profiler the stages are recorded with (None: profiling is off)
+_profiler = None
+
+
+
+def current_rss():
+    '''
+        Output:
+            rss: the current resident set size of the process in bytes (the peak one where /proc is not available, e.g., on macOS)
+    '''
+    try:
+        with open("/proc/self/statm", "r") as fin:
+            return int(fin.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak*1024
+
+
+class Profiler:
+    '''
+        Input:
+            * output: the file the records are written to, or None to keep them in memory (see drain())
+            * format: "jsonl" (one record per line, written right away) or "prometheus" (totals per stage, written by close())
+    '''
+
+    def __init__(self, output=None, format="jsonl"):
+        if format not in FORMATS:
+            raise ValueError("Unknown profile format: {} (expected one of {})".format(format, ", ".join(FORMATS)))
+        self.output = output
+        self.format = format
+        self.hooks = []
+        # Records kept in memory when there is no output file
+        self.records = []
+        # Totals per stage: {stage: {"calls":, "wall_s":, "cpu_s":, "tokens":, "rss_delta_bytes":}}
+        self.totals = dict()
+        self._fout = open(output, "w") if output is not None and format == "jsonl" else None
+
+    def add_hook(self, hook):
+        '''
+            Call hook(record) for every record from now on
+        '''
+        self.hooks.append(hook)
+
+    def emit(self, record):
+        '''
+            Record one stage of one file, e.g., {"stage": "tagging", "file": "testfile1.txt", "wall_s": 0.12, "cpu_s": 0.11, "tokens": 250, "rss_delta_bytes": 0}
+        '''
+        totals = self.totals.setdefault(record["stage"], {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "tokens": 0, "rss_delta_bytes": 0})
+        totals["calls"] += 1
+        totals["wall_s"] += record["wall_s"]
+        totals["cpu_s"] += record["cpu_s"]
+        totals["tokens"] += record.get("tokens") or 0
+        totals["rss_delta_bytes"] += record["rss_delta_bytes"]
+        if self._fout is not None:
+            self._fout.write(json.dumps(record) + "\n")
+        elif self.output is None:
+            self.records.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    def _start(self):
+        return current_rss(), time.process_time(), time.perf_counter()
+
+    def _record(self, name, file, tokens, start):
+        rss, cpu, wall = start
+        self.emit({
+            "stage": name,
+            "file": file,
+            "wall_s": time.perf_counter() - wall,
+            "cpu_s": time.process_time() - cpu,
+            "tokens": tokens,
+            "rss_delta_bytes": current_rss() - rss,
+        })
+
+    @contextmanager
+    def stage(self, name, file=None, tokens=None):
+        '''
+            Time the body of the with statement as one stage of one file.
+            The number of tokens can be given here or set in the yielded dictionary (info["tokens"] = ...).
+        '''
+        info = {"tokens": tokens}
+        start = self._start()
+        try:
+            yield info
+        finally:
+            self._record(name, file, info["tokens"], start)
+
+    def iter(self, name, iterable, files=None, label=None, count=len):
+        '''
+            Time the wait for each item of iterable (e.g., the token lists coming out of tag_texts) as one stage of one file
+                * files: the files of the items, in the same order
+                * label: or a function giving the file of an item, e.g., lambda record: record[0] for the (id, tokens) pairs of tag_records
+                * count: a function giving the number of tokens of an item
+        '''
+        iterator = iter(iterable)
+        files = iter(files) if files is not None else None
+        while True:
+            start = self._start()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            file = label(item) if label is not None else next(files, None) if files is not None else None
+            self._record(name, file, count(item), start)
+            yield item
+
+    def drain(self):
+        '''
+            Output:
+                records: the records kept in memory since the last call (e.g., to send them from a worker process to the main one)
+        '''
+        records = self.records
+        self.records = []
+        return records
+
+    def prometheus(self):
+        '''
+            Output:
+                text: the totals per stage in the Prometheus text format
+        '''
+        metrics = [
+            ("calls_total", "calls", "Number of files that went through the stage."),
+            ("wall_seconds_total", "wall_s", "Wall time spent in the stage."),
+            ("cpu_seconds_total", "cpu_s", "CPU time spent in the stage."),
+            ("tokens_total", "tokens", "Number of tokens handled by the stage."),
+            ("rss_delta_bytes", "rss_delta_bytes", "Change of the resident memory over the stage (summed over the files)."),
+        ]
+        lines = []
+        for suffix, key, help in metrics:
+            name = "{}_{}".format(METRIC_PREFIX, suffix)
+            lines.append("# HELP {} {}".format(name, help))
+            lines.append("# TYPE {} {}".format(name, "gauge" if key == "rss_delta_bytes" else "counter"))
+            for stage_name in sorted(self.totals):
+                lines.append('{}{{stage="{}"}} {}'.format(name, stage_name, self.totals[stage_name][key]))
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        if self._fout is not None:
+            self._fout.close()
+            self._fout = None
+        elif self.output is not None and self.format == "prometheus":
+            with open(self.output, "w") as fout:
+                fout.write(self.prometheus())
+
+
+def set_profiler(profiler):
+    '''
+        Make profiler the one the stages are recorded with (None turns profiling off)
+    '''
+    global _profiler
+    _profiler = profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+def stage(name, file=None, tokens=None):
+    '''
+        Same as Profiler.stage() with the active profiler, or a no-op when profiling is off
+    '''
+    if _profiler is None:
+        return nullcontext({"tokens": tokens})
+    return _profiler.stage(name, file, tokens)
+
+
+def profile_iter(name, iterable, files=None, label=None, count=len):
+    '''
+        Same as Profiler.iter() with the active profiler, or iterable itself when profiling is off
+    '''
+    if _profiler is None:
+        return iterable
+    return _profiler.iter(name, iterable, files, label, count)
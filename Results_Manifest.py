@@ -0,0 +1,193 @@
+'''
+Manifest of the files already processed by Lexical_Complexity_directory.py
+    => For each input file, one JSON line records its path, size, mtime and SHA-256 next to its row of results,
+       so that a rerun only processes new or changed files, and a run that died halfway can resume where it stopped.
+    => The results file is rebuilt from the manifest (one header, one row per file, sorted by path),
+       so it never ends up with duplicated headers or rows: the row of a changed file is appended, and its previous (stale) row
+       is dropped when the file is rebuilt (by prune, by close, or once the stale rows outnumber the others, so that each row
+       costs O(1) writes on average); until then, the last row of an ID is the current one.
+       The files no longer in the directory processed (deleted, or from another --directory) are dropped (see prune).
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+
+
+
+def file_signature(filename):
+    '''
+        Output:
+            signature: a dictionary with the size, the mtime (ns) and the SHA-256 of the file
+    '''
+    stat = os.stat(filename)
+    sha = hashlib.sha256()
+    with open(filename, "rb") as fin:
+        for block in iter(lambda: fin.read(1 << 20), b""):
+            sha.update(block)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha.hexdigest()}
+
+
+def replace_file(path, lines):
+    '''
+        Write the lines into a temporary file next to path, then move it into place (readers never see a partial file).
+    '''
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-")
+    with os.fdopen(fd, "w") as fout:
+        fout.writelines(lines)
+    # mkstemp creates the file readable by the owner only, give it the usual permissions
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_path, 0o666 & ~umask)
+    os.replace(tmp_path, path)
+
+
+class ResultsManifest:
+    '''
+        Input:
+            * results_path: the results file (e.g., "Lexical_Complexity_results.txt")
+            * header: the heading line of the results file
+            * manifest_path: where to keep the manifest. By default, next to the results file ("<results_path>.manifest")
+            * overwrite: if True, forget the previous runs and rebuild the results from scratch
+            * settings: a string describing the settings the rows depend on (e.g., the token filter rules),
+                        the rows recorded with other settings being processed again
+    '''
+
+    def __init__(self, results_path, header, manifest_path=None, overwrite=False, settings=None):
+        self.results_path = results_path
+        self.header = header
+        self.settings = settings
+        self.manifest_path = manifest_path if manifest_path is not None else results_path + ".manifest"
+        # The last entry recorded for each (absolute) path: {path: {"size":, "mtime_ns":, "sha256":, "row":}}
+        self.entries = dict()
+
+        if overwrite:
+            for path in (self.results_path, self.manifest_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        elif os.path.exists(self.manifest_path):
+            self._load()
+        elif os.path.exists(self.results_path) and os.path.getsize(self.results_path) > 0:
+            # Results written before the manifest existed cannot be matched to their files, so keep them aside
+            os.replace(self.results_path, self.results_path + ".old")
+            print("Previous results (without a manifest) moved to {}".format(self.results_path + ".old"))
+
+        # Start from a clean results file: the header and the rows of the files already processed
+        # (the rows of the new files are appended to it)
+        self._results = None
+        # Number of rows of the results file replaced by a later row of the same file (dropped when the file is rebuilt)
+        self.nb_stale = 0
+        self.write_results()
+        self._fout = open(self.manifest_path, "a")
+
+    def _load(self):
+        nb_columns = self.header.count("\t") + 1
+        with open(self.manifest_path, "rb") as fin:
+            data = fin.read()
+        # A crash may leave a partial last line: drop it, so that new entries start on a line of their own
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            with open(self.manifest_path, "r+b") as fout:
+                fout.truncate(end)
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            # Rows written with other columns (e.g., before a frequency list was added) are processed again
+            if entry["row"].count("\t") + 1 != nb_columns:
+                continue
+            if entry.pop("settings", None) != self.settings:
+                continue
+            self.entries[entry.pop("path")] = entry
+
+    def signature_if_changed(self, filename):
+        '''
+            Output:
+                signature: the signature of the file (see file_signature) if it is new or changed since it was processed, or None if it is up to date
+        '''
+        entry = self.entries.get(os.path.abspath(filename))
+        if entry is not None:
+            stat = os.stat(filename)
+            if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                return None
+        signature = file_signature(filename)
+        if entry is not None and entry["sha256"] == signature["sha256"]:
+            # Touched but identical: only remember the new mtime
+            self.record(filename, signature, entry["row"])
+            return None
+        return signature
+
+    def record(self, filename, signature, row):
+        '''
+            Record that the file with the given signature gave this row of results (written to disk right away),
+            and append the row to the results file (buffered, see flush), the previous row of the file if any becoming stale.
+        '''
+        path = os.path.abspath(filename)
+        previous = self.entries.get(path)
+        entry = dict(signature, row=row)
+        self.entries[path] = entry
+        self._fout.write(json.dumps(self._line(path)) + "\n")
+        self._fout.flush()
+        os.fsync(self._fout.fileno())
+        if previous is not None and previous["row"] == row:
+            return
+        self._results.write(row)
+        if previous is not None:
+            # A changed file: its previous row is dropped once the stale rows outnumber the current ones
+            self.nb_stale += 1
+            if self.nb_stale > len(self.entries):
+                self.write_results()
+
+    def prune(self, filenames):
+        '''
+            Forget the files recorded that are not among filenames (e.g., the files of the directory processed: the deleted files,
+            or the files of another directory, are dropped), and rewrite the results file without their rows.
+            Output:
+                nb_dropped: the number of files forgotten
+        '''
+        paths = set(os.path.abspath(filename) for filename in filenames)
+        dropped = [path for path in self.entries if path not in paths]
+        for path in dropped:
+            del self.entries[path]
+        if dropped or self.nb_stale:
+            self.write_results()
+        return len(dropped)
+
+    def _line(self, path):
+        # The line of the manifest of a recorded file (with the settings, if any)
+        line = dict(self.entries[path], path=path)
+        if self.settings is not None:
+            line["settings"] = self.settings
+        return line
+
+    def rows(self):
+        '''
+            Output:
+                rows: the rows of results of the recorded files, sorted by path
+        '''
+        return [self.entries[path]["row"] for path in sorted(self.entries)]
+
+    def write_results(self):
+        '''
+            Rewrite the results file: the header, then one row per recorded file, sorted by path.
+        '''
+        if self._results is not None:
+            self._results.close()
+        replace_file(self.results_path, [self.header] + self.rows())
+        self.nb_stale = 0
+        self._results = open(self.results_path, "a")
+
+    def flush(self):
+        '''
+            Write the rows recorded so far into the results file (e.g., for the readers of the results of a watch)
+        '''
+        self._results.flush()
+
+    def close(self):
+        self._fout.close()
+        # Compact the manifest to one line per file
+        replace_file(self.manifest_path, [json.dumps(self._line(path)) + "\n" for path in sorted(self.entries)])
+        self.write_results()
+        self._results.close()
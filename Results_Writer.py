@@ -0,0 +1,132 @@
+'''
+Output sinks for the results (one row of measures per file or transcript)
+    => "tsv" (the default) writes the same text file as before: a heading line, then one line per row with the values separated by "\t".
+       "csv" writes the same table with the csv module. "parquet" and "arrow" (Arrow IPC file) write typed columns
+       (ID as a string, the measures as 64-bit floats) with pyarrow, which is only imported for these two formats.
+    => The rows are buffered in memory and written buffer_rows at a time (one row group / record batch per flush
+       for parquet and arrow), instead of one write per row.
+'''
+
+import csv
+
+
+# The columns of the results file
+COLUMNS = ["ID", "MTLD", "MATTR50", "MATTR11", "Freq_Band1", "Freq_Band2", "Freq_Band3", "Freq_Band4", "Prop_Sophis_type", "Density"]
+
+# Output formats, and the extension of their files
+FORMATS = {"tsv": ".txt", "csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+
+
+
+def format_row(values):
+    '''
+        Input:
+            values: the values of one row, e.g., ["testfile1", 68.556, 0.7612, ...]
+        Output:
+            row: the line of the TSV results file, e.g., "testfile1\t68.556\t0.7612\t...\n"
+    '''
+    return "\t".join(str(value) for value in values) + "\n"
+
+
+def parse_row(row):
+    '''
+        Input:
+            row: a line of the TSV results file
+        Output:
+            values: the ID (string) followed by the measures (floats)
+    '''
+    fields = row.rstrip("\n").split("\t")
+    return [fields[0]] + [float(field) for field in fields[1:]]
+
+
+def results_path(basename="Lexical_Complexity_results", format="tsv"):
+    '''
+        Output:
+            path: the results file for the format, e.g., "Lexical_Complexity_results.parquet"
+    '''
+    return basename + FORMATS[format]
+
+
+class ResultsWriter:
+    '''
+        Input:
+            * path: the output file (overwritten)
+            * format: one of FORMATS
+            * columns: the names of the columns (the first one is the ID, the others are measures)
+            * buffer_rows: number of rows kept in memory before they are written
+            * nb_key_columns: number of columns of strings at the start of the rows (the ID, and e.g. the configuration and measure of long-format rows)
+    '''
+
+    def __init__(self, path, format="tsv", columns=COLUMNS, buffer_rows=1000, nb_key_columns=1):
+        if format not in FORMATS:
+            raise ValueError("Unknown output format: {} (expected one of {})".format(format, ", ".join(FORMATS)))
+        self.path = path
+        self.format = format
+        self.columns = list(columns)
+        self.buffer_rows = buffer_rows
+        self.nb_key_columns = nb_key_columns
+        self._buffer = []
+
+        if format in ("tsv", "csv"):
+            self._fout = open(path, "w", newline="")
+            if format == "tsv":
+                self._fout.write("\t".join(self.columns) + "\n")
+            else:
+                self._csv = csv.writer(self._fout)
+                self._csv.writerow(self.columns)
+        else:
+            try:
+                import pyarrow as pa  # only needed for the columnar formats
+            except ImportError:
+                raise ImportError("The {} output format needs pyarrow (pip install pyarrow)".format(format))
+            self._pa = pa
+            self._schema = pa.schema([(column, pa.string()) for column in self.columns[:nb_key_columns]]
+                                     + [(column, pa.float64()) for column in self.columns[nb_key_columns:]])
+            if format == "parquet":
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(path, self._schema)
+
+    def write(self, values):
+        '''
+            Add one row (a list of values in the order of the columns), written once the buffer is full
+        '''
+        self._buffer.append(values)
+        if len(self._buffer) >= self.buffer_rows:
+            self.flush()
+
+    def write_row(self, row):
+        '''
+            Add one line of the TSV results file (see parse_row)
+        '''
+        self.write(parse_row(row))
+
+    def flush(self):
+        if not self._buffer:
+            return
+        if self.format == "tsv":
+            self._fout.writelines(format_row(values) for values in self._buffer)
+            self._fout.flush()
+        elif self.format == "csv":
+            self._csv.writerows(self._buffer)
+            self._fout.flush()
+        else:
+            data = dict()
+            for i, column in enumerate(self.columns):
+                data[column] = [str(values[i]) if i < self.nb_key_columns else float(values[i]) for values in self._buffer]
+            self._writer.write_table(self._pa.Table.from_pydict(data, schema=self._schema))
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        if self.format in ("tsv", "csv"):
+            self._fout.close()
+        else:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
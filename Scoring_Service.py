@@ -0,0 +1,301 @@
+'''
+Long-running scoring service: keeps the spaCy model and the COCA rank index loaded, and scores texts on request
+    => The scripts load en_core_web_lg every time they start (several seconds). The service loads it once at startup
+       (the workers share it, see Lexical_Complexity_directory.start_workers), so a request only pays for tagging and measuring its own text.
+    => HTTP/1.1 on a TCP port (or a Unix socket), with an asyncio front end:
+        * POST /score with {"id": "testfile1", "text": "about this topic ..."}
+              => {"ID": "testfile1", "MTLD": 68.556, "MATTR50": 0.7612, ..., "Density": 0.8376}
+        * POST /score with {"texts": [{"id": ..., "text": ...}, ...]} (or a list of strings)
+              => {"results": [{...}, ...]}, in the same order
+        * GET /health => {"status": "ok", "pending": ...}
+       The results have the same ten columns as Lexical_Complexity_results.txt (computed by Lexical_Complexity_directory.calculate_measures).
+    => Texts from concurrent requests are grouped into batches (up to --max-batch texts, waiting at most --max-wait-ms for more),
+       and each batch goes through nlp.pipe in one of the --workers processes. When more than --max-pending texts
+       are waiting, new requests get 503 instead of piling up.
+'''
+# Example on how to run the service, and to score a text
+#   python Scoring_Service.py --port=8000 --workers=2
+#   curl -s -X POST localhost:8000/score -d '{"id": "test", "text": "about this topic I the first experience ..."}'
+#   python Scoring_Service.py --socket=/tmp/lexical_complexity.sock
+#   curl -s --unix-socket /tmp/lexical_complexity.sock -X POST localhost/score -d '{"text": "..."}'
+
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from Batch_Tagging import tag_texts
+import Lexical_Complexity_directory
+
+
+# The columns of the results (as in Lexical_Complexity_results.txt)
+COLUMNS = Lexical_Complexity_directory.HEADER.strip().split("\t")
+
+# Largest request body accepted (bytes)
+MAX_BODY = 64*1024**2
+
+
+
+class Overloaded(Exception):
+    '''
+        Raised when too many texts are already waiting to be scored
+    '''
+
+
+def row_to_result(row):
+    '''
+        Input:
+            row: one line of the results file, e.g., "testfile1\t68.556\t0.7612\t..."
+        Output:
+            result: the same values by column, e.g., {"ID": "testfile1", "MTLD": 68.556, "MATTR50": 0.7612, ...}
+    '''
+    values = row.rstrip("\n").split("\t")
+    return dict(zip(COLUMNS, [values[0]] + [float(value) for value in values[1:]]))
+
+
+def score_batch(items, batch_size=64):
+    '''
+        Worker function: tag a batch of texts with nlp.pipe, then calculate the measures of each one
+        Input:
+            items: a list of (id, text) pairs
+        Output:
+            results: a list of (result, error) pairs in the same order, with result None if the text could not be scored
+    '''
+    texts = [text for id, text in items]
+    try:
+        tokens_texts = list(tag_texts(texts, Lexical_Complexity_directory.myparameters, batch_size=batch_size, cache=Lexical_Complexity_directory.token_cache))
+    except Exception as error:
+        # One text the tagger fails on must not fail the others: tag them again one by one
+        if len(items) > 1:
+            return [result for item in items for result in score_batch([item], batch_size)]
+        return [(None, "{}: {}".format(type(error).__name__, error))]
+    results = []
+    for (id, text), tokens in zip(items, tokens_texts):
+        try:
+            results.append((row_to_result(Lexical_Complexity_directory.calculate_measures(id, tokens)), None))
+        except Exception as error:
+            # e.g., a text without any token
+            results.append((None, "{}: {}".format(type(error).__name__, error)))
+    return results
+
+
+class ScoringService:
+    '''
+        Input:
+            * workers: number of worker processes (0: score in a thread of this process)
+            * max_batch: maximum number of texts per batch
+            * max_wait: how long (seconds) the first text of a batch waits for others to join it
+            * max_pending: maximum number of texts waiting to be scored
+            * resources_args: the arguments of Lexical_Complexity_directory.load_resources() (token cache path and size, profile, frequency lists and filter rules)
+    '''
+
+    def __init__(self, workers=1, max_batch=32, max_wait=0.01, max_pending=1000, resources_args=()):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.resources_args = resources_args
+        self.queue = None
+        self.slots = None
+        self.executor = None
+        # Batches being scored (asyncio only keeps weak references to its tasks)
+        self._running = set()
+
+    async def start(self):
+        '''
+            Start the workers (sharing the spaCy model and the COCA list loaded once, see Lexical_Complexity_directory.start_workers) and the batcher
+        '''
+        loop = asyncio.get_running_loop()
+        if self.workers > 0:
+            self.executor = Lexical_Complexity_directory.start_workers(self.workers, self.resources_args)
+        else:
+            # The model and the lists are loaded here, the token cache in the scoring thread (a SQLite connection
+            # can only be used by the thread that opened it)
+            Lexical_Complexity_directory.load_resources("", *self.resources_args[1:])
+            self.executor = ThreadPoolExecutor(max_workers=1, initializer=Lexical_Complexity_directory.open_token_cache, initargs=self.resources_args[:2])
+        # Warm up every worker, so that the first requests do not wait for the model to load
+        await asyncio.gather(*[loop.run_in_executor(self.executor, score_batch, [("warmup", "Warm up.")]) for i in range(max(1, self.workers))])
+        self.queue = asyncio.Queue()
+        # One batch in flight per worker
+        self.slots = asyncio.Semaphore(max(1, self.workers))
+        self._batcher_task = asyncio.create_task(self._batcher())
+
+    def close(self):
+        self._batcher_task.cancel()
+        self.executor.shutdown()
+
+    async def score(self, items):
+        '''
+            Input:
+                items: a list of (id, text) pairs
+            Output:
+                results: a list of (result, error) pairs in the same order (see score_batch)
+        '''
+        if self.queue.qsize() + len(items) > self.max_pending:
+            raise Overloaded("{} texts are already waiting to be scored".format(self.queue.qsize()))
+        loop = asyncio.get_running_loop()
+        futures = []
+        for item in items:
+            future = loop.create_future()
+            self.queue.put_nowait((item, future))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            # Let the texts of other requests join the batch for a short while
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.slots.acquire()
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, score_batch, [item for item, future in batch])
+            for (item, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as error:
+            for item, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+        finally:
+            self.slots.release()
+
+    async def handle_score(self, body):
+        '''
+            Output:
+                status, payload: the HTTP status and the JSON response of POST /score
+        '''
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, {"error": "the body must be JSON"}
+        single = isinstance(request, dict) and "text" in request
+        if single:
+            entries = [request]
+        elif isinstance(request, dict) and isinstance(request.get("texts"), list):
+            entries = request["texts"]
+        else:
+            return HTTPStatus.BAD_REQUEST, {"error": 'expected {"text": ...} or {"texts": [...]}'}
+        items = []
+        for no, entry in enumerate(entries):
+            if isinstance(entry, str):
+                entry = {"text": entry}
+            if not isinstance(entry, dict) or not isinstance(entry.get("text"), str):
+                return HTTPStatus.BAD_REQUEST, {"error": "text {} is not a string".format(no)}
+            items.append((str(entry.get("id", no)), entry["text"]))
+
+        try:
+            results = await self.score(items)
+        except Overloaded as error:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)}
+        except Exception as error:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "{}: {}".format(type(error).__name__, error)}
+        results = [result if error is None else {"ID": id, "error": error} for (id, text), (result, error) in zip(items, results)]
+        if single:
+            return (HTTPStatus.OK if "error" not in results[0] else HTTPStatus.UNPROCESSABLE_ENTITY), results[0]
+        return HTTPStatus.OK, {"results": results}
+
+    async def handle(self, reader, writer):
+        '''
+            Serve the HTTP requests of one connection (kept alive between requests, as HTTP/1.1 does by default)
+        '''
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, HTTPStatus.BAD_REQUEST, {"error": "malformed request line"}, False)
+                    break
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                length = int(headers.get("content-length", 0) or 0)
+                if length > MAX_BODY:
+                    await self.respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "body over {} bytes".format(MAX_BODY)}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                path = target.split("?")[0]
+                if path == "/score" and method == "POST":
+                    status, payload = await self.handle_score(body)
+                elif path == "/health" and method == "GET":
+                    status, payload = HTTPStatus.OK, {"status": "ok", "pending": self.queue.qsize(), "workers": self.workers}
+                else:
+                    status, payload = HTTPStatus.NOT_FOUND, {"error": "unknown endpoint {} {}".format(method, path)}
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode("utf-8")
+        head = "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n".format(status.value, status.phrase, len(body), "keep-alive" if keep_alive else "close")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(service, host="127.0.0.1", port=8000, socket_path=None):
+    await service.start()
+    if socket_path:
+        server = await asyncio.start_unix_server(service.handle, path=socket_path)
+        print("Scoring service listening on {}".format(socket_path))
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        print("Scoring service listening on http://{}:{}".format(host, port))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Serve the lexical complexity measures over HTTP, with the spaCy model kept loaded')
+    parser.add_argument('--host', action="store", dest='host', default='127.0.0.1')
+    parser.add_argument('--port', action="store", dest='port', type=int, default=8000)
+    parser.add_argument('--socket', action="store", dest='socket', default=None, help='listen on this Unix socket instead of a TCP port')
+    parser.add_argument('--workers', action="store", dest='workers', type=int, default=1, help='number of worker processes (forked after the spaCy model is loaded, sharing it, where fork is available); 0 to score in a thread of the service process')
+    parser.add_argument('--max-batch', action="store", dest='max_batch', type=int, default=32, help='maximum number of texts sent to nlp.pipe together')
+    parser.add_argument('--max-wait-ms', action="store", dest='max_wait_ms', type=float, default=10, help='how long a text waits for others to join its batch')
+    parser.add_argument('--max-pending', action="store", dest='max_pending', type=int, default=1000, help='maximum number of texts waiting to be scored (503 beyond)')
+    parser.add_argument('--token-cache', action="store", dest='token_cache', default='token_cache.sqlite', help='SQLite file caching the preprocessed tokens (empty to disable)')
+    parser.add_argument('--filter-rules', action="store", dest='filter_rules', default='', help='JSON file of the rules of the tokens left out of the measures (default: URLs and "___"), see Token_Filter.py')
+    parser.add_argument('--token-cache-size', action="store", dest='token_cache_size', type=int, default=1024, help='maximum size of the token cache in MB')
+    args = parser.parse_args()
+
+    service = ScoringService(args.workers, args.max_batch, args.max_wait_ms/1000, args.max_pending, (args.token_cache, args.token_cache_size, False, None, args.filter_rules))
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
@@ -3,10 +3,60 @@ Note: pylats use Penn POS tags, while COCA uses their own tags
     => Define a function to switch POS tagging mode (Here, Penn => COCA_freql)
 '''
 
-from pylats import lats
+from functools import lru_cache
 
 
 
+# Words that take their COCA tag directly, whatever their Penn tag
+WORD_TAGS = dict()
+# tags that have to match actual words directly
+for word in ["the", "a", "his", "my", "your", "their", "her", "our", "no", "every", "its"]:
+    WORD_TAGS[word] = "a"
+for word in ["one", "two", "first", "last", "three", "next", "four", "five", "second", "six", "million", "third", "seven", "eight", "ten", "billion", "nine", "hundred", "thousand", "fourth", "twenty", "dozen", "fifth", "thirty", "zero", "fifty", "twelve", "fifteen", "sixth", "forty", "seventh", "eleven", "eighth"]:
+    WORD_TAGS[word] = "m"
+for word in ["not", "n't"]:
+    WORD_TAGS[word] = "x"
+
+# Penn POS tags produced by spaCy's English models
+PENN_TAGS = ["$", "''", ",", "-LRB-", "-RRB-", ".", ":", "ADD", "AFX", "CC", "CD", "DT", "EX", "FW", "HYPH", "IN", "JJ", "JJR", "JJS", "LS", "MD", "NFP", "NN", "NNP", "NNPS", "NNS", "PDT", "POS", "PRP", "PRP$", "RB", "RBR", "RBS", "RP", "SYM", "TO", "UH", "VB", "VBD", "VBG", "VBN", "VBP", "VBZ", "WDT", "WP", "WP$", "WRB", "XX", "``"]
+
+# Size of the memo of switchtagging_Penn2COCA, keyed on (lemma, Penn tag)
+MEMO_SIZE = 2**16
+
+
+
+def penn2coca_tag(penn):
+    '''
+        Input:
+            penn: a Penn POS tag, e.g., "NN"
+        Output:
+            coca: the COCA POS tag for words not in WORD_TAGS, e.g., "n"
+    '''
+    # 2. Look up the "MD", modals
+    if penn == "MD":
+        return "v"
+    # 3. Look up the "^W", wh-words (WDT, WP, WP$, WRB)
+    if penn.startswith("W") and penn[1:2] in ["D", "P", "R"]:
+        return penn[1].lower()
+    # 4. Regular changes, check against the first letter (also for any other "^W" tag)
+    return penn[0].lower()
+
+
+# Precomputed COCA tags of the known Penn tags (other tags go through penn2coca_tag)
+PENN2COCA = {penn: penn2coca_tag(penn) for penn in PENN_TAGS}
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _switchtagging(token, penn):
+    # 1. Look up for actual words
+    coca = WORD_TAGS.get(token)
+    if coca is None:
+        coca = PENN2COCA.get(penn)
+        if coca is None:
+            coca = penn2coca_tag(penn)
+    return token + "_" + coca
+
+
 ## Preprocess and save the tokens with POS tags in to a dictionary for future mapping with the COCA frequency list, {id:[token1_tag, token2_tag, ...]}
 def switchtagging_Penn2COCA(token_penn):
     '''
@@ -15,39 +65,32 @@ def switchtagging_Penn2COCA(token_penn):
         Output: 
             token_coca: a pair of token and COCA POS tag, e.g., ["about_i", "the_a", "topic_n", ...]
     '''
-    # tags that have to match actual words directly
-    a = ["the", "a", "his", "my", "your", "their", "her", "our", "no", "every", "its"]
-    m = ["one", "two", "first", "last", "three", "next", "four", "five", "second", "six", "million", "third", "seven", "eight", "ten", "billion", "nine", "hundred", "thousand", "fourth", "twenty", "dozen", "fifth", "thirty", "zero", "fifty", "twelve", "fifteen", "sixth", "forty", "seventh", "eleven", "eighth"]
-    x = ["not", "n't"]
-    
-    # 1. Look up for actual words 
-    token = token_penn.split("_")[0]
-    penn = token_penn.split("_")[1]
-    if token in a:
-        coca = "a"
-    elif token in m:
-        coca = "m"
-    elif token in x:
-        coca = "x"
-    # 2. Look up the "MD", modals
-    elif penn == "MD":
-        coca = "v"
-    # 3. Look up the "^W", wh-words
-    elif penn.startswith("W"):
-        if penn[1] in ["D", "P", "R"]:
-            coca = penn[1].lower()
-    # 4. Regular changes, check against the first letter
-    else:
-        coca = penn[0].lower()
-    token_coca = token + "_" + coca
+    fields = token_penn.split("_", 2)
+    return _switchtagging(fields[0], fields[1])
 
-    return token_coca
+
+def switchtagging_Penn2COCA_list(tokens_penn):
+    '''
+        Input:
+            tokens_penn: a list of pairs of token and Penn POS tag, e.g., ["about_IN", "the_DT", "topic_NN", ...]
+        Output:
+            tokens_coca: the list of pairs of token and COCA POS tag, e.g., ["about_i", "the_a", "topic_n", ...]
+    '''
+    switch = _switchtagging
+    tokens_coca = []
+    for token_penn in tokens_penn:
+        fields = token_penn.split("_", 2)
+        tokens_coca.append(switch(fields[0], fields[1]))
+    return tokens_coca
 
 
 
 # Test
 if __name__ == "__main__":
 
+    from pylats import lats
+    from Transcript_Reader import read_transcripts
+
     ## Set up new parameters for lats, using the large dataset in SpaCy for preprocessing
     myparameters = lats.parameters()
     #myparameters.model = "en_core_web_lg"
@@ -55,20 +98,12 @@ if __name__ == "__main__":
     myparameters.pos = "pos"
     myparameters.lemma = True
     
-    # Read in the text file (each line represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
-    txts = open("all_txt_transcript.txt", "r").readlines()
-    # Test for one file
-    txt0 = txts[0]
-
-    txt0 = txts[0]
-    id = txt0.split("\t")[0]
-    speech = txt0.split("\t")[1]
+    # Read in the text file (each record represents one recording and has two fields (i.e., filename and transcript) separated by "\t")
+    # Test for one file (only the first record is read)
+    id, speech = next(read_transcripts("all_txt_transcript.txt"))
     # preprocess the speech
     tokens = lats.Normalize(speech, myparameters).toks
     # Switch POS tagging for each token pairs
-    tokens_coca = list()
-    for token in tokens:
-        token_coca = switchtagging_Penn2COCA(token)
-        tokens_coca.append(token_coca)
+    tokens_coca = switchtagging_Penn2COCA_list(tokens)
 
     print(tokens_coca) 
@@ -0,0 +1,121 @@
+'''
+Persistent cache of the preprocessed tokens (lemma_POS token lists) of the transcripts
+    => Tagging with en_core_web_lg is by far the slowest step, and its output only depends on the text,
+       the spaCy model and the lats parameters. Re-running the measures with another cutoff, band layout or
+       MATTR window on the same corpus can then skip the NLP stage entirely.
+    => The tokens are stored in a local SQLite file, keyed by the SHA-256 of the text and the preprocessing settings.
+       When the file grows over max_bytes, the least recently used entries are removed.
+'''
+
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+from Batch_Tagging import UNUSED_COMPONENTS
+
+
+# Check the size of the cache (and evict if needed) after this many new entries
+EVICT_EVERY = 100
+
+
+
+def parameters_fingerprint(myparameters):
+    '''
+        Input:
+            * myparameters: the lats parameters used for preprocessing
+        Output:
+            fingerprint: a string describing everything the tokens depend on (model name and version, pylats version, and the lats settings)
+    '''
+    settings = dict()
+    for name in dir(myparameters):
+        if name.startswith("_") or name in ("nlp", "rwl"):
+            continue
+        value = getattr(myparameters, name)
+        if callable(value):
+            continue
+        settings[name] = value
+    # The real words list is too large to hash on every run, its size is enough to tell the lists apart
+    settings["rwl"] = len(myparameters.rwl) if myparameters.rwl is not None else None
+    nlp = myparameters.nlp
+    if nlp is not None:
+        settings["model_version"] = nlp.meta.get("version")
+        # (the components the tokens do not depend on are left out, whether they were loaded or not, see Batch_Tagging.load_model)
+        settings["pipeline"] = [name for name in nlp.pipe_names if name not in UNUSED_COMPONENTS]
+    from pylats import lats  # already loaded by whoever built myparameters
+    settings["pylats_version"] = getattr(lats, "version", None)
+    return json.dumps(settings, sort_keys=True, default=str)
+
+
+class TokenCache:
+    '''
+        Input:
+            * path: path to the SQLite file (created if missing)
+            * max_bytes: maximum size of the stored tokens (compressed), beyond which the least recently used entries are removed
+    '''
+
+    def __init__(self, path="token_cache.sqlite", max_bytes=1024**3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path, timeout=60)
+        # Several worker processes may share the same file
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used)")
+        self._nb_added = 0
+
+    def key(self, text, myparameters):
+        '''
+            Output:
+                key: the SHA-256 (hex) of the preprocessing settings and the text
+        '''
+        # Computed every time (it is cheap), since the parameters may be changed between two calls
+        sha = hashlib.sha256(parameters_fingerprint(myparameters).encode("utf-8"))
+        sha.update(b"\0")
+        sha.update(text.encode("utf-8"))
+        return sha.hexdigest()
+
+    def get(self, key):
+        '''
+            Output:
+                tokens: the cached token list, or None if the text has not been preprocessed yet
+        '''
+        row = self.conn.execute("SELECT data FROM tokens WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with self.conn:
+            self.conn.execute("UPDATE tokens SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def put(self, key, tokens):
+        data = zlib.compress(json.dumps(tokens).encode("utf-8"))
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO tokens (key, data, size, last_used) VALUES (?, ?, ?, ?)", (key, data, len(data), time.time()))
+        self._nb_added += 1
+        if self._nb_added % EVICT_EVERY == 0:
+            self.evict()
+
+    def size(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM tokens").fetchone()[0]
+
+    def evict(self):
+        '''
+            Remove the least recently used entries until the cache is back under 90% of max_bytes.
+        '''
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+        to_free = total - int(self.max_bytes*0.9)
+        keys = []
+        for key, size in self.conn.execute("SELECT key, size FROM tokens ORDER BY last_used"):
+            keys.append((key,))
+            to_free -= size
+            if to_free <= 0:
+                break
+        with self.conn:
+            self.conn.executemany("DELETE FROM tokens WHERE key = ?", keys)
+
+    def close(self):
+        self.evict()
+        self.conn.close()
@@ -0,0 +1,245 @@
+'''
+The token filter shared by every script: which preprocessed tokens ("lemma_TAG") are left out of the measures
+    => The rules are read from a JSON file (or DEFAULT_RULES: the URL tokens and the "___" ones), each rule being
+       a literal (found anywhere in the token), a regular expression (searched in the token, and which may start with
+       inline flags such as "(?i)"), Penn POS tags
+       (e.g., the punctuation) or lemmas (e.g., the fillers "uh" and "um").
+    => The literal, POS and lemma rules are compiled into one regular expression, which tells the first of them a token matches;
+       each regular expression of a regex rule is compiled on its own, so that its groups and backreferences (e.g., "(.)\\1") keep their numbers.
+       The rules are tried in the order of the file, once per different token (see Token_Vocabulary.py), and applied to a whole document with one array lookup.
+    => The tokens removed by each rule are counted, and written to a report at the end of a run for auditing.
+
+Rules file (e.g., --filter-rules=filter_rules.json):
+    [
+        {"name": "https", "literal": "https:"},
+        {"name": "http", "literal": "http:"},
+        {"name": "blank", "literal": "___"},
+        {"name": "punctuation", "pos": [".", ",", ":", "``", "''", "-LRB-", "-RRB-", "HYPH", "NFP"]},
+        {"name": "fillers", "lemma": ["uh", "um", "er", "erm", "hmm"], "ignore_case": true},
+        {"name": "numbers", "regex": "^[0-9]+_"}
+    ]
+'''
+
+import json
+import re
+import numpy as np
+from Token_Vocabulary import MAX_SIZE as VOCABULARY_SIZE, TokenVocabulary
+
+
+# The kinds of rules, and the rules applied when no rules file is given (the tokens the directory runner always removed)
+RULE_TYPES = ("literal", "regex", "pos", "lemma")
+DEFAULT_RULES = [
+    {"name": "https", "literal": "https:"},
+    {"name": "http", "literal": "http:"},
+    {"name": "blank", "literal": "___"},
+]
+
+
+
+def rule_type(rule):
+    '''
+        Output:
+            type: the kind of the rule (one of RULE_TYPES)
+    '''
+    types = [type for type in RULE_TYPES if type in rule]
+    if len(types) != 1:
+        raise ValueError("Filter rule {!r} must have exactly one of {}".format(rule.get("name"), ", ".join(RULE_TYPES)))
+    return types[0]
+
+
+def rule_pattern(rule):
+    '''
+        Input:
+            * rule: a rule of the rules file, e.g., {"name": "fillers", "lemma": ["uh", "um"]}
+        Output:
+            pattern: a regular expression searched in the "lemma_TAG" tokens the rule removes (without any group, see rule_regexes() for the regex rules)
+    '''
+    type = rule_type(rule)
+    values = rule_values(rule)
+    escaped = "|".join(re.escape(value) for value in values)
+    if type == "literal":
+        pattern = escaped
+    elif type == "pos":
+        # The Penn tag follows the last "_"
+        pattern = "_(?:{})\\Z".format(escaped)
+    elif type == "lemma":
+        pattern = "\\A(?:{})_[^_]*\\Z".format(escaped)
+    else:
+        raise ValueError("Filter rule {!r} is a regex rule, see rule_regexes()".format(rule.get("name")))
+    if rule.get("ignore_case"):
+        pattern = "(?i:{})".format(pattern)
+    return pattern
+
+
+def rule_regexes(rule):
+    '''
+        Input:
+            * rule: a regex rule of the rules file, e.g., {"name": "repeats", "regex": "(.)\\\\1"}
+        Output:
+            regexes: its regular expressions, each compiled on its own (so that inline flags, groups and backreferences work as in re)
+    '''
+    flags = re.IGNORECASE if rule.get("ignore_case") else 0
+    # Check each expression on its own, so that an error names the rule
+    try:
+        return [re.compile(value, flags) for value in rule_values(rule)]
+    except re.error as error:
+        raise ValueError("Invalid filter rule {!r}: {}".format(rule.get("name"), error))
+
+
+def rule_values(rule):
+    '''
+        Output:
+            values: the list of values of the rule (a single value may be given as a string)
+    '''
+    values = rule[rule_type(rule)]
+    if isinstance(values, str):
+        values = [values]
+    return values
+
+
+def read_filter_rules(path):
+    '''
+        Input:
+            * path: a JSON file with a list of rules (see the example above)
+        Output:
+            rules: the list of rules
+    '''
+    with open(path, "r") as fin:
+        rules = json.load(fin)
+    if not isinstance(rules, list):
+        raise ValueError("The filter rules in {} must be a list".format(path))
+    return rules
+
+
+class TokenFilter:
+    '''
+        Input:
+            * rules: the list of rules (see the example above)
+        Attributes:
+            * hits: the number of tokens removed by each rule (by the first rule they match)
+            * nb_tokens: the number of tokens filtered
+    '''
+
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = [dict(rule) for rule in rules]
+        names = [rule.get("name") for rule in self.rules]
+        if None in names or len(set(names)) < len(names):
+            raise ValueError("Every filter rule needs a name of its own")
+        # The matchers tried in order: (None, expression) for a run of literal, POS and lemma rules, whose lookaheads are tried in order
+        # at the start of the token, so the (empty) group that matches is the one of the first rule; (rule_no, regexes) for a regex rule
+        self.matchers = []
+        alternatives = []
+        for i, rule in enumerate(self.rules):
+            if rule_type(rule) != "regex":
+                alternatives.append("(?=[\\s\\S]*?(?:{}))(?P<rule{}>)".format(rule_pattern(rule), i))
+                continue
+            if alternatives:
+                self.matchers.append((None, re.compile("\\A(?:{})".format("|".join(alternatives)))))
+                alternatives = []
+            self.matchers.append((i, rule_regexes(rule)))
+        if alternatives:
+            self.matchers.append((None, re.compile("\\A(?:{})".format("|".join(alternatives)))))
+        self.hits = [0]*len(self.rules)
+        self.nb_tokens = 0
+        # Vocabulary of the tokens given as strings (see filter())
+        self._vocabulary = None
+
+    def fingerprint(self):
+        '''
+            Output:
+                fingerprint: a string describing the rules (the results depend on it)
+        '''
+        return json.dumps(self.rules, sort_keys=True)
+
+    def rule_of(self, token):
+        '''
+            Output:
+                rule_no: the number of the first rule the token matches, or -1 if it is kept
+        '''
+        for rule_no, matcher in self.matchers:
+            if rule_no is None:
+                match = matcher.match(token)
+                if match is not None:
+                    return int(match.lastgroup[4:])
+            elif any(regex.search(token) for regex in matcher):
+                return rule_no
+        return -1
+
+    def filter_codes(self, codes, vocabulary):
+        '''
+            Input:
+                * codes: the ids of the tokens of one document
+                * vocabulary: the TokenVocabulary of the ids
+            Output:
+                codes_clean: the ids of the tokens kept (the tokens removed are counted in hits)
+        '''
+        rule_nos = vocabulary.table(self.rule_of)[codes]
+        removed = rule_nos[rule_nos >= 0]
+        if len(removed):
+            for rule_no, count in enumerate(np.bincount(removed, minlength=len(self.rules)).tolist()):
+                self.hits[rule_no] += count
+        self.nb_tokens += len(codes)
+        return codes[rule_nos < 0]
+
+    def filter(self, tokens):
+        '''
+            Input:
+                * tokens: the tokens of one document, e.g., ["about_IN", "the_DT", "topic_NN", ...]
+            Output:
+                tokens_clean: the tokens kept, in their order
+        '''
+        if self._vocabulary is None:
+            self._vocabulary = TokenVocabulary()
+        elif len(self._vocabulary) > VOCABULARY_SIZE:
+            # (the ids are only used within one call)
+            self._vocabulary.clear()
+        return self._vocabulary.decode(self.filter_codes(self._vocabulary.encode(tokens), self._vocabulary))
+
+    def drain_hits(self):
+        '''
+            Output:
+                counts: the counts since the last call, (nb_tokens, hits), which are then reset (to send the counts of a worker to the main process)
+        '''
+        counts = (self.nb_tokens, self.hits)
+        self.nb_tokens = 0
+        self.hits = [0]*len(self.rules)
+        return counts
+
+    def add_hits(self, counts):
+        '''
+            Add the counts of another filter with the same rules (see drain_hits())
+        '''
+        nb_tokens, hits = counts
+        self.nb_tokens += nb_tokens
+        self.hits = [total + count for total, count in zip(self.hits, hits)]
+
+    def report(self):
+        '''
+            Output:
+                rows: one row per rule, [name, kind, value, tokens removed, proportion of the tokens]
+        '''
+        rows = []
+        for rule, count in zip(self.rules, self.hits):
+            type = rule_type(rule)
+            rows.append([rule["name"], type, json.dumps(rule[type]), count, round(count/self.nb_tokens, 4) if self.nb_tokens else 0.0])
+        return rows
+
+    def write_report(self, path):
+        '''
+            Write the report (see report()) as a tab-separated file, with the total at the end
+        '''
+        with open(path, "w") as fout:
+            fout.write("Rule\tType\tValue\tTokens_Removed\tProportion\n")
+            for row in self.report():
+                fout.write("\t".join(str(value) for value in row) + "\n")
+            fout.write("total\t\t\t{}\t{}\n".format(sum(self.hits), round(sum(self.hits)/self.nb_tokens, 4) if self.nb_tokens else 0.0))
+
+
+def load_token_filter(path=None):
+    '''
+        Input:
+            * path: a rules file, or None (or "") for DEFAULT_RULES
+        Output:
+            token_filter: the TokenFilter of the rules
+    '''
+    return TokenFilter(read_filter_rules(path) if path else DEFAULT_RULES)
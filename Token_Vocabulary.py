@@ -0,0 +1,97 @@
+'''
+Interned tokens: each different "lemma_TAG" string is stored once in a vocabulary and the tokens of a document become
+a NumPy array of integer ids
+    => The filter, the POS switch (Penn => COCA) and the lookups in the frequency lists are done once per type, into tables
+       indexed by id, and applied to all the tokens of a document with one NumPy indexing, instead of building a new
+       string (or testing one) for every token.
+    => The measures take the id arrays directly (Diversity_Engine.calculate_diversity_codes, Metrics_Kernel.metrics_counts_codes),
+       so a document is held as one list of strings (the tagger output) and a few integer arrays.
+    => A vocabulary grows with the number of different tokens seen, not of tokens. The ids are only used within one document
+       (or one batch), so a long-running process starts again from an empty vocabulary (clear()) once it holds more than MAX_SIZE tokens.
+'''
+
+import itertools
+import numpy as np
+
+
+# Number of different tokens above which the runners clear their vocabularies between two documents (about 100 MB with the tables)
+MAX_SIZE = 500000
+
+
+
+class TokenVocabulary:
+    '''
+        Attributes:
+            * ids: a dictionary mapping each token to its id, e.g., {"about_IN": 0, "the_DT": 1, ...}
+            * strings: the tokens, in the order of their ids (the same string objects as the keys of ids)
+    '''
+
+    def __init__(self):
+        self.ids = dict()
+        self.strings = []
+        # Tables of values per id, keyed by the function they are computed with (see table())
+        self._tables = dict()
+
+    def __len__(self):
+        return len(self.strings)
+
+    def clear(self):
+        '''
+            Forget every token and table (the ids given until then are no longer valid)
+        '''
+        self.ids = dict()
+        self.strings = []
+        self._tables = dict()
+
+    def intern(self, token):
+        '''
+            Output:
+                id: the id of the token (added to the vocabulary if it is new)
+        '''
+        code = self.ids.get(token)
+        if code is None:
+            code = self.ids[token] = len(self.strings)
+            self.strings.append(token)
+        return code
+
+    def encode(self, tokens):
+        '''
+            Input:
+                * tokens: a list of tokens, e.g., ["about_IN", "the_DT", "topic_NN", ...]
+            Output:
+                codes: a NumPy array of their ids (the new tokens are added to the vocabulary)
+        '''
+        ids = self.ids
+        codes = np.fromiter((ids.setdefault(token, len(ids)) for token in tokens), dtype=np.int64, count=len(tokens))
+        # The new tokens are the last keys of ids (dictionaries keep the insertion order)
+        nb_new = len(ids) - len(self.strings)
+        if nb_new:
+            self.strings.extend(reversed(list(itertools.islice(reversed(ids), nb_new))))
+        return codes
+
+    def decode(self, codes):
+        '''
+            Output:
+                tokens: the tokens of the ids (the interned strings, not copies)
+        '''
+        strings = self.strings
+        return [strings[code] for code in np.asarray(codes).tolist()]
+
+    def table(self, function, dtype=np.int64):
+        '''
+            Input:
+                * function: a function of one token (it must not add tokens to this vocabulary), e.g., a filter or a tag switch
+                * dtype: the NumPy type of its values
+            Output:
+                table: a NumPy array of function(token) for every id, computed once per token (the same array is extended
+                       with the tokens added since the last call), so that table[codes] applies it to a whole document
+        '''
+        table = self._tables.get(function)
+        start = 0 if table is None else len(table)
+        if start < len(self.strings):
+            new = np.fromiter((function(token) for token in self.strings[start:]), dtype=dtype, count=len(self.strings) - start)
+            table = new if table is None else np.concatenate([table, new])
+            self._tables[function] = table
+        elif table is None:
+            table = np.zeros(0, dtype=dtype)
+        return table
@@ -0,0 +1,80 @@
+'''
+Streaming reader for transcript dumps such as all_txt_transcript.txt
+    => Each record has two fields (i.e., filename and transcript) separated by the first "\t" of the line.
+       The records are read lazily one at a time, so the memory use does not depend on the size of the file.
+    => By default every line is one record, read as it is: quotes in the speech are kept (e.g., '"Hello" she said.').
+    => With quoted=True, a transcript may be quoted ("...") to hold tabs, newlines or quotes (written as "") inside the speech.
+       A quote that is never closed, or text after a closing quote, is an error (not a record swallowing the next lines).
+'''
+
+import csv
+import sys
+from itertools import islice
+
+
+# Quoted transcripts can be far longer than the default limit of the csv module (128k characters)
+csv.field_size_limit(min(sys.maxsize, 2**31-1))
+
+
+
+def read_transcripts(filename="all_txt_transcript.txt", encoding=None, quoted=False):
+    '''
+        Input:
+            * filename: the transcript file, one record per line (or several lines, when the speech is quoted)
+            * encoding: the encoding of the file (by default, the platform encoding, as open() does)
+            * quoted: True if speeches may be quoted (see above), False to read each line as it is
+        Output:
+            a generator of (id, speech) records, e.g., ("testfile1", "about this topic I the first experience ...")
+    '''
+    if quoted:
+        yield from read_quoted_transcripts(filename, encoding)
+        return
+    with open(filename, "r", encoding=encoding, newline="") as fin:
+        for line in fin:
+            line = line.rstrip("\r\n")
+            # skip blank lines
+            if not line:
+                continue
+            # the speech may itself hold tabs: keep all of it
+            id, _, speech = line.partition("\t")
+            yield id, speech
+
+
+def read_quoted_transcripts(filename, encoding=None):
+    '''
+        Same as read_transcripts() for files whose speeches may be quoted
+    '''
+    with open(filename, "r", encoding=encoding, newline="") as fin:
+        reader = csv.reader(fin, delimiter="\t", quotechar='"', strict=True)
+        while True:
+            # (the line the next record starts at, for the error message)
+            start = reader.line_num + 1
+            try:
+                fields = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as error:
+                raise ValueError("{}, record starting at line {}: {} (a quoted speech must be quoted as a whole, with its quotes written as \"\", and its quote closed)".format(filename, start, error)) from None
+            # skip blank lines
+            if not fields or fields == [""]:
+                continue
+            id = fields[0]
+            # an unquoted speech may itself hold tabs: keep all of it
+            speech = "\t".join(fields[1:])
+            yield id, speech
+
+
+def iter_chunks(iterable, size):
+    '''
+        Input:
+            * iterable: any iterable, read lazily
+            * size: maximum number of items per chunk
+        Output:
+            a generator of lists of at most size items
+    '''
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,478 @@
+'''
+Golden-output verification of the fast measure engines against the reference implementations
+    => The reference path computes the measures the original way, token by token, with code of its own (none of the rewritten
+       modules): each filter rule checked in each token (substring, re.search, tag or lemma comparison), the original if/elif POS
+       switch on each token, the frequency bands and the sophisticated types by list membership in the ranked lemma_pos pairs,
+       the density by splitting each pair, and taaled's MTLD and MATTR (Diversity_Engine.calculate_diversity if taaled is not installed).
+    => The engine path is the one of the runners: the tokens interned as integer ids, the filter and the POS switch looked up
+       once per type, the fused metrics kernel and the diversity engine on the ids.
+    => python Verify_Measures.py tags the test files, all_txt_transcript.txt and a generated corpus once, runs both paths on
+       every document, compares every measure to 4 decimals (exit status 1 if one differs) and reports the time of each stage
+       and the speedups. Random token lists (short ones included, and URL tokens for the filter) are checked without the model.
+    => The rows of the test files are also compared with the committed results (Lexical_Complexity_results.txt, --golden),
+       for the files whose ID is in both (the golden rows were computed with en_core_web_lg and the default filter rules).
+    => SampleVerifier re-checks a random fraction of the documents of a production run against the reference path
+       (--verify-sample of Lexical_Complexity.py and Lexical_Complexity_directory.py); the differences are written to a report.
+'''
+# Example on how to run the verification
+#   python Verify_Measures.py
+#   python Verify_Measures.py --nb-docs=200 --doc-tokens=3000 --filter-rules=filter_rules.json
+
+import random
+import re
+import time
+from contextlib import contextmanager
+from Switch_Tagging import switchtagging_Penn2COCA
+from Diversity_Engine import calculate_diversity, calculate_diversity_codes
+from Metrics_Kernel import metrics_counts_codes, metrics_from_counts
+from Token_Vocabulary import TokenVocabulary
+from Token_Filter import rule_type
+from Results_Writer import COLUMNS
+
+
+# The measures compared (the columns of the results file after the ID)
+MEASURES = COLUMNS[1:]
+
+# The stages timed on both paths (the reference "metrics" stage is reference_prop_freqband, reference_sophis_type and reference_density)
+STAGES = ["filter", "switchtagging", "diversity", "metrics"]
+
+# Number of decimals the values are compared to (the ones of the results file)
+DECIMALS = 4
+
+
+
+@contextmanager
+def timed(timings, stage):
+    # Add the time spent in the block to timings[stage] (if timings is not None)
+    start = time.perf_counter()
+    yield
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def reference_diversity(tokens, window_lengths=(50, 11)):
+    '''
+        Output:
+            diversity: MTLD and MATTR of the tokens computed by taaled, e.g., {"MTLD": 58.2101, "MATTR50": 0.7432, "MATTR11": 0.9313}
+                       (by Diversity_Engine.calculate_diversity if taaled is not installed)
+    '''
+    try:
+        from taaled import ld
+    except ImportError:
+        return calculate_diversity(tokens, window_lengths)
+    Lexdiv = ld.lexdiv()
+    diversity = {"MTLD": Lexdiv.MTLD(tokens)}
+    for window_length in window_lengths:
+        value = Lexdiv.MATTR(tokens, window_length=window_length)
+        # taaled returns (TTR, [TTR], [tokens]) for texts not longer than one window
+        diversity["MATTR{}".format(window_length)] = value[0] if isinstance(value, tuple) else value
+    return diversity
+
+
+def reference_rule(rule):
+    '''
+        Input:
+            * rule: a rule of the filter (see Token_Filter.py)
+        Output:
+            match: a function telling whether the rule removes a token, checking the token directly (not with Token_Filter.rule_pattern)
+    '''
+    type = rule_type(rule)
+    values = rule[type]
+    if isinstance(values, str):
+        values = [values]
+    ignore_case = bool(rule.get("ignore_case"))
+    fold = (lambda text: text.lower()) if ignore_case else (lambda text: text)
+    values = [value if type == "regex" else fold(value) for value in values]
+    if type == "literal":
+        # (as the original "https:" in token)
+        return lambda token: any(value in fold(token) for value in values)
+    if type == "regex":
+        return lambda token: any(re.search(value, token, re.IGNORECASE if ignore_case else 0) for value in values)
+    if type == "pos":
+        # The Penn tag follows the last "_"
+        return lambda token: "_" in token and fold(token.rsplit("_", 1)[1]) in values
+    return lambda token: "_" in token and fold(token.rsplit("_", 1)[0]) in values
+
+
+def reference_rules(token_filter):
+    '''
+        Output:
+            rules: the reference check of each rule of the filter on its own (see reference_rule, not the combined matcher of the filter)
+    '''
+    return [reference_rule(rule) for rule in token_filter.rules]
+
+
+def reference_switchtagging(token_penn):
+    '''
+        The original switch of a pair of token and Penn POS tag to a pair of token and COCA POS tag, e.g., "about_IN" => "about_i"
+        (see Switch_Tagging.switchtagging_Penn2COCA)
+    '''
+    # tags that have to match actual words directly
+    a = ["the", "a", "his", "my", "your", "their", "her", "our", "no", "every", "its"]
+    m = ["one", "two", "first", "last", "three", "next", "four", "five", "second", "six", "million", "third", "seven", "eight", "ten", "billion", "nine", "hundred", "thousand", "fourth", "twenty", "dozen", "fifth", "thirty", "zero", "fifty", "twelve", "fifteen", "sixth", "forty", "seventh", "eleven", "eighth"]
+    x = ["not", "n't"]
+
+    token = token_penn.split("_")[0]
+    penn = token_penn.split("_")[1]
+    if token in a:
+        coca = "a"
+    elif token in m:
+        coca = "m"
+    elif token in x:
+        coca = "x"
+    elif penn == "MD":
+        coca = "v"
+    elif penn.startswith("W"):
+        if penn[1] in ["D", "P", "R"]:
+            coca = penn[1].lower()
+    else:
+        coca = penn[0].lower()
+    return token + "_" + coca
+
+
+def reference_prop_freqband(tokens_coca, lemmas_pos_ranked, indices_band=[0, 500, 3000, 5000]):
+    '''
+        The original proportion of tokens in each frequency band, by list membership in each band of the ranked pairs
+        (see Lexical_FreqBand.calculate_prop_freqband)
+    '''
+    nb_pairs = len(tokens_coca)
+    nb_bands = len(indices_band)
+    lemma_pos_bands = [lemmas_pos_ranked[indices_band[i]:indices_band[i+1]] for i in range(nb_bands-1)]
+    count_band = {"band{}".format(i+1): 0 for i in range(nb_bands)}
+    for pair in tokens_coca:
+        temp = 0  # for marking the one out of the list
+        for i in range(nb_bands-1):
+            if pair in lemma_pos_bands[i]:
+                count_band["band{}".format(i+1)] += 1
+            else:
+                temp += 1
+        if temp == nb_bands-1:
+            count_band["band{}".format(nb_bands)] += 1
+    return {band: round(count/nb_pairs, 4) for band, count in count_band.items()}
+
+
+def reference_sophis_type(tokens_coca, lemmas_pos_ranked, cutoff=2000):
+    '''
+        The original proportion of sophisticated types, by list membership in the pairs ranked after the cutoff
+        (see Lexical_PropSophisTypes.calculate_sophis_type)
+    '''
+    nb_types = len(set(tokens_coca))
+    sophis_pairs = lemmas_pos_ranked[cutoff:]
+    sophis_type_list = [pair for pair in tokens_coca if pair in sophis_pairs]
+    return round(len(set(sophis_type_list))/nb_types, 4)
+
+
+def reference_density(tokens_coca, content=["n", "v", "j", "r"]):
+    '''
+        The original lexical density, the POS tag of each pair being split off (see Lexical_Density.calculate_density)
+    '''
+    count_content_tokens = 0
+    for pair in tokens_coca:
+        if pair.split("_")[1] in content:
+            count_content_tokens += 1
+    return round(count_content_tokens/len(tokens_coca), 4)
+
+
+def reference_measures(tokens, coca_index, token_filter, indices_band=[0, 500, 3000, 5000], cutoff=2000, timings=None, rules=None):
+    '''
+        Input:
+            * tokens: the tokens of one document with Penn POS tags, e.g., ["about_IN", "the_DT", "topic_NN", ...]
+            * coca_index: the FrequencyIndex of the COCA list (only its list of ranked pairs is used), or the list itself
+            * token_filter: the TokenFilter whose rules are applied
+            * indices_band, cutoff: the settings of the frequency bands and of the sophisticated types
+            * timings: a dictionary the time of each stage is added to (see STAGES), or None
+            * rules: the checks of the rules (see reference_rules), if already built
+        Output:
+            measures: the (rounded) value of each measure (see MEASURES), computed by the reference implementations
+    '''
+    if rules is None:
+        rules = reference_rules(token_filter)
+    lemmas_pos_ranked = list(getattr(coca_index, "lemmas_pos_ranked", coca_index))
+    with timed(timings, "filter"):
+        tokens_clean = [token for token in tokens if not any(match(token) for match in rules)]
+    with timed(timings, "switchtagging"):
+        tokens_coca = [reference_switchtagging(token) for token in tokens_clean]
+    with timed(timings, "diversity"):
+        diversity = reference_diversity(tokens_clean, window_lengths=(50, 11))
+    with timed(timings, "metrics"):
+        prop_freqband = reference_prop_freqband(tokens_coca, lemmas_pos_ranked, indices_band)
+        proportion_sophis = reference_sophis_type(tokens_coca, lemmas_pos_ranked, cutoff=cutoff)
+        density = reference_density(tokens_coca)
+    values = [round(diversity["MTLD"], DECIMALS), round(diversity["MATTR50"], DECIMALS), round(diversity["MATTR11"], DECIMALS)]
+    values += list(prop_freqband.values()) + [proportion_sophis, density]
+    return dict(zip(MEASURES, values))
+
+
+def engine_measures(tokens, coca_index, token_filter, indices_band=[0, 500, 3000, 5000], cutoff=2000, timings=None, vocabulary=None, coca_vocabulary=None):
+    '''
+        Same as reference_measures() with the engines of the runners (see Lexical_Complexity_directory.calculate_values)
+        Input:
+            * vocabulary, coca_vocabulary: the TokenVocabulary of the tokens and of their COCA pairs, kept from one document to the next
+    '''
+    if vocabulary is None:
+        vocabulary = TokenVocabulary()
+    if coca_vocabulary is None:
+        coca_vocabulary = TokenVocabulary()
+    def coca_id(token):
+        # (the tokens the filter removes are never switched)
+        if token_filter.rule_of(token) >= 0:
+            return -1
+        return coca_vocabulary.intern(switchtagging_Penn2COCA(token))
+    with timed(timings, "filter"):
+        codes_clean = token_filter.filter_codes(vocabulary.encode(tokens), vocabulary)
+    with timed(timings, "switchtagging"):
+        codes_coca = vocabulary.table(coca_id)[codes_clean]
+    with timed(timings, "diversity"):
+        diversity = calculate_diversity_codes(codes_clean, window_lengths=(50, 11))
+    with timed(timings, "metrics"):
+        metrics = metrics_from_counts(metrics_counts_codes(codes_coca, coca_vocabulary.strings, coca_index, indices_band, cutoff=cutoff))
+    values = [round(diversity["MTLD"], DECIMALS), round(diversity["MATTR50"], DECIMALS), round(diversity["MATTR11"], DECIMALS)]
+    values += list(metrics["prop_freqband"].values()) + [metrics["proportion_sophis"], metrics["density"]]
+    return dict(zip(MEASURES, values))
+
+
+def compare_measures(reference, values):
+    '''
+        Input:
+            * reference, values: the measures of one document (see reference_measures), values may also be a row of results (ID first)
+        Output:
+            differences: the (measure, reference value, value) of each measure that differs to DECIMALS decimals
+    '''
+    if not isinstance(values, dict):
+        values = dict(zip(MEASURES, values[1:]))
+    differences = []
+    for measure in MEASURES:
+        # (the row values are already rounded, but a row read back from a file may not be a float)
+        if round(float(reference[measure]), DECIMALS) != round(float(values[measure]), DECIMALS):
+            differences.append((measure, reference[measure], values[measure]))
+    return differences
+
+
+def read_golden(path="Lexical_Complexity_results.txt"):
+    '''
+        Output:
+            golden: the rows of a results file by ID, e.g., {"testfile1.txt": ["testfile1.txt", "68.556", ...]}
+    '''
+    with open(path, "r") as fin:
+        header = fin.readline().rstrip("\n").split("\t")
+        if header[:len(COLUMNS)] != COLUMNS:
+            raise ValueError("{} is not a results file (columns {})".format(path, ", ".join(header)))
+        return {row[0]: row for row in (line.rstrip("\n").split("\t") for line in fin) if row[0]}
+
+
+def golden_differences(measures, golden):
+    '''
+        Input:
+            * measures: the measures of each document by ID (see engine_measures)
+            * golden: the rows of the committed results by ID (see read_golden)
+        Output:
+            * differences: the (ID, measure, golden value, value) of each measure that differs, for the IDs in both
+            * nb_compared: the number of IDs in both
+    '''
+    differences = []
+    common = [id for id in measures if id in golden]
+    for id in common:
+        expected = dict(zip(MEASURES, golden[id][1:]))
+        differences += [(id, measure, expected_value, value) for measure, expected_value, value in compare_measures(expected, measures[id])]
+    return differences, len(common)
+
+
+class SampleVerifier:
+    '''
+        Input:
+            * fraction: the fraction of the documents re-checked against the reference path (0: none)
+            * indices_band, cutoff: the settings of the frequency bands and of the sophisticated types of the run
+        Attributes:
+            * nb_checked: the number of documents checked
+            * mismatches: the differences found, (ID, measure, reference value, value)
+    '''
+
+    def __init__(self, fraction=0.0, indices_band=[0, 500, 3000, 5000], cutoff=2000):
+        if not 0 <= fraction <= 1:
+            raise ValueError("The fraction of the documents to verify must be between 0 and 1, not {}".format(fraction))
+        self.fraction = fraction
+        self.indices_band = list(indices_band)
+        self.cutoff = cutoff
+        self.nb_checked = 0
+        self.mismatches = []
+        # The reference checks of the rules of the last filter, built once
+        self._rules = (None, None)
+
+    def sampled(self):
+        '''
+            Output:
+                sampled: True for a random fraction of the calls (each worker process draws its own numbers)
+        '''
+        return self.fraction > 0 and random.random() < self.fraction
+
+    def check(self, id, tokens, values, coca_index, token_filter):
+        '''
+            Input:
+                * id: the ID of the document
+                * tokens: its tokens with Penn POS tags (before the filter, or after it: the filter removes nothing more)
+                * values: the row of results computed for it (ID first, then the measures in the order of MEASURES)
+                * coca_index, token_filter: the COCA index and the filter of the run
+            Output:
+                differences: see compare_measures (also added to mismatches)
+        '''
+        fingerprint = token_filter.fingerprint()
+        if self._rules[0] != fingerprint:
+            self._rules = (fingerprint, reference_rules(token_filter))
+        reference = reference_measures(tokens, coca_index, token_filter, self.indices_band, self.cutoff, rules=self._rules[1])
+        differences = compare_measures(reference, values)
+        self.nb_checked += 1
+        self.mismatches.extend((id, measure, expected, value) for measure, expected, value in differences)
+        return differences
+
+    def drain(self):
+        '''
+            Output:
+                checks: the checks since the last call, (nb_checked, mismatches), which are then reset (to send the checks of a worker to the main process)
+        '''
+        checks = (self.nb_checked, self.mismatches)
+        self.nb_checked = 0
+        self.mismatches = []
+        return checks
+
+    def add(self, checks):
+        '''
+            Add the checks of another verifier (see drain())
+        '''
+        nb_checked, mismatches = checks
+        self.nb_checked += nb_checked
+        self.mismatches.extend(tuple(mismatch) for mismatch in mismatches)
+
+    def summary(self):
+        '''
+            Output:
+                summary: one line about the documents checked and the differences found
+        '''
+        nb_documents = len(set(mismatch[0] for mismatch in self.mismatches))
+        return "{} documents checked against the reference implementations: {}".format(
+            self.nb_checked, "{} values differ in {} documents".format(len(self.mismatches), nb_documents) if self.mismatches else "all the values match")
+
+    def write_report(self, path):
+        '''
+            Write the differences found as a tab-separated file (one line per measure that differs), with the number of documents checked at the end
+        '''
+        with open(path, "w") as fout:
+            fout.write("ID\tMeasure\tReference\tValue\n")
+            for mismatch in self.mismatches:
+                fout.write("\t".join(str(value) for value in mismatch) + "\n")
+            fout.write("checked\t{}\n".format(self.nb_checked))
+
+
+
+if __name__ == "__main__":
+    # Run both paths on the test files, all_txt_transcript.txt, a generated corpus and random token lists
+    import argparse
+    import glob
+    import os
+    import sys
+    import numpy as np
+    from Batch_Tagging import load_model, tag_texts
+    from Transcript_Reader import read_transcripts
+    from Frequency_Cache import load_lemmas_pos_ranked
+    from Frequency_Index import FrequencyIndex
+    from Token_Filter import load_token_filter
+    from Benchmark_Pipeline import make_corpus
+
+    parser = argparse.ArgumentParser(description='Compare the measure engines with the reference implementations (values to 4 decimals, and running time of each stage)')
+    parser.add_argument('--source', action="store", dest='source', default='test_files', help='folder of text files checked, and sampled for the generated corpus')
+    parser.add_argument('--transcripts', action="store", dest='transcripts', default='all_txt_transcript.txt', help='file of transcripts checked (empty to skip)')
+    parser.add_argument('--quoted-transcripts', action='store_true', dest='quoted_transcripts', help='the speeches of the file of transcripts may be quoted, see Transcript_Reader.py')
+    parser.add_argument('--nb-docs', action="store", dest='nb_docs', type=int, default=50, help='number of documents of the generated corpus (and of random token lists)')
+    parser.add_argument('--doc-tokens', action="store", dest='doc_tokens', type=int, default=2000, help='approximate number of words per generated document')
+    parser.add_argument('--seed', action="store", dest='seed', type=int, default=0)
+    parser.add_argument('--model', action="store", dest='model', default='en_core_web_lg', help='spaCy model used for tagging (empty to check the random token lists only)')
+    parser.add_argument('--coca', action="store", dest='coca', default='COCA word frequency.xlsx', help='the COCA word frequency list')
+    parser.add_argument('--filter-rules', action="store", dest='filter_rules', default='', help='JSON file of the filter rules (default: URLs and "___"), see Token_Filter.py')
+    parser.add_argument('--batch-size', action="store", dest='batch_size', type=int, default=64, help='number of paragraphs sent to spaCy in each batch of nlp.pipe')
+    parser.add_argument('--golden', action="store", dest='golden', default='Lexical_Complexity_results.txt', help='committed results the rows of the test files are compared with (empty to skip)')
+    args = parser.parse_args()
+
+    coca_index = FrequencyIndex(load_lemmas_pos_ranked(args.coca, sheet_name=1, nb_ranked=5000))
+    token_filter = load_token_filter(args.filter_rules)
+
+    # The texts of each corpus
+    corpora = dict()
+    corpora[args.source] = [(os.path.relpath(filename, args.source), open(filename, "r").read())
+                            for filename in sorted(glob.glob(os.path.join(args.source, "**", "*.txt"), recursive=True))]
+    if args.transcripts and os.path.exists(args.transcripts):
+        corpora[args.transcripts] = list(read_transcripts(args.transcripts, quoted=args.quoted_transcripts))
+    corpora["generated"] = [("doc{}".format(no), text) for no, text in enumerate(make_corpus(args.source, args.nb_docs, args.doc_tokens, args.seed))]
+
+    # Tag the texts once, the same tokens going through both paths
+    documents = dict()
+    if args.model:
+        from pylats import lats
+        myparameters = lats.parameters()
+        myparameters.model = args.model
+        myparameters.nlp = load_model(myparameters.model)
+        myparameters.pos = "pos"
+        myparameters.lemma = True
+        for name, records in corpora.items():
+            documents[name] = list(zip([id for id, text in records], tag_texts((text for id, text in records), myparameters, batch_size=args.batch_size)))
+
+    # Random token lists (Zipf-like lemma frequencies), short ones included, with URL and "___" tokens for the filter
+    rng = np.random.default_rng(args.seed)
+    pairs = coca_index.lemmas_pos_ranked
+    penn = {"n": "NN", "v": "VB", "j": "JJ", "r": "RB", "i": "IN", "a": "DT", "c": "CC", "p": "PRP"}
+    vocabulary = ["{}_{}".format(pair.rsplit("_", 1)[0], penn.get(pair.rsplit("_", 1)[1][:1], "NN")) for pair in pairs[:20000]]
+    vocabulary += ["word{}_NN".format(i) for i in range(5000)] + ["https://example.org_NN", "http:_NN", "___"]
+    lengths = [1, 5, 10, 11, 12, 49, 50, 51, 100] + rng.integers(1, 2*args.doc_tokens, max(args.nb_docs - 10, 0)).tolist()
+    documents["random"] = [("random{}".format(no), [vocabulary[i] for i in rng.zipf(1.2, length) % len(vocabulary)]) for no, length in enumerate(lengths)]
+
+    reference_timings = dict()
+    engine_timings = dict()
+    rules = reference_rules(token_filter)
+    vocabularies = (TokenVocabulary(), TokenVocabulary())
+    nb_differences = 0
+    # The engine measures of the test files, by the ID the directory runner gives them (the name of the file)
+    source_measures = dict()
+    print("{:<30}{:>8}{:>12}{:>12}".format("corpus", "docs", "tokens", "differences"))
+    for name, docs in documents.items():
+        differences = []
+        for id, tokens in docs:
+            # (a document left without tokens by the filter has no measures: both paths must then fail the same way)
+            try:
+                reference = reference_measures(tokens, coca_index, token_filter, timings=reference_timings, rules=rules)
+            except ZeroDivisionError as error:
+                reference = error
+            try:
+                values = engine_measures(tokens, coca_index, token_filter, timings=engine_timings, vocabulary=vocabularies[0], coca_vocabulary=vocabularies[1])
+            except ZeroDivisionError as error:
+                values = error
+            if isinstance(reference, Exception) or isinstance(values, Exception):
+                if type(reference) is not type(values):
+                    differences.append((id, "error", reference, values))
+                continue
+            differences += [(id, measure, expected, value) for measure, expected, value in compare_measures(reference, values)]
+            if name == args.source:
+                source_measures[os.path.basename(id)] = values
+        print("{:<30}{:>8}{:>12}{:>12}".format(name, len(docs), sum(len(tokens) for id, tokens in docs), len(differences)))
+        for difference in differences[:20]:
+            print("    {}\t{}\treference={}\tengine={}".format(*difference))
+        nb_differences += len(differences)
+
+    # The rows of the test files against the committed results
+    if args.golden and source_measures:
+        differences, nb_compared = golden_differences(source_measures, read_golden(args.golden))
+        print("\n{} files of {} compared with {}: {} values differ".format(nb_compared, args.source, args.golden, len(differences)))
+        if not nb_compared:
+            print("    no file of {} has a row in {}".format(args.source, args.golden))
+        for difference in differences[:20]:
+            print("    {}\t{}\tgolden={}\tengine={}".format(*difference))
+        nb_differences += len(differences)
+
+    # Time of each stage over all the documents, and speedups
+    print("\n{:<15}{:>14}{:>14}{:>10}".format("stage", "reference (s)", "engine (s)", "speedup"))
+    for stage in STAGES + ["total"]:
+        reference_time = sum(reference_timings.values()) if stage == "total" else reference_timings.get(stage, 0.0)
+        engine_time = sum(engine_timings.values()) if stage == "total" else engine_timings.get(stage, 0.0)
+        print("{:<15}{:>14.4f}{:>14.4f}{:>10}".format(stage, reference_time, engine_time, "x{:.1f}".format(reference_time/engine_time) if engine_time > 0 else ""))
+
+    if nb_differences:
+        print("\n{} values differ".format(nb_differences))
+        sys.exit(1)
+    print("\nAll the values match")
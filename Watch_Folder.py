@@ -0,0 +1,247 @@
+'''
+Watch a folder for new or changed text files (used by Lexical_Complexity_directory.py --watch)
+    => On Linux, the folder and its subfolders are watched with inotify (through ctypes, no package to install), so a new
+       transcript is seen as soon as it is written. Elsewhere, or with backend="polling", the folder is scanned every few seconds
+       (only the sizes and mtimes are read, nothing is processed again).
+    => A file still being written is not processed halfway: the Debouncer only lets a file through once its size and mtime
+       have not changed between two checks and it has not been written to for the debounce delay.
+'''
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+
+# inotify events (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# Header of an inotify event: watch descriptor, mask, cookie, length of the name
+EVENT_HEADER = struct.Struct("iIII")
+
+BACKENDS = ["auto", "inotify", "polling"]
+
+
+
+def is_text_file(filename):
+    # (a file written under a temporary name, e.g., "a.txt.part", is only taken once it is renamed)
+    return filename.endswith(".txt")
+
+
+def scan_files(directory, match=is_text_file):
+    '''
+        Output:
+            filenames: the files of the directory and its subfolders the match function accepts
+    '''
+    filenames = []
+    for dirpath, dirnames, files in os.walk(directory):
+        for name in files:
+            filename = os.path.join(dirpath, name)
+            if match(filename):
+                filenames.append(filename)
+    return filenames
+
+
+def stat_signature(filename):
+    '''
+        Output:
+            signature: (size, mtime_ns) of the file, or None if it is gone
+    '''
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+class PollingWatcher:
+    '''
+        Input:
+            * directory: the folder to watch (with its subfolders)
+            * interval: seconds between two scans
+            * match: which files to report (default: the .txt files)
+    '''
+
+    def __init__(self, directory, interval=2.0, match=is_text_file):
+        self.directory = directory
+        self.interval = interval
+        self.match = match
+        # The signature of each file at the last scan
+        self.signatures = dict()
+        self.last_scan = None
+
+    def poll(self, timeout=0):
+        '''
+            Input:
+                * timeout: how long to wait for changes (seconds)
+            Output:
+                filenames: the files that are new or changed since the last call (all the files on the first call)
+        '''
+        if self.last_scan is not None:
+            remaining = self.last_scan + self.interval - time.monotonic()
+            if remaining > 0:
+                time.sleep(min(timeout, remaining))
+                if time.monotonic() < self.last_scan + self.interval:
+                    return []
+        self.last_scan = time.monotonic()
+        changed = []
+        signatures = dict()
+        for filename in scan_files(self.directory, self.match):
+            signature = stat_signature(filename)
+            if signature is None:
+                continue
+            signatures[filename] = signature
+            if self.signatures.get(filename) != signature:
+                changed.append(filename)
+        self.signatures = signatures
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    '''
+        Input:
+            * directory: the folder to watch (with its subfolders, including the ones created later)
+            * match: which files to report (default: the .txt files)
+    '''
+
+    def __init__(self, directory, match=is_text_file):
+        self.directory = directory
+        self.match = match
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # The folder of each watch descriptor
+        self.folders = dict()
+        # The files found when the watcher started (or after the subfolders were watched), reported by the next poll
+        self._found = []
+        self._watch_tree(directory)
+
+    def _watch_tree(self, directory):
+        # Watch the folder and its subfolders, and remember the files already there (written before the watch started)
+        for dirpath, dirnames, files in os.walk(directory):
+            wd = self._add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed on {}".format(dirpath))
+            self.folders[wd] = dirpath
+            self._found.extend(filename for filename in (os.path.join(dirpath, name) for name in files) if self.match(filename))
+
+    def poll(self, timeout=0):
+        '''
+            Input:
+                * timeout: how long to wait for changes (seconds)
+            Output:
+                filenames: the files that are new or changed since the last call (all the files on the first call)
+        '''
+        changed = self._found
+        self._found = []
+        if changed:
+            timeout = 0
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed
+        data = os.read(self.fd, 1024*1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT_HEADER.size: offset + EVENT_HEADER.size + length].rstrip(b"\0"))
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: look at every file again (the files already processed are skipped by the caller)
+                changed.extend(scan_files(self.directory, self.match))
+                continue
+            folder = self.folders.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:
+                # The folder was removed
+                del self.folders[wd]
+                continue
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(path)
+            elif self.match(path):
+                changed.append(path)
+        changed.extend(self._found)
+        self._found = []
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_watcher(directory, backend="auto", interval=2.0, match=is_text_file):
+    '''
+        Input:
+            * directory: the folder to watch
+            * backend: "inotify", "polling", or "auto" (inotify if the system has it, polling otherwise)
+            * interval: seconds between two scans of the polling watcher
+        Output:
+            watcher: an InotifyWatcher or a PollingWatcher
+    '''
+    if backend not in BACKENDS:
+        raise ValueError("Unknown watch backend: {} (expected one of {})".format(backend, ", ".join(BACKENDS)))
+    if backend != "polling":
+        try:
+            return InotifyWatcher(directory, match)
+        except (OSError, AttributeError):
+            # (no inotify in the C library, or the limit of watches is reached)
+            if backend == "inotify":
+                raise
+    return PollingWatcher(directory, interval, match)
+
+
+class Debouncer:
+    '''
+        Input:
+            * delay: how long (seconds) a file must not have been written to before it is processed
+    '''
+
+    def __init__(self, delay=2.0):
+        self.delay = delay
+        # The signature of each file waiting, when it was last checked
+        self.pending = dict()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, filename):
+        '''
+            A file was created or written to: it waits until it is ready (see ready())
+        '''
+        self.pending[filename] = stat_signature(filename)
+
+    def ready(self):
+        '''
+            Output:
+                filenames: the files waiting whose size and mtime have not changed since they were last checked,
+                           and that have not been written to for the delay (they are no longer waiting)
+        '''
+        now = time.time_ns()
+        filenames = []
+        for filename, last in list(self.pending.items()):
+            signature = stat_signature(filename)
+            if signature is None:
+                # Removed (or renamed) before it was processed
+                del self.pending[filename]
+            elif signature == last and now - signature[1] >= self.delay*1e9:
+                del self.pending[filename]
+                filenames.append(filename)
+            else:
+                self.pending[filename] = signature
+        return filenames